@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Compare latency of Binding backends.
+
+    Bind and unbind directories on a private tmpfs with
+    both the mount(2) and the mount(8) backends. Must be
+    run as root. Results are printed as JSON lines.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from echroot.fs import mount
+from echroot.fs.bind import Binding
+
+def bench_backend(backend, workdir, count):
+    """ Bind and unbind @count directories via @backend. """
+    olddir = os.path.join(workdir, "old")
+    newdirs = [os.path.join(workdir, "new%d" % i) for i in range(count)]
+    for dirpath in [olddir] + newdirs:
+        os.path.isdir(dirpath) or os.makedirs(dirpath)
+
+    Binding.BACKEND = backend
+    bindings = [Binding(olddir, newdir, "ro") for newdir in newdirs]
+
+    start = time.time()
+    for binding in bindings:
+        binding.bind()
+    setup = time.time() - start
+
+    start = time.time()
+    for binding in reversed(bindings):
+        binding.unbind()
+    teardown = time.time() - start
+
+    return { "bench"    : "bind",
+             "backend"  : backend,
+             "count"    : count,
+             "setup"    : setup / count,
+             "teardown" : teardown / count, }
+
+def run(count=20):
+    """ Run the benchmark and return a list of records. """
+    workdir = tempfile.mkdtemp(prefix="echroot-bench-")
+    default = Binding.BACKEND
+    records = []
+
+    try:
+        mount.mount("tmpfs", workdir, "tmpfs")
+        try:
+            for backend in ("syscall", "runner"):
+                records.append(bench_backend(backend, workdir, count))
+        finally:
+            mount.umount(workdir, mount.MNT_DETACH)
+    finally:
+        Binding.BACKEND = default
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return records
+
+if __name__ == "__main__":
+    for record in run():
+        print json.dumps(record, sort_keys=True)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Measure the architecture census of a large rootfs.
+
+    Build a synthetic tree of fake arm executables, a few
+    aarch64 outliers, shared objects and plain files, then
+    time a census on one and many threads, and again from
+    its cache. Results are printed as JSON lines.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures
+from echroot import elf
+from echroot.census import Census
+
+def make_tree(rootdir, count, perdir=500):
+    """ Put @count files in @rootdir, @perdir per directory. """
+    arm = fixtures.elf_header(elf.EM_ARM)
+    a64 = fixtures.elf_header(elf.EM_AARCH64, elf.ELFCLASS64)
+
+    for ind in range(count):
+        dirpath = os.path.join(rootdir, "usr/lib/d%d" % (ind / perdir))
+        ind % perdir or os.makedirs(dirpath)
+
+        if ind % 4 == 3:
+            name, data, mode = "data%d.txt" % ind, "#" * 64, 0644
+        elif ind % 1000 == 1:
+            name, data, mode = "odd%d" % ind, a64, 0755
+        else:
+            name, data, mode = "lib%d.so.1" % ind, arm, 0644
+
+        filepath = os.path.join(dirpath, name)
+        with open(filepath, 'wb') as filefs:
+            filefs.write(data)
+        os.chmod(filepath, mode)
+
+def run(count=20000):
+    """ Run the benchmark and return a list of records. """
+    workdir = tempfile.mkdtemp(prefix="echroot-bench-")
+    cachedir = tempfile.mkdtemp(prefix="echroot-bench-")
+    make_tree(workdir, count)
+
+    records = []
+
+    try:
+        for jobs, cached in ((1, False), (None, False), (None, True), (None, True)):
+            census = Census(workdir, jobs, cached, cachedir).scan()
+            records.append({ "bench"    : "census",
+                             "jobs"     : jobs or "auto",
+                             "cache"    : cached and census.probed == 0,
+                             "files"    : census.scanned,
+                             "outliers" : len(census.outliers()),
+                             "seconds"  : census.elapsed, })
+        return records
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        shutil.rmtree(cachedir, ignore_errors=True)
+
+if __name__ == "__main__":
+    for record in run(*[int(arg) for arg in sys.argv[1:2]]):
+        print json.dumps(record, sort_keys=True)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Measure jobs of echrootd.
+
+    Start echrootd on a private socket and time `true` run
+    in a synthetic rootfs as its jobs, one at a time and
+    many at once, against Chroot setting the rootfs up for
+    every run. The daemon's own wait and run percentiles
+    are reported too. Must be run as root. Results are
+    printed as JSON lines.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, TOPDIR)
+
+import fixtures
+from echroot import client
+from echroot.chroot import Chroot
+
+ECHROOTD = os.path.join(TOPDIR, "bin", "echrootd")
+
+def submit(sockpath, rootdir, argv):
+    """ Run @argv as a job, with its output dropped. """
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        return client.submit(rootdir, argv, None, devnull, devnull, sockpath)
+    finally:
+        os.close(devnull)
+
+def start(sockpath, jobs):
+    """ Start echrootd on @sockpath running @jobs at once. """
+    env = dict(os.environ, PYTHONPATH=TOPDIR)
+    proc = subprocess.Popen([sys.executable, ECHROOTD, "--socket", sockpath,
+                             "--cpus", str(jobs), "--per-root", str(jobs)],
+                            env=env)
+
+    while not os.path.exists(sockpath):
+        if proc.poll() is not None:
+            raise RuntimeError("echrootd exited with %d." % proc.returncode)
+        time.sleep(0.01)
+
+    return proc
+
+def bench_cold(rootdir, repeat):
+    """ Time Chroot running `true` in @rootdir from scratch. """
+    start_time = time.time()
+    for _ in range(repeat):
+        Chroot(rootdir, "true", banner=False).chroot()
+
+    return { "bench"   : "daemon",
+             "path"    : "cold",
+             "seconds" : (time.time() - start_time) / repeat, }
+
+def bench_serial(sockpath, rootdir, repeat):
+    """ Time jobs running `true` in @rootdir one at a time. """
+    submit(sockpath, rootdir, ["true"])
+
+    start_time = time.time()
+    for _ in range(repeat):
+        submit(sockpath, rootdir, ["true"])
+
+    return { "bench"   : "daemon",
+             "path"    : "serial",
+             "seconds" : (time.time() - start_time) / repeat, }
+
+def bench_burst(sockpath, rootdir, jobs, repeat):
+    """ Time @repeat jobs submitted at once by @jobs clients. """
+    start_time = time.time()
+    pids = []
+
+    for index in range(jobs):
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                for _ in range(index, repeat, jobs):
+                    submit(sockpath, rootdir, ["true"])
+                status = 0
+            finally:
+                os._exit(status)
+        pids.append(pid)
+
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+    elapsed = time.time() - start_time
+    return { "bench"      : "daemon",
+             "path"       : "burst",
+             "clients"    : jobs,
+             "seconds"    : elapsed / repeat,
+             "throughput" : repeat / elapsed, }
+
+def run(repeat=50, jobs=4):
+    """ Run the benchmark and return a list of records. """
+    workdir = tempfile.mkdtemp(prefix="echroot-bench-")
+    hostdir = fixtures.make_rootfs(os.path.join(workdir, "host"))
+    sockpath = os.path.join(workdir, "echrootd.sock")
+
+    records = [bench_cold(hostdir, max(repeat / 5, 1))]
+    daemon = start(sockpath, jobs)
+
+    try:
+        records.append(bench_serial(sockpath, hostdir, repeat))
+        records.append(bench_burst(sockpath, hostdir, jobs, repeat))
+
+        stats = client.stats(sockpath)
+        for name in ("wait", "run"):
+            record = dict(stats[name], bench="daemon-stats", latency=name)
+            records.append(record)
+    finally:
+        daemon.terminate()
+        daemon.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return records
+
+if __name__ == "__main__":
+    for record in run(*[int(arg) for arg in sys.argv[1:3]]):
+        print json.dumps(record, sort_keys=True)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Measure latency of Dupping.
+
+    Dup and undup the default FILEDUPS of Chroot into a
+    synthetic rootfs by bind mounting and by copying. Must
+    be run as root. Results are printed as JSON lines.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures
+from echroot.chroot import Chroot
+from echroot.fs.dup import Dupping
+
+def bench_method(method, pairs, repeat):
+    """ Dup and undup @pairs via @method. """
+    setup = unset = 0.0
+
+    for _ in range(repeat):
+        duppings = [Dupping(src, dst, method=method) for src, dst in pairs]
+
+        start = time.time()
+        for dupping in duppings:
+            dupping.dup()
+        setup += time.time() - start
+
+        start = time.time()
+        for dupping in duppings:
+            dupping.undup()
+        unset += time.time() - start
+
+    return { "bench"  : "dup",
+             "method" : method,
+             "files"  : len(pairs),
+             "dup"    : setup / repeat,
+             "undup"  : unset / repeat, }
+
+def run(repeat=100):
+    """ Run the benchmark and return a list of records. """
+    workdir = tempfile.mkdtemp(prefix="echroot-bench-")
+    fixtures.make_rootfs(workdir, ())
+
+    pairs = [[part.strip() for part in filedup.split(':')]
+             for filedup in Chroot.FILEDUPS]
+    pairs = [(src, os.path.join(workdir, dst.lstrip('/')))
+             for src, dst in pairs if os.path.isfile(src)]
+
+    try:
+        return [bench_method(method, pairs, repeat) for method in ("bind", "copy")]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    for record in run():
+        print json.dumps(record, sort_keys=True)
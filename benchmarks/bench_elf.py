@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Measure ElfObject parsing throughput.
+
+    Parse fake foreign headers and real host binaries, from
+    files and from buffers, and report files per second.
+    Results are printed as JSON lines.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures
+from echroot import elf
+
+def throughput(func, args, repeat):
+    """ Return calls of @func per second over @args. """
+    start = time.time()
+    for _ in range(repeat):
+        for arg in args:
+            func(arg)
+
+    return len(args) * repeat / max(time.time() - start, 1e-9)
+
+def run(count=200, repeat=5):
+    """ Run the benchmark and return a list of records. """
+    workdir = tempfile.mkdtemp(prefix="echroot-bench-")
+    fixtures.make_foreign(workdir, count=count)
+
+    fakes = [os.path.join(workdir, "usr/bin", name)
+             for name in os.listdir(os.path.join(workdir, "usr/bin"))]
+    hosts = [path for path in (fixtures._which(name) for name in fixtures.BINARIES)
+             if path]
+    bufs = [open(path, 'rb').read(64) for path in fakes]
+
+    try:
+        return [{ "bench"  : "elf",
+                  "source" : "fake",
+                  "files"  : len(fakes),
+                  "rate"   : throughput(elf.ElfObject, fakes, repeat), },
+                { "bench"  : "elf",
+                  "source" : "host",
+                  "files"  : len(hosts),
+                  "rate"   : throughput(elf.ElfObject, hosts, repeat * 50), },
+                { "bench"  : "elf",
+                  "source" : "buffer",
+                  "files"  : len(bufs),
+                  "rate"   : throughput(lambda buf: elf.ElfObject(buf=buf),
+                                        bufs, repeat), }]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    for record in run():
+        print json.dumps(record, sort_keys=True)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Measure FileLock contention.
+
+    Fork workers which take turns holding the same lock
+    for a short while, with both PidFileLock and
+    FlockFileLock, and report the wall time and the rate
+    of acquisitions. Results are printed as JSON lines.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from echroot.utils.flock import PidFileLock, FlockFileLock
+
+LOCKS = ( ("pidfile", PidFileLock),
+          ("flock",   FlockFileLock), )
+
+def bench_lock(name, lockcls, lockdir, workers, rounds, hold):
+    """ Contend for @lockcls among @workers processes. """
+    start = time.time()
+    pids = []
+
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                for _ in range(rounds):
+                    with lockcls(lockdir):
+                        time.sleep(hold)
+            except:
+                status = 1
+            os._exit(status)
+        pids.append(pid)
+
+    failed = sum(os.waitpid(pid, 0)[1] != 0 for pid in pids)
+    elapsed = time.time() - start
+
+    return { "bench"   : "flock",
+             "lock"    : name,
+             "workers" : workers,
+             "seconds" : elapsed,
+             "rate"    : workers * rounds / elapsed,
+             "failed"  : failed, }
+
+def run(workers=4, rounds=2, hold=0.01):
+    """ Run the benchmark and return a list of records. """
+    workdir = tempfile.mkdtemp(prefix="echroot-bench-")
+
+    try:
+        return [bench_lock(name, lockcls, workdir, workers, rounds, hold)
+                for name, lockcls in LOCKS]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    for record in run():
+        print json.dumps(record, sort_keys=True)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Measure the whole Chroot lifecycle.
+
+    Run `true` in a synthetic host-arch rootfs through
+    Chroot.chroot and report the mean time of each phase
+    and of the whole run, plus arch detection of a fake
+    foreign rootfs with and without the cache. Must be run
+    as root. Results are printed as JSON lines.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures
+from echroot.chroot import Chroot, what_arch
+
+def quiet(func):
+    """ Call @func with stdout sent to /dev/null. """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+
+    try:
+        return func()
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+def bench_chroot(rootdir, backend, repeat):
+    """ Run `true` in @rootdir @repeat times via @backend. """
+    phases = {}
+
+    def hook(record):
+        if record["phase"] not in ("bind", "dup"):
+            phases[record["phase"]] = phases.get(record["phase"], 0.0) + \
+                                      record["elapsed"]
+
+    start = time.time()
+    for _ in range(repeat):
+        echroot = Chroot(rootdir, "true", backend=backend)
+        echroot.add_hook(hook)
+        quiet(echroot.chroot)
+
+    record = dict((phase, seconds / repeat) for phase, seconds in phases.items())
+    record.update({ "bench"   : "lifecycle",
+                    "backend" : backend,
+                    "total"   : (time.time() - start) / repeat, })
+
+    return record
+
+def bench_arch(rootdir, repeat):
+    """ Detect arch of @rootdir with and without the cache. """
+    records = []
+
+    for cache in (False, True):
+        start = time.time()
+        for _ in range(repeat):
+            arch = what_arch(rootdir, Chroot.FILECHKS, cache)
+
+        records.append({ "bench"   : "arch",
+                         "cache"   : cache,
+                         "arch"    : arch,
+                         "seconds" : (time.time() - start) / repeat, })
+
+    return records
+
+def run(repeat=10):
+    """ Run the benchmark and return a list of records. """
+    workdir = tempfile.mkdtemp(prefix="echroot-bench-")
+    hostdir = fixtures.make_rootfs(os.path.join(workdir, "host"))
+    armdir = fixtures.make_foreign(os.path.join(workdir, "arm"))
+
+    try:
+        records = [bench_chroot(hostdir, backend, repeat)
+                   for backend in Chroot.BACKENDS]
+        return records + bench_arch(armdir, repeat * 10)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    for record in run():
+        print json.dumps(record, sort_keys=True)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Compare process discovery of Chroot.
+
+    Spawn processes through a ProcessTracker and time
+    listing them by scanning /proc against listing them via
+    the tracker, then time killing them. Must be run as
+    root. Results are printed as JSON lines.
+"""
+
+import os
+import sys
+import json
+import time
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from echroot.chroot import Chroot
+from echroot.utils.proctrack import ProcessTracker
+
+def timeit(func, repeat):
+    """ Return the mean seconds of calling @func. """
+    start = time.time()
+    for _ in range(repeat):
+        func()
+
+    return (time.time() - start) / repeat
+
+def run(count=50, repeat=20):
+    """ Run the benchmark and return a list of records. """
+    tracker = ProcessTracker('/')
+    echroot = Chroot('/')
+
+    for _ in range(count):
+        proc = subprocess.Popen(["sleep", "60"], preexec_fn=tracker.attach)
+        tracker.track(proc.pid)
+
+    try:
+        records = [{ "bench"   : "procs",
+                     "method"  : "scan",
+                     "pids"    : len(os.listdir("/proc")),
+                     "list"    : timeit(lambda: echroot.processes, repeat), },
+                   { "bench"   : "procs",
+                     "method"  : "tracked",
+                     "pids"    : len(tracker.pids() or []),
+                     "list"    : timeit(tracker.pids, repeat), }]
+
+        start = time.time()
+        killed = tracker.kill()
+        records[1]["kill"] = time.time() - start
+        records[1]["killed"] = killed
+
+    finally:
+        tracker.kill()
+        tracker.close(empty=True)
+
+    return records
+
+if __name__ == "__main__":
+    for record in run():
+        print json.dumps(record, sort_keys=True)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Measure resolving binds and dups of profiles.
+
+    Compare parsing and canonicalizing DIRBINDS and FILEDUPS
+    on every run, as Chroot used to, against compiling a
+    profile's plan and reusing the cached plan. Results are
+    printed as JSON lines.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures
+from echroot import fs, profile
+from echroot.chroot import Chroot
+from echroot.fs.bind import Binding, BindingError
+from echroot.fs.dup import Dupping, DuppingError
+
+def split_strings(rootdir):
+    """ Make Bindings and Duppings from the colon strings. """
+    for dirbind in Chroot.DIRBINDS:
+        try:
+            splits = dirbind.split(':')
+            Binding(splits[0], fs.aux.cano_path(splits[1], rootdir), *splits[2:])
+        except BindingError:
+            continue
+
+    for filedup in Chroot.FILEDUPS:
+        try:
+            splits = filedup.split(':')
+            Dupping(splits[0], fs.aux.norm_path(splits[1], rootdir))
+        except DuppingError:
+            continue
+
+def timed(func, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        func()
+
+    return (time.time() - start) / repeat
+
+def run(repeat=200):
+    """ Run the benchmark and return a list of records. """
+    workdir = tempfile.mkdtemp(prefix="echroot-bench-")
+    fixtures.make_rootfs(workdir, ())
+
+    spec = profile.normalize({ "binds" : Chroot.DIRBINDS,
+                               "dups"  : Chroot.FILEDUPS, })
+
+    def planned(cache):
+        compiled = profile.plan(spec, workdir, cache)
+        list(compiled.bindings(workdir))
+        list(compiled.duppings(workdir))
+
+    try:
+        return [{ "bench"   : "profile",
+                  "resolve" : "strings",
+                  "seconds" : timed(lambda: split_strings(workdir), repeat), },
+                { "bench"   : "profile",
+                  "resolve" : "compile",
+                  "seconds" : timed(lambda: planned(False), repeat), },
+                { "bench"   : "profile",
+                  "resolve" : "cached",
+                  "seconds" : timed(lambda: planned(True), repeat), }]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    for record in run():
+        print json.dumps(record, sort_keys=True)
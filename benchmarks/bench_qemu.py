@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Compare qemu emulator install strategies.
+
+    Install and uninstall a fake qemu-ARCH-static binary in
+    a temporary rootfs with each strategy, and report time
+    and bytes written (wchar of /proc/self/io) per chroot
+    lifecycle. Must be run as root for the bind strategy.
+    Results are printed as JSON lines.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from echroot.interp import qemu
+
+QEMUBASE = "qemu-bench-static"
+
+def written():
+    """ Return bytes written by this process so far. """
+    with open("/proc/self/io") as iofs:
+        for line in iofs:
+            if line.startswith("wchar:"):
+                return int(line.split()[1])
+
+def bench_strategy(strategy, rootdir, repeat):
+    """ Install and uninstall via @strategy only. """
+    strategies = [item for item in qemu.STRATEGIES if item[0] == strategy]
+    start, wchar = time.time(), written()
+
+    for _ in range(repeat):
+        if not qemu.install_qemu_emulator(rootdir, QEMUBASE, strategies):
+            return { "bench" : "qemu", "strategy" : strategy, "error" : True }
+        qemu.uninstall_qemu_emulator(rootdir, QEMUBASE)
+
+    return { "bench"    : "qemu",
+             "strategy" : strategy,
+             "seconds"  : (time.time() - start) / repeat,
+             "bytes"    : (written() - wchar) / repeat, }
+
+def run(size=32 << 20, repeat=5):
+    """ Run the benchmark and return a list of records. """
+    workdir = tempfile.mkdtemp(prefix="echroot-bench-")
+    bindir = os.path.join(workdir, "bin")
+    rootdir = os.path.join(workdir, "rootfs")
+    os.makedirs(bindir)
+    os.makedirs(rootdir)
+
+    with open(os.path.join(bindir, QEMUBASE), 'wb') as qemufs:
+        qemufs.write(os.urandom(1 << 20) * (size >> 20))
+    os.chmod(os.path.join(bindir, QEMUBASE), 0755)
+
+    path = os.environ.get("PATH", "")
+    os.environ["PATH"] = bindir
+
+    try:
+        return [bench_strategy(strategy, rootdir, repeat)
+                for strategy, install in qemu.STRATEGIES]
+    finally:
+        os.environ["PATH"] = path
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    for record in run():
+        print json.dumps(record, sort_keys=True)
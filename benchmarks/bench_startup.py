@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Measure the startup of short-lived echroots.
+
+    Time fresh interpreters importing each entry module,
+    over a bare interpreter, and check them against BUDGETS.
+    Then time `true` run in a started session of a synthetic
+    rootfs, through its keeper and directly. Must be run as
+    root. Results are printed as JSON lines, and the exit
+    status is 1 if any import is over its budget.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, TOPDIR)
+
+import fixtures
+from echroot import client
+from echroot.session import Session
+
+ECHROOT = os.path.join(TOPDIR, "bin", "echroot")
+
+""" Seconds an import may take over a bare interpreter.
+"""
+BUDGETS = { "echroot.client"      : 0.004,
+            "echroot.utils.flock" : 0.004,
+            "echroot.fs"          : 0.002,
+            "echroot.chroot"      : 0.040,
+            "echroot.session"     : 0.040, }
+
+def spawn(argv, repeat):
+    """ Return the median seconds of running @argv @repeat times. """
+    env = dict(os.environ, PYTHONPATH=TOPDIR)
+    samples = []
+
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(repeat):
+            start = time.time()
+            subprocess.call(argv, env=env, stdout=devnull, stderr=devnull)
+            samples.append(time.time() - start)
+
+    return sorted(samples)[len(samples) / 2]
+
+def bench_imports(repeat):
+    """ Time importing every module of BUDGETS. """
+    bare = spawn([sys.executable, "-c", "pass"], repeat)
+    records = []
+
+    for module, budget in sorted(BUDGETS.items()):
+        seconds = spawn([sys.executable, "-c", "import %s" % module], repeat) - bare
+        records.append({ "bench"   : "import",
+                         "module"  : module,
+                         "budget"  : budget,
+                         "seconds" : max(seconds, 0.0), })
+
+    return records
+
+def bench_exec(rootdir, repeat):
+    """ Time `true` run in a session of @rootdir. """
+    argv = [sys.executable, ECHROOT, "--session", "exec", rootdir, "/bin/true"]
+    session = Session(rootdir)
+    session.start()
+
+    sockpath = client.sock_path(rootdir)
+    records = []
+
+    try:
+        for path in ("keeper", "direct"):
+            # hiding the socket sends bin/echroot the usual way
+            path == "direct" and os.rename(sockpath, sockpath + ".hidden")
+            records.append({ "bench"   : "session-exec",
+                             "path"    : path,
+                             "seconds" : spawn(argv, repeat), })
+    finally:
+        os.path.exists(sockpath + ".hidden") and \
+        os.rename(sockpath + ".hidden", sockpath)
+        session.stop()
+
+    return records
+
+def run(repeat=20):
+    """ Run the benchmark and return a list of records. """
+    workdir = tempfile.mkdtemp(prefix="echroot-bench-")
+    hostdir = fixtures.make_rootfs(os.path.join(workdir, "host"))
+
+    try:
+        return bench_imports(repeat) + bench_exec(hostdir, repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    over = False
+    for record in run(*[int(arg) for arg in sys.argv[1:2]]):
+        over = over or record.get("seconds") > record.get("budget", 1e9)
+        print json.dumps(record, sort_keys=True)
+
+    sys.exit(over and 1 or 0)
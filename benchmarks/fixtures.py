@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Synthetic rootfs trees for benchmarks.
+
+    Trees are built locally from host binaries, so that no
+    download is needed. Static binaries are copied as they
+    are; dynamic ones take the libraries listed by ldd(1)
+    with them. Foreign trees only hold fake ELF headers,
+    which is enough for arch detection but can't be run.
+"""
+
+import os
+import sys
+import struct
+import shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from echroot import elf
+from echroot.fs import aux
+from echroot.utils import runner
+
+BINARIES = ( "sh", "true", "echo", "sleep", )
+
+SKELETON = ( "bin", "sbin", "etc", "dev", "proc", "sys", "tmp", "parent",
+             "var/lib/dbus", "var/run/dbus", "var/lock", )
+
+def _which(name):
+    """ Return the path of host binary @name, or `None`. """
+    for dirpath in os.getenv("PATH", "/bin:/usr/bin").split(':'):
+        filepath = os.path.join(dirpath, name)
+        if os.path.isfile(filepath) and os.access(filepath, os.X_OK):
+            return os.path.realpath(filepath)
+    else:
+        return None
+
+def _libraries(filepath):
+    """ Return the shared libraries needed by @filepath. """
+    if not elf.ElfObject(filepath).interp:
+        return []
+
+    libs = []
+    for line in runner.call("ldd %s" % filepath)[1].splitlines():
+        for word in line.split():
+            if word.startswith('/') and os.path.isfile(word):
+                libs.append(word)
+
+    return libs
+
+def _install(srcpath, rootdir, dstpath=None):
+    """ Copy host file @srcpath into @rootdir. """
+    dstpath = aux.norm_path(dstpath or srcpath, rootdir)
+    aux.make_dirs(os.path.dirname(dstpath))
+    os.path.lexists(dstpath) or shutil.copy2(os.path.realpath(srcpath), dstpath)
+
+def make_rootfs(rootdir, binaries=BINARIES):
+    """ Build a runnable host-arch rootfs in @rootdir. """
+    for dirpath in SKELETON:
+        aux.make_dirs(os.path.join(rootdir, dirpath))
+
+    for name in binaries:
+        srcpath = _which(name)
+        if not srcpath:
+            continue
+        _install(srcpath, rootdir, os.path.join("/bin", name))
+        for lib in _libraries(srcpath):
+            _install(lib, rootdir)
+
+    os.path.lexists(os.path.join(rootdir, "sbin/init")) or \
+        os.symlink("/bin/sh", os.path.join(rootdir, "sbin/init"))
+
+    for name in ("resolv.conf", "mtab"):
+        open(os.path.join(rootdir, "etc", name), 'a').close()
+
+    return rootdir
+
+def elf_header(machine=elf.EM_ARM, elfclass=elf.ELFCLASS32, data=elf.ELFDATA2LSB):
+    """ Return a bare ELF executable header. """
+    order = data == elf.ELFDATA2LSB and '<' or '>'
+    ident = "\x7fELF" + elfclass + chr(data) + chr(1)
+
+    if elfclass == elf.ELFCLASS32:
+        return struct.pack(order + elf.ElfHeader32, ident, elf.ET_EXEC, machine,
+                           1, 0, 0, 0, 0, 52, 32, 0, 40, 0, 0)
+    else:
+        return struct.pack(order + elf.ElfHeader64, ident, elf.ET_EXEC, machine,
+                           1, 0, 0, 0, 0, 64, 56, 0, 64, 0, 0)
+
+def make_foreign(rootdir, machine=elf.EM_ARM, elfclass=elf.ELFCLASS32,
+                 data=elf.ELFDATA2LSB, count=1):
+    """ Build a rootfs of fake foreign ELF files in @rootdir.
+
+        /bin/sh and /sbin/init are fake executables of
+        @machine, and @count more are put in /usr/bin.
+    """
+    header = elf_header(machine, elfclass, data)
+
+    paths = ["bin/sh", "sbin/init"]
+    paths.extend("usr/bin/fake%d" % ind for ind in range(count))
+
+    for path in paths:
+        filepath = os.path.join(rootdir, path)
+        aux.make_dirs(os.path.dirname(filepath))
+        with open(filepath, 'wb') as elffs:
+            elffs.write(header)
+        os.chmod(filepath, 0755)
+
+    return rootdir
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Run echroot benchmarks and compare results.
+
+    Every bench_*.py module beside this file provides a
+    'run' function returning records. The records of all
+    selected benchmarks are written as one JSON document,
+    tagged with the git commit, so that results of two
+    commits can be compared later:
+
+        benchmarks/run.py -o before.json
+        (checkout another commit)
+        benchmarks/run.py -o after.json --compare before.json
+
+    Most benchmarks mount or chroot, so run as root.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import optparse
+import traceback
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, BENCHDIR)
+sys.path.insert(0, os.path.dirname(BENCHDIR))
+
+from echroot.utils import runner
+
+def benchmarks():
+    """ Return names of all benchmarks. """
+    return sorted(name[len("bench_"):-len(".py")] for name in os.listdir(BENCHDIR)
+                  if name.startswith("bench_") and name.endswith(".py"))
+
+def commit():
+    """ Return the git commit of the tree, or `None`. """
+    rc, out, err = runner.call("git -C %s rev-parse HEAD" % BENCHDIR)
+    return rc == 0 and out.strip() or None
+
+def collect(names):
+    """ Run benchmarks @names and return their results. """
+    results = { "commit"  : commit(),
+                "python"  : platform.python_version(),
+                "kernel"  : platform.release(),
+                "time"    : time.time(),
+                "records" : [], }
+
+    for name in names:
+        print >> sys.stderr, "running %s..." % name
+        try:
+            module = __import__("bench_%s" % name)
+            results["records"].extend(module.run())
+        except Exception:
+            traceback.print_exc()
+            results["records"].append({ "bench" : name, "error" : True })
+
+    return results
+
+def _numeric(value):
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+def _identity(record):
+    """ Return the fields telling what @record measured. """
+    return tuple(sorted((key, value) for key, value in record.items()
+                        if not _numeric(value)))
+
+def compare(base, head):
+    """ Return lines comparing numbers of @head to @base.
+
+        Records are matched by their non-numeric fields, and
+        each number is reported with its ratio head/base.
+    """
+    bases = dict((_identity(record), record) for record in base["records"])
+    lines = ["%s -> %s" % ((base["commit"] or "?")[:12], (head["commit"] or "?")[:12])]
+
+    for record in head["records"]:
+        ident = _identity(record)
+        label = ' '.join("%s=%s" % item for item in ident)
+        other = bases.get(ident)
+
+        for key in sorted(record):
+            if not _numeric(record[key]):
+                continue
+            if not other or not other.get(key):
+                lines.append("%s %s: %.6g (new)" % (label, key, record[key]))
+            else:
+                lines.append("%s %s: %.6g -> %.6g (x%.2f)" % (label, key,
+                             other[key], record[key], float(record[key]) / other[key]))
+
+    return lines
+
+def main(argv):
+    usage = "%prog [OPTION] [BENCHMARK]..."
+    parser = optparse.OptionParser(usage=usage, description=
+                                   "Benchmarks: %s" % ' '.join(benchmarks()))
+    parser.add_option("-o", "--output", dest="output", metavar="FILE",
+                      help="write results to FILE instead of stdout")
+    parser.add_option("--compare", dest="compare", metavar="FILE",
+                      help="compare results with earlier results in FILE")
+    opts, args = parser.parse_args(argv)
+
+    unknown = set(args) - set(benchmarks())
+    if unknown:
+        parser.error("unknown benchmark: %s" % ' '.join(sorted(unknown)))
+
+    results = collect(args or benchmarks())
+    document = json.dumps(results, indent=1, sort_keys=True)
+
+    if opts.output:
+        with open(opts.output, 'w') as outfs:
+            outfs.write(document + "\n")
+    else:
+        print document
+
+    if opts.compare:
+        with open(opts.compare) as basefs:
+            base = json.load(basefs)
+        for line in compare(base, results):
+            print >> sys.stderr, line
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
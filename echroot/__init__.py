@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import types
+
+class LazyPackage(types.ModuleType):
+    """ A package importing its submodules on first access.
+
+        Importing a package used to import all its submodules,
+        which every short-lived echroot paid for at startup.
+        Now 'fs.aux' imports echroot.fs.aux once it is used,
+        as 'import echroot.fs.aux' would.
+    """
+
+    def __init__(self, package):
+        types.ModuleType.__init__(self, package.__name__)
+        self.__dict__.update(package.__dict__)
+        # python 2 clears globals of a module once it's gone
+        self.__dict__["_package"] = package
+
+    def __getattr__(self, name):
+        if name not in self.__dict__.get("__all__", ()):
+            raise AttributeError("'%s' has no attribute '%s'" % (self.__name__, name))
+
+        __import__("%s.%s" % (self.__name__, name))
+        return self.__dict__[name]
+
+def lazy(name):
+    """ Turn the package @name into a LazyPackage. """
+    sys.modules[name] = LazyPackage(sys.modules[name])
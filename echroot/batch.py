@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import tempfile
+import multiprocessing
+
+from echroot import interp
+from echroot.chroot import Chroot, ChrootError, what_arch, host_arch
+
+class BatchError(Exception):
+    """ Base exception class for Batch class. """
+    pass
+
+def _capture(fileobj):
+    """ Read back a temporary file used as output stream. """
+    fileobj.seek(0)
+    return fileobj.read()
+
+def _worker(args):
+    """ Run one command in one rootdir, in a pool process.
+
+        Stdout and stderr of the command are collected into
+        temporary files, so that outputs of concurrent rootdirs
+        don't interleave. Its stdin is /dev/null, as concurrent
+        commands can't share the terminal. Timing records of
+        the rootdir are collected too.
+    """
+    rootdir, execute, binfmt, fixbin, options = args
+    records = []
+    outf = tempfile.TemporaryFile()
+    errf = tempfile.TemporaryFile()
+    nulf = open(os.devnull)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = (os.dup(0), os.dup(1), os.dup(2))
+    os.dup2(nulf.fileno(), 0)
+    os.dup2(outf.fileno(), 1)
+    os.dup2(errf.fileno(), 2)
+
+    try:
+        try:
+            echroot = Chroot(rootdir, execute, binfmt, fixbin,
+                             banner=False, **options)
+            echroot.add_hook(records.append)
+            status = echroot.chroot()
+        except ChrootError, err:
+            print >> sys.stderr, err
+            status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 0)
+        os.dup2(saved[1], 1)
+        os.dup2(saved[2], 2)
+        map(os.close, saved)
+        nulf.close()
+
+    return { "rootdir" : rootdir,
+             "status"  : status,
+             "stdout"  : _capture(outf),
+             "stderr"  : _capture(errf),
+             "timings" : records, }
+
+class Batch(object):
+    """ Run one command across many rootdirs concurrently.
+
+        Rootdirs are processed by a bounded pool of worker
+        processes. A reference to the binfmt_misc registration
+        of each foreign arch is held by the batch itself while
+        the workers run, instead of being set up per rootdir.
+    """
+
+    def __init__(self, rootdirs, execute=("/bin/sh",), jobs=None, fixbin=False,
+                 **options):
+        """ Prepare for a batch.
+
+            @jobs bounds the number of concurrent rootdirs and
+            defaults to the number of CPUs. @fixbin and @options,
+            e.g. backend, overlay or profile, are passed on to
+            each Chroot.
+        """
+        if not rootdirs:
+            raise BatchError("batch: no rootdir given.")
+
+        self._rootdirs = rootdirs
+        self._execute = execute
+        self._jobs = jobs or multiprocessing.cpu_count()
+        self._fixbin = fixbin
+        self._options = options
+        self._registered = []
+
+    def _register(self):
+        """ Register qemu emulators for all foreign arches. """
+        host = host_arch(Chroot.FILECHKS)
+        arches = set(what_arch(rootdir, Chroot.FILECHKS)
+                     for rootdir in self._rootdirs)
+
+        for arch in arches:
+            if not arch or arch == host:
+                continue
+
+            entry = interp.arches.lookup(arch)
+            if not entry:
+                continue
+
+            if self._fixbin:
+                qemupath = interp.qemu.pick_qemu_emulator(arch,
+                               self._options.get("qemu"), fixbin=True)
+                flags = "F"
+            else:
+                qemupath = os.path.join("/usr/bin/", entry.qemubase)
+                flags = ""
+
+            try:
+                if qemupath and \
+                   interp.qemu.acquire_qemu_emulator(qemupath, arch, flags):
+                    self._registered.append((qemupath, arch))
+            except interp.qemu.QemuError, err:
+                raise BatchError("batch: %s" % err)
+
+    def _unregister(self):
+        """ Unregister qemu emulators registered by '_register'. """
+        for qemupath, arch in self._registered:
+            interp.qemu.release_qemu_emulator(qemupath, arch)
+
+        self._registered = []
+
+    def run(self):
+        """ Run the batch.
+
+            Return a list of results ordered as the rootdirs.
+            Each result is a dict of 'rootdir', 'status', 'stdout',
+            'stderr' and 'timings', the records of its phases.
+        """
+        tasks = [(rootdir, self._execute, False, self._fixbin, self._options)
+                 for rootdir in self._rootdirs]
+        pool = multiprocessing.Pool(min(self._jobs, len(tasks)))
+
+        try:
+            self._register()
+            results = pool.map(_worker, tasks)
+            pool.close()
+
+        except:
+            pool.terminate()
+            raise
+
+        finally:
+            pool.join()
+            self._unregister()
+
+        return results
+
+
+def status(results):
+    """ Aggregate exit status of batch @results.
+
+        Return 0 if all succeeded, or the highest status. A
+        command killed by signal N counts as 128+N, as in the
+        shell.
+    """
+    return max([result["status"] < 0 and 128 - result["status"] or
+                result["status"] for result in results] or [0])
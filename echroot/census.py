@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import stat
+import time
+import hashlib
+import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+from echroot import elf
+from echroot.fs import aux
+from echroot.utils.cache import FileCache, CACHEDIR
+
+""" Bytes read of every candidate file, enough for the
+    ELF header of both classes.
+"""
+HEADSIZE = 64
+
+""" Bytes read of executables and shared objects, which
+    hold the program headers and the interpreter path in
+    practice.
+"""
+PAGESIZE = 4096
+
+""" Files handed to a thread of the pool at once.
+"""
+CHUNK = 256
+
+class CensusError(Exception):
+    """ Base exception class for Census class. """
+    pass
+
+def _candidate(name, st):
+    # executables and shared objects, which needn't be
+    # executable; anything smaller can't be an ELF
+    return stat.S_ISREG(st.st_mode) and st.st_size >= 52 and \
+           (st.st_mode & 0111 or ".so" in name)
+
+def walk(rootdir):
+    """ Yield (relpath, stat) of candidate files in @rootdir.
+
+        Directories on other filesystems, e.g. /proc or host
+        directories bound into rootdir, aren't descended.
+    """
+    rootdev = os.lstat(rootdir).st_dev
+    stack = ['']
+
+    while stack:
+        reldir = stack.pop()
+        try:
+            names = os.listdir(rootdir + reldir)
+        except OSError:
+            continue
+
+        for name in names:
+            relpath = reldir + '/' + name
+            try:
+                st = os.lstat(rootdir + relpath)
+            except OSError:
+                continue
+
+            if stat.S_ISDIR(st.st_mode):
+                st.st_dev == rootdev and stack.append(relpath)
+            elif _candidate(name, st):
+                yield relpath, st
+
+def probe(filepath):
+    """ Return [arch, abi, interp] of ELF @filepath.
+
+        Only the ELF header is read, and the first page of
+        executables and shared objects for the interpreter.
+        Return `None` if @filepath isn't an ELF, or an arch of
+        '!broken' if its header can't be parsed.
+    """
+    try:
+        fd = os.open(filepath, os.O_RDONLY | os.O_NOATIME)
+    except OSError:
+        try:
+            fd = os.open(filepath, os.O_RDONLY)
+        except OSError:
+            return None
+
+    try:
+        buf = os.read(fd, HEADSIZE)
+        if buf[:elf.SELFMAG] != elf.ELFMAG:
+            return None
+
+        try:
+            obj = elf.ElfObject(buf=buf)
+            if obj.type in (elf.ET_EXEC, elf.ET_DYN):
+                obj = elf.ElfObject(buf=buf + os.read(fd, PAGESIZE - HEADSIZE))
+        except elf.ElfObjectError:
+            return ["!broken", "", ""]
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+    abi = ' '.join([obj.elfclass or '?', obj.order or '?', obj.osabi or '?'])
+    return [obj.machine or "em%d" % obj.emachine, abi, obj.interp or ""]
+
+def _key(relpath):
+    # the cache is JSON, which can't hold undecodable names
+    try:
+        return relpath.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+def _probe_chunk(args):
+    rootdir, relpaths = args
+    return [(relpath, probe(rootdir + relpath)) for relpath in relpaths]
+
+class Census(object):
+    """ Architecture census of every binary in a rootdir.
+
+        The tree is walked once, and the headers of files
+        which changed since the last census are read by a
+        pool of threads. Results are cached per rootdir by
+        inode, size and mtime, so that repeated censuses only
+        read what changed.
+    """
+
+    def __init__(self, rootdir, jobs=None, cache=True, cachedir=CACHEDIR):
+        """ Prepare a census of @rootdir on @jobs threads.
+
+            If @cache is `True`, results are kept in @cachedir.
+        """
+        self._rootdir = os.path.realpath(rootdir)
+        self._jobs = jobs or multiprocessing.cpu_count() * 2
+        self._cache = cache and FileCache("census.%s.json" %
+                          hashlib.sha1(self._rootdir).hexdigest()[:16], cachedir)
+
+        self._files = {}
+        self._scanned = 0
+        self._probed = 0
+        self._elapsed = 0.0
+
+        if not os.path.isdir(self._rootdir):
+            raise CensusError("'%s' not a directory." % self._rootdir)
+
+    def scan(self):
+        """ Walk rootdir and classify its binaries.
+
+            Return the census itself.
+        """
+        start = time.time()
+        cached = self._cache and self._cache.get("files") or {}
+        files, stale = {}, []
+
+        for relpath, st in walk(self._rootdir):
+            ident = [st.st_ino, st.st_size, st.st_mtime]
+            entry = cached.get(_key(relpath))
+            if entry and entry[:3] == ident:
+                files[relpath] = entry
+            else:
+                files[relpath] = ident + [None]
+                stale.append(relpath)
+
+        chunks = [(self._rootdir, stale[ind : ind + CHUNK])
+                  for ind in range(0, len(stale), CHUNK)]
+        if len(chunks) > 1 and self._jobs > 1:
+            pool = ThreadPool(min(self._jobs, len(chunks)))
+            try:
+                results = pool.imap_unordered(_probe_chunk, chunks)
+                for result in results:
+                    for relpath, label in result:
+                        files[relpath][3] = label
+            finally:
+                pool.terminate()
+        else:
+            for chunk in chunks:
+                for relpath, label in _probe_chunk(chunk):
+                    files[relpath][3] = label
+
+        if self._cache and (stale or len(files) != len(cached)):
+            self._cache.set("files", dict((_key(relpath), entry)
+                                          for relpath, entry in files.items()
+                                          if _key(relpath) is not None))
+            self._cache.save()
+
+        self._files = files
+        self._scanned = len(files)
+        self._probed = len(stale)
+        self._elapsed = time.time() - start
+
+        return self
+
+    @property
+    def scanned(self):
+        """ Number of candidate files found. """
+        return self._scanned
+
+    @property
+    def probed(self):
+        """ Number of files read, i.e. not found in the cache. """
+        return self._probed
+
+    @property
+    def elapsed(self):
+        return self._elapsed
+
+    def elfs(self):
+        """ Return {relpath: [arch, abi, interp]} of ELF files. """
+        return dict((relpath, entry[3]) for relpath, entry in self._files.items()
+                    if entry[3])
+
+    def histogram(self, field):
+        """ Count ELF files by 'arch', 'abi' or 'interp'. """
+        index = ("arch", "abi", "interp").index(field)
+        return collections.Counter(label[index] for label in self.elfs().values())
+
+    @property
+    def arch(self):
+        """ Dominant arch of rootdir, or `None` without ELFs. """
+        arches = self.histogram("arch")
+        arches.pop("!broken", None)
+        common = arches.most_common(1)
+        return common and common[0][0] or None
+
+    def outliers(self):
+        """ Return sorted (relpath, reason) of suspect files.
+
+            A file is suspect if its arch isn't the dominant
+            one, if its header is broken, or if its interpreter
+            is missing in rootdir.
+        """
+        dominant = self.arch
+        present = {}
+        outliers = []
+
+        for relpath, (arch, abi, interp) in self.elfs().items():
+            if arch == "!broken":
+                outliers.append((relpath, "broken ELF header"))
+            elif arch != dominant:
+                outliers.append((relpath, "%s, not %s" % (arch, dominant)))
+            elif interp:
+                if interp not in present:
+                    present[interp] = os.path.exists(
+                                          aux.root_path(interp, self._rootdir))
+                present[interp] or \
+                    outliers.append((relpath, "interpreter %s missing" % interp))
+
+        return sorted(outliers)
+
+def census(rootdir, jobs=None, cache=True, cachedir=CACHEDIR):
+    """ Return the Census of @rootdir, once scanned. """
+    return Census(rootdir, jobs, cache, cachedir).scan()
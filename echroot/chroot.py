@@ -2,21 +2,92 @@
 # -*- coding: utf-8 -*-
 
 import os
-import glob
+import time
+import signal
 import subprocess
 
 from echroot import fs, elf, interp
-from echroot.fs.dup import Dupping, DuppingError
-from echroot.fs.bind import Binding, BindingError
+from echroot.fs.dup import DuppingError
+from echroot.fs.bind import Binding
+from echroot.fs.overlay import Overlay, OverlayError
+from echroot.process import Process
+from echroot.engine import Engine, EngineError
+from echroot.journal import Journal, JournalError, recover
+from echroot.profile import ProfileError, normalize, plan
+from echroot.profile import load as load_profile
+from echroot.utils.cache import FileCache, file_id, boot_id
 from echroot.utils.flock import FileLock, FileLockError
+from echroot.utils.proctrack import ProcessTracker, kill_all, forwarder
+from echroot.utils.timing import Timings
+from echroot.utils import namespace
+
+_archcache = FileCache("arch.json")
+
+def _probe_arch(rootdir, checks):
+    """ Detect arch of @rootdir by parsing ELF files.
+
+        Return (arch, probes), where probes records identities
+        of the files probed, to validate a cached arch later.
+    """
+    probes = []
 
-def what_arch(rootdir, checks):
     for chk in checks:
-        path = fs.aux.norm_path(chk, rootdir)
-        arch = elf.is_elfobj(path) and elf.ElfObject(path).machine
-        if arch: return arch
-    else: 
-        return None
+        link = fs.aux.norm_path(chk, rootdir)
+        path = fs.aux.root_path(chk, rootdir)
+        probes.append([link, file_id(link, False), path, file_id(path)])
+        try:
+            arch = elf.ElfObject(path).machine
+        except elf.ElfObjectError:
+            continue
+        if arch: return arch, probes
+    else:
+        return None, probes
+
+def what_arch(rootdir, checks, cache=True):
+    """ Return arch of @rootdir, or `None`.
+
+        The first ELF file of @checks in @rootdir determines the
+        arch. If @cache is `True`, the result is kept on disk
+        and reused until any of the probed files changes.
+    """
+    if not cache:
+        return _probe_arch(rootdir, checks)[0]
+
+    # rootdir's mtime changes with lock files and mountpoints
+    key = ':'.join([os.path.realpath(rootdir)] + list(checks))
+    root = (file_id(rootdir) or [None, None])[:2]
+    entry = _archcache.get(key)
+
+    if entry and entry["root"] == root and \
+       all(probe[1] == file_id(probe[0], False) and \
+           probe[3] == file_id(probe[2]) for probe in entry["probes"]):
+        return entry["arch"]
+
+    arch, probes = _probe_arch(rootdir, checks)
+    _archcache.set(key, { "root"   : root,
+                          "probes" : probes,
+                          "arch"   : arch, })
+    _archcache.save()
+
+    return arch
+
+def host_arch(checks):
+    """ Return arch of the host.
+
+        The host arch is probed once per boot.
+    """
+    entry = _archcache.get("host")
+    bootid = boot_id()
+
+    if entry and bootid and entry["boot"] == bootid:
+        return entry["arch"]
+
+    arch = what_arch('/', checks, False)
+    _archcache.set("host", { "boot" : bootid,
+                             "arch" : arch, })
+    _archcache.save()
+
+    return arch
 
 class ChrootError(Exception):
     pass
@@ -40,55 +111,251 @@ class Chroot(object):
     FILEDUPS = ( "/etc/resolv.conf:/etc/resolv.conf",
                  "/etc/mtab:/etc/mtab", )
 
-    def __init__(self, rootdir, execute="/bin/sh"):
+    BACKENDS = ( "host",
+                 "namespace", )
+
+    OVERLAYS = ( "discard",
+                 "commit",
+                 "keep", )
+
+    # signals sent to us are passed on to the command, while
+    # those of the terminal reach it by themselves
+    FORWARDS = ( signal.SIGTERM,
+                 signal.SIGHUP,
+                 signal.SIGUSR1,
+                 signal.SIGUSR2, )
+
+    IGNORES  = ( signal.SIGINT,
+                 signal.SIGQUIT, )
+
+    # threads setting up or tearing down rootdir at once
+    JOBS = 8
+
+    def __init__(self, rootdir, execute=("/bin/sh",), binfmt=True, fixbin=False,
+                 backend="host", pidns=False, overlay=None, upperdir=None,
+                 banner=True, filedups=None, profile=None, qemu=None,
+                 qemu_cpu=None, qemu_env=None):
+        # @execute is an argv exec'ed directly in rootdir, or
+        # a string run by rootdir's /bin/sh. @profile names a
+        # built-in or file of binds, dups, env and interp,
+        # DIRBINDS and FILEDUPS by default. @filedups lists
+        # "SRC[:DST]" host files to dup instead of its dups.
+        # @qemu, @qemu_cpu and @qemu_env pick and tune the
+        # emulator of a foreign rootdir over the profile's
+        try:
+            spec = profile and load_profile(profile) or \
+                   normalize({ "binds" : self.DIRBINDS,
+                               "dups"  : self.FILEDUPS, })
+            filedups is None or \
+                spec.update(dups=normalize({ "dups" : filedups })["dups"])
+        except ProfileError, err:
+            raise ChrootError("check: %s" % err)
+
         self._rootdir = rootdir
+        self._basedir = rootdir
         self._execute = execute
+        self._binfmt  = binfmt and spec["interp"].get("binfmt", True)
+        self._fixbin  = fixbin or spec["interp"].get("fixbin", False)
+        self._qemu    = qemu or spec["interp"].get("qemu")
+        self._qemuenv = self._make_qemuenv(spec["interp"], qemu_cpu, qemu_env)
+        self._backend = backend
+        self._pidns   = pidns
+        self._overlay = overlay
+        self._upperdir = upperdir
+        self._banner  = banner
+        self._spec    = spec
+        self._plan    = None
 
         self._bindings = []
         self._duppings = []
+        self._points   = []
         self._interpre = None
+        self._tracker  = None
+        self._spawned  = 0
+        self._overlaid = None
+        self._timings  = Timings()
+        self._flock    = None
+        self._journal  = None
+
+    @staticmethod
+    def _make_qemuenv(interp, cpu, env):
+        # qemu-user reads its tuning from QEMU_* variables of
+        # the environment, which are inherited through binfmt
+        qemuenv = dict(interp.get("env", {}))
+        qemuenv.update((str(name), str(value))
+                       for name, value in (env or {}).items())
+
+        cpu = cpu or interp.get("cpu")
+        cpu and qemuenv.update(QEMU_CPU=str(cpu))
+
+        return qemuenv
+
+    def _phase(self, name, func, *args):
+        # time a setup/teardown step for the hooks
+        with self._timings.phase(name, rootdir=self._basedir):
+            return func(*args)
+
+    def _record(self, action, *args):
+        # journal an action before doing it, so that it can be
+        # undone by 'echroot --recover' if we get killed
+        if not self._journal:
+            return
+        try:
+            self._journal.record(action, *args)
+        except JournalError, err:
+            raise ChrootError("setup: %s" % err)
 
-    def _setup_bindings(self, dirbinds=DIRBINDS):
-        for dirbind in dirbinds:
-            try:
-                splits = dirbind.split(':')
-                olddir = splits[0].strip()
-                newdir = fs.aux.cano_path(splits[1].strip(), self._rootdir)
-                binding = Binding(olddir, newdir, *splits[2:])
-            except BindingError:
-                continue
-
+    def _setup_overlay(self):
+        # the overlay's merged view becomes rootdir
+        try:
+            overlaid = Overlay(self._basedir, self._upperdir)
+            overlaid.mount()
+        except OverlayError, err:
+            raise ChrootError("setup: %s." % err)
+
+        self._overlaid = overlaid
+        self._rootdir = overlaid.merged
+        self._record("overlay", overlaid.merged)
+
+    def _make_plan(self):
+        # binds and dups are resolved once per rootdir, and
+        # only checked against it later
+        if not self._plan:
+            self._plan = plan(self._spec, self._basedir)
+
+        return self._plan
+
+    def _make_bindings(self, skips=()):
+        return self._make_plan().bindings(self._rootdir, skips)
+
+    def _bind(self, binding):
+        with self._timings.phase("bind", rootdir=self._basedir,
+                                 newdir=binding.newdir):
+            self._record("bind", binding.newdir)
             binding.bind()
-            binding.binded() and self._bindings.append(binding)
+        binding.binded() and self._bindings.append(binding)
 
-    def _setup_duppings(self, filedups=FILEDUPS):
-        for filedup in filedups:
+    def _unbind(self, binding):
+        binding.unbind()
+        binding in self._bindings and self._bindings.remove(binding)
+
+    def _make_point(self, pointpath, isdir=True):
+        # the child of the namespace backend mounts on points
+        # made here, so that they're journaled and removed
+        toppath = fs.aux.missing_top(pointpath)
+        if not toppath:
+            return
+        self._record("point", pointpath, toppath)
+        fs.aux.make_point(pointpath, isdir) and \
+        self._points.append((pointpath, toppath))
+
+    def _setup_bindings(self, skips=()):
+        for binding in self._make_bindings(skips):
+            self._bind(binding)
+
+    def _setup_namespace(self):
+        # runs in the child: bindings are made in a private
+        # mount namespace and vanish with its last process.
+        # Hooks and the journal belong to the parent, so don't
+        # call or write them here
+        self._timings = Timings()
+        self._journal = None
+        namespace.private_mounts()
+        skips = ()
+
+        if self._pidns:
+            namespace.private_pids()
+
+            procdir = fs.aux.cano_path("/proc/", self._rootdir)
+            fs.aux.make_dirs(procdir)
+            fs.mount.mount("proc", procdir, "proc", fs.mount.MS_NOSUID |
+                                                    fs.mount.MS_NODEV  |
+                                                    fs.mount.MS_NOEXEC)
+            skips = ("/proc",)
+
+        self._setup_bindings(skips)
+
+        # dups bound on the host would show up in its mounts,
+        # dups copied are left to the parent, which undoes them
+        for dupping in self._make_duppings():
+            if dupping.method == "bind":
+                try:
+                    dupping.dup(fallback=False)
+                except (OSError, DuppingError):
+                    pass
+
+    def _make_duppings(self):
+        return self._make_plan().duppings(self._rootdir)
+
+    def _dup(self, dupping):
+        with self._timings.phase("dup", rootdir=self._basedir,
+                                 dstfile=dupping.dstfile):
+            self._record("dup", dupping.dstfile, dupping.bakfile,
+                         int(os.path.lexists(dupping.dstfile)))
             try:
-                splits  = filedup.split(':')
-                srcfile = splits[0].strip()
-                dstfile = fs.aux.norm_path(splits[1].strip(), self._rootdir)
-                dupping = Dupping(srcfile, dstfile)
+                dupping.dup()
             except DuppingError:
-                continue
+                return
+        dupping.dupped() and self._duppings.append(dupping)
+
+    def _undup(self, dupping):
+        dupping.undup()
+        dupping in self._duppings and self._duppings.remove(dupping)
 
-            dupping.dup()
-            dupping.dupped() and self._duppings.append(dupping)
+    def _setup_duppings(self):
+        for dupping in self._make_duppings():
+            self._dup(dupping)
 
     def _setup_interpre(self):
         if not self.arch:
             raise ChrootError("setup: cann't resolve arch of '%s'." % self._rootdir)
 
-        if self.arch == what_arch('/', self.FILECHKS):
+        if self.arch == host_arch(self.FILECHKS):
             self._interpre = "native"
         else:
-            self._interpre = interp.qemu.setup(self._rootdir, self.arch)
+            entry = interp.arches.lookup(self.arch)
+            if not entry:
+                raise ChrootError("setup: no emulator known for %s." % self.arch)
+
+            self._fixbin or self._record("qemu", os.path.join(
+                                         interp.qemu.qemu_dir(self._rootdir),
+                                         entry.qemubase))
+            self._binfmt and self._record("binfmt", self.arch, os.getpid())
+            try:
+                self._interpre = interp.qemu.setup(self._rootdir, self.arch,
+                                                   self._binfmt, self._fixbin,
+                                                   self._qemu)
+            except interp.qemu.QemuError, err:
+                raise ChrootError("setup: %s" % err)
 
         if not self._interpre:
             raise ChrootError("setup: cann't setup %s interpreter." % self.arch)
 
+    def _unset_overlay(self):
+        if not self._overlaid:
+            return
+
+        self._overlaid.umount(commit = self._overlay == "commit",
+                              discard = self._overlay != "keep")
+        self._overlaid = None
+        self._rootdir = self._basedir
+
     def _unset_bindings(self):
-        for binding in reversed(self._bindings):
-            binding.unbind()
+        # nested bindings are unbound before those below them
+        engine = Engine(self._jobs())
+        for binding in self._bindings:
+            engine.add(binding.newdir, None, binding.unbind, done=True,
+                       after=self._parents(binding.newdir, engine))
+
+        try:
+            engine.undo()
+        finally:
+            self._bindings = []
+
+    def _unset_points(self):
+        for pointpath, toppath in reversed(self._points):
+            fs.aux.remove_point(pointpath, toppath)
+        self._points = []
 
     def _unset_duppings(self):
         for dupping in self._duppings:
@@ -102,14 +369,29 @@ class Chroot(object):
             return
 
         if self._interpre.startswith("qemu"):
-            interp.qemu.unset(self._rootdir, self._interpre)
+            interp.qemu.unset(self._rootdir, self._interpre,
+                              self._binfmt, self._fixbin, self.arch)
 
-    def _kill_processes(self):
-        for proc in self.processes:
-            try:
-                os.kill(proc, 9)
-            except:
-                pass
+        self._interpre = None
+
+    def _kill_processes(self, rounds=3):
+        # processes spawned by ourselves are killed in bulk,
+        # otherwise turn to scanning /proc for them. Those
+        # spawned by others are found in rootdir's cgroup
+        tracker = self._tracker or ProcessTracker(self._rootdir)
+        killed = tracker.tracking() and tracker.kill()
+        tracker.close(empty=True)
+        self._tracker = None
+
+        if killed:
+            return
+
+        for _ in range(rounds):
+            procs = self.processes
+            if not procs:
+                break
+            kill_all(procs)
+            time.sleep(0.01)
 
     def _check(self):
         # TODO: more checks are necessary
@@ -119,40 +401,309 @@ class Chroot(object):
         if not os.path.isdir(self._rootdir):
             raise ChrootError("check: '%s' not a directory." % self._rootdir)
 
+        if self._backend not in self.BACKENDS:
+            raise ChrootError("check: unknown backend '%s'." % self._backend)
+
+        if self._overlay and self._overlay not in self.OVERLAYS:
+            raise ChrootError("check: unknown overlay mode '%s'." % self._overlay)
+
+    def _jobs(self):
+        # threads only pay off if steps block on subprocesses,
+        # e.g. mount(8) or setting up a foreign interpreter
+        if Binding.BACKEND == "runner" or \
+           self.arch and self.arch != host_arch(self.FILECHKS):
+            return self.JOBS
+        else:
+            return 1
+
+    def _parents(self, path, engine):
+        # steps of bindings which @path lies on
+        return [newdir for newdir in engine.names if newdir.startswith('/') and \
+                path.startswith(newdir.rstrip('/') + '/')]
+
+    def _setup_engine(self):
+        # independent steps may run at once: only paths lying
+        # on a binding have to wait for it
+        engine = Engine(self._jobs())
+
+        if self._backend == "host":
+            for binding in self._make_bindings():
+                engine.add(binding.newdir,
+                           lambda binding=binding: self._bind(binding),
+                           lambda binding=binding: self._unbind(binding),
+                           after=self._parents(binding.newdir, engine))
+        else:
+            # the child binds, but points on another binding
+            # only show up once that one is bound there
+            for binding in self._make_bindings():
+                after = self._parents(binding.newdir, engine)
+                engine.add(binding.newdir,
+                           lambda newdir=binding.newdir, nested=bool(after):
+                               nested or self._make_point(newdir),
+                           after=after)
+
+        for dupping in self._make_duppings():
+            after = self._parents(dupping.dstfile, engine)
+            if self._backend == "namespace" and dupping.method == "bind":
+                engine.add(dupping.dstfile,
+                           lambda dstfile=dupping.dstfile, nested=bool(after):
+                               nested or self._make_point(dstfile, False),
+                           after=after)
+            else:
+                engine.add(dupping.dstfile,
+                           lambda dupping=dupping: self._dup(dupping),
+                           lambda dupping=dupping: self._undup(dupping),
+                           after=after)
+
+        qemudir = interp.qemu.qemu_dir(self._rootdir)
+        engine.add("interpre",
+                   lambda: self._phase("setup_interpre", self._setup_interpre),
+                   self._unset_interpre,
+                   after=self._parents(qemudir, engine))
+
+        return engine
+
     def _setup(self):
-        self._setup_bindings()
-        self._setup_duppings()
-        self._setup_interpre()
+        # whatever dead echroots left here is undone first
+        self._phase("recover", recover, self._basedir)
+        self._journal = Journal(self._basedir)
+        self._phase("plan", self._make_plan)
+
+        if self._overlay:
+            self._phase("setup_overlay", self._setup_overlay)
+
+        try:
+            self._phase("setup", self._setup_engine().run)
+        except EngineError, err:
+            if isinstance(err.error, ChrootError):
+                raise err.error
+            raise ChrootError("setup: %s." % err)
 
     def _unset(self):
-        self._kill_processes()
-        self._unset_interpre()
-        self._unset_duppings()
-        self._unset_bindings()
+        # the journal is only dropped after a clean teardown
+        journal, self._journal = self._journal, None
+        try:
+            self._phase("kill_processes", self._kill_processes)
+            self._phase("unset_interpre", self._unset_interpre)
+            self._phase("unset_duppings", self._unset_duppings)
+            self._phase("unset_bindings", self._unset_bindings)
+            self._phase("unset_points", self._unset_points)
+            self._phase("unset_overlay", self._unset_overlay)
+        except:
+            journal and journal.close(clean=False)
+            raise
+
+        journal and journal.close()
+
+    def _spawn(self, execute, cwd='/', **kwargs):
+        # start @execute in rootdir, passing @kwargs on to Popen
+        if not self._tracker:
+            self._tracker = ProcessTracker(self._rootdir)
+
+        # the child binds by the plan, so resolve it beforehand
+        if self._backend == "namespace":
+            self._make_plan()
 
-    def _chroot(self):
         def oschroot():
+            # python ignores SIGPIPE, which exec would keep
+            signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+            self._tracker.attach()
+            if self._backend == "namespace":
+                self._setup_namespace()
             os.chroot(self._rootdir)
-            os.chdir('/')
+            os.chdir(cwd)
+
+        if self._spec["env"] and kwargs.get("env") is None or self._qemuenv:
+            kwargs["env"] = self._environ(kwargs.get("env"))
+
+        shell = isinstance(execute, basestring)
+        proc = subprocess.Popen(execute, preexec_fn = oschroot, shell = shell,
+                                **kwargs)
+        self._tracker.track(proc.pid)
+
+        return proc
+
+    def _environ(self, env=None, base=None):
+        # the profile's env on top of @base, ours by default,
+        # None unsetting, unless @env is given. The qemu env
+        # goes on top of either, if rootdir is emulated
+        if env is None:
+            environ = dict(os.environ if base is None else base)
+            for name, value in self._spec["env"].items():
+                if value is None:
+                    environ.pop(name, None)
+                else:
+                    environ[name] = value
+        else:
+            environ = dict(env)
+
+        if self._qemuenv and self.arch != host_arch(self.FILECHKS):
+            environ.update(self._qemuenv)
 
+        return environ
+
+    def _chroot(self):
         try:
-            print 
-            print "--------------------------------------------------------"
-            print "           Welcome To Echroot - easy chroot             "
-            print "--------------------------------------------------------"
-            print 
+            if self._banner:
+                print 
+                print "--------------------------------------------------------"
+                print "           Welcome To Echroot - easy chroot             "
+                print "--------------------------------------------------------"
+                print 
 
-            subprocess.call(self._execute, preexec_fn = oschroot, shell=True)
+            with self._timings.phase("exec", rootdir=self._basedir):
+                return self._wait(self._spawn(self._execute))
 
         except Exception, e:
             raise ChrootError("chroot: %s." % e)
 
+    def _wait(self, proc):
+        # wait for the command while forwarding signals to it
+        handlers = {}
+        for signum in self.FORWARDS:
+            handlers[signum] = signal.signal(signum, forwarder(proc.pid))
+        for signum in self.IGNORES:
+            handlers[signum] = signal.signal(signum, signal.SIG_IGN)
+
+        try:
+            return proc.wait()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def setup(self):
+        """ Check and prepare the environment of rootdir.
+
+            The caller is responsible for holding the rootdir's
+            lock and for calling 'unset' later.
+        """
+        self._phase("check", self._check)
+        self._setup()
+
+    def unset(self):
+        """ Kill remaining processes and restore rootdir. """
+        self._unset()
+
+    def kill(self):
+        """ Kill all processes running in rootdir. """
+        self._kill_processes()
+
+    def execute(self):
+        """ Run the command in the prepared rootdir.
+
+            Return the exit status of the command. Processes
+            left behind are up to whoever unsets rootdir.
+        """
+        try:
+            return self._chroot()
+        finally:
+            self._untrack()
+
+    def _untrack(self):
+        # what's left in the cgroup lives on until rootdir is
+        # unset, the cgroup is removed once it's empty
+        self._tracker and self._tracker.close()
+        self._tracker = None
+
+    def _unspawn(self):
+        # the tracker goes with the last of the spawned commands
+        self._spawned -= 1
+        self._spawned or self._untrack()
+
+    def _process(self, argv, env, cwd, stdin, timeout, finish):
+        # start @argv with piped output, wrapped in a Process
+        devnull = stdin is None and open(os.devnull) or None
+        try:
+            proc = self._spawn(argv, cwd, env=env, stdin=devnull or stdin,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               close_fds=True)
+        except Exception, e:
+            raise ChrootError("run: %s." % e)
+        finally:
+            devnull and devnull.close()
+
+        return Process(proc, timeout, finish)
+
+    def run(self, argv, env=None, cwd='/', stdin=None, timeout=None):
+        """ Start @argv in rootdir and return a Process.
+
+            @argv is exec'ed directly if it's a list, or run by
+            /bin/sh if it's a string, in @cwd of rootdir with
+            environment @env. stdin is /dev/null unless @stdin
+            is given, e.g. as a file or subprocess.PIPE. stdout
+            and stderr are streamed through the Process, which
+            kills the command after @timeout seconds.
+
+            Outside of a with-statement, rootdir is set up here
+            and torn down when the Process is done.
+        """
+        owned = not self._flock
+        owned and self.__enter__()
+
+        try:
+            return self._process(argv, env, cwd, stdin, timeout,
+                                 owned and self._leave or None)
+        except ChrootError:
+            owned and self._leave()
+            raise
+
+    def spawn(self, argv, env=None, cwd='/', stdin=None, timeout=None):
+        """ Start @argv in the prepared rootdir and return a Process.
+
+            Like 'run', but rootdir is expected to be set up by
+            someone else, e.g. the keeper of a session, just as
+            for 'execute'. The profile's env goes on top of
+            @env, instead of replacing it, as @env usually is
+            the environment of whoever asked for @argv. Any
+            number of commands may be spawned at once.
+        """
+        if env is not None:
+            env = self._environ(base=env)
+
+        proc = self._process(argv, env, cwd, stdin, timeout, self._unspawn)
+        self._spawned += 1
+
+        return proc
+
+    def _lock(self):
+        # an overlay leaves rootdir untouched unless committed,
+        # so that many chroots may share it
+        shared = self._overlay in ("discard", "keep")
+        return FileLock(self._basedir, shared=shared)
+
+    def __enter__(self):
+        """ Lock and set up rootdir for any number of 'run's. """
+        flock = self._lock()
+        flock.acquire()
+
+        try:
+            self._phase("check", self._check)
+            self._setup()
+        except:
+            self._unset()
+            flock.release()
+            raise
+
+        self._flock = flock
+        return self
+
+    def __exit__(self, t, v, tb):
+        """ Kill what's left, restore and unlock rootdir. """
+        self._leave()
+
+    def _leave(self):
+        flock, self._flock = self._flock, None
+        try:
+            self._unset()
+        finally:
+            flock and flock.release()
+
     def chroot(self):
-        with FileLock(self._rootdir) as flock:
+        with self._lock() as flock:
             try:
-                self._check()
+                self._phase("check", self._check)
                 self._setup()
-                self._chroot()
+                return self._chroot()
 
             except ChrootError, err:
                 raise err
@@ -160,13 +711,34 @@ class Chroot(object):
             finally:
                 self._unset()
 
+    def add_hook(self, hook):
+        """ Call @hook(record) after each setup/teardown phase.
+
+            A record is a dict holding the 'phase' name, the
+            'rootdir', the 'elapsed' seconds, whether it was
+            'ok', and the subprocess 'spawns' and bytes 'copied'
+            during the phase. Bindings and duppings are made
+            within the 'setup' phase, and each is timed too:
+            'bind' records tell the 'newdir', and 'dup' records
+            the 'dstfile'.
+        """
+        self._timings.add_hook(hook)
+
+    def remove_hook(self, hook):
+        self._timings.remove_hook(hook)
+
     @property
     def arch(self):
         if not hasattr(self, "_arch"):
-            self._arch = what_arch(self._rootdir, self.FILECHKS)
+            self._arch = what_arch(self._basedir, self.FILECHKS)
 
         return self._arch
 
+    @property
+    def root(self):
+        """ Directory chrooted into, e.g. an overlay's merged view. """
+        return self._rootdir
+
     @property
     def bindings(self):
         return self._bindings
@@ -178,14 +750,16 @@ class Chroot(object):
     @property
     def processes(self):
         procs = []
+        rootdir = os.path.realpath(self._rootdir)
 
-        for root in glob.glob("/proc/[0-9]*/root"):
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
             try:
-                link = os.readlink(root)
-                proc = int(root.split('/')[2])
+                link = os.readlink("/proc/%s/root" % pid)
             except OSError:
                 continue
             else:
-                link == self._rootdir and procs.append(proc)
+                link == rootdir and procs.append(int(pid))
 
         return procs
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Run commands through the keeper of a started session,
+    or as jobs of echrootd.
+
+    Both listen on a Unix socket, and a command is exec'ed by
+    sending it the command and environment, then relaying
+    stdin, output and signals as frames until the exit status
+    comes back. So this module only imports what the
+    round-trip needs, and is imported by bin/echroot before
+    everything else.
+"""
+
+import os
+import sys
+import errno
+import struct
+import select
+import signal
+import hashlib
+
+# socket imports ssl, which costs more than the rest of us
+import _socket as socket
+
+""" Where keepers of sessions listen, only for root.
+"""
+SOCKDIR = "/var/run/echroot/sessions"
+
+""" Where echrootd listens by default.
+"""
+DAEMONSOCK = "/var/run/echroot/echrootd.sock"
+
+CHUNK = 64 << 10
+
+""" A frame is a kind and a length, followed by as many bytes.
+"""
+HEADER = struct.Struct("!cI")
+
+ROOTDIR = 'D'   # rootdir of a job, before the command
+ARGV    = 'A'   # NUL-separated argv, client to keeper
+SHELL   = 'C'   # command line for /bin/sh, instead of ARGV
+ENVIRON = 'V'   # NUL-separated NAME=VALUE, ends the request
+STDIN   = 'I'   # stdin data, empty at EOF
+SIGNAL  = 'K'   # signal number to send the command
+STDOUT  = 'O'
+STDERR  = 'E'
+EXITED  = 'X'   # exit status, -N if killed by signal N
+FAILED  = 'F'   # error message, the command didn't run
+STATS   = 'S'   # asks echrootd for its stats, answered as JSON
+
+FORWARDS = ( signal.SIGHUP,
+             signal.SIGINT,
+             signal.SIGQUIT,
+             signal.SIGTERM,
+             signal.SIGUSR1,
+             signal.SIGUSR2, )
+
+class ClientError(Exception):
+    """ Base exception class for the client. """
+    pass
+
+def sock_path(rootdir):
+    """ Return the socket the keeper of @rootdir listens on. """
+    digest = hashlib.sha1(os.path.realpath(rootdir)).hexdigest()
+    return os.path.join(SOCKDIR, "%s.sock" % digest[:16])
+
+def frame(kind, data=""):
+    """ Return a frame of @kind holding @data. """
+    return HEADER.pack(kind, len(data)) + data
+
+def frames(buf):
+    """ Split frames off @buf.
+
+        Return a list of complete (kind, data) frames and the
+        remainder of @buf.
+    """
+    result = []
+
+    while len(buf) >= HEADER.size:
+        kind, size = HEADER.unpack_from(buf)
+        end = HEADER.size + size
+        if len(buf) < end:
+            break
+        result.append((kind, buf[HEADER.size:end]))
+        buf = buf[end:]
+
+    return result, buf
+
+def request(argv, env, rootdir=None):
+    """ Return frames requesting to run @argv with @env.
+
+        @rootdir is given for jobs of echrootd only.
+    """
+    if isinstance(argv, basestring):
+        command = frame(SHELL, argv)
+    else:
+        command = frame(ARGV, '\0'.join(argv))
+
+    if rootdir is not None:
+        command = frame(ROOTDIR, os.path.realpath(rootdir)) + command
+
+    return command + frame(ENVIRON, '\0'.join("%s=%s" % item
+                                              for item in env.items()))
+
+def command(request):
+    """ Return the command of @request, a dict of its frames. """
+    if SHELL in request:
+        return request[SHELL]
+    else:
+        return request.get(ARGV, "").split('\0')
+
+def environ(data):
+    """ Return the environment sent as ENVIRON @data. """
+    return dict(assign.split('=', 1) for assign in data.split('\0')
+                if '=' in assign)
+
+def write_all(fd, data):
+    """ Write all of @data to @fd. """
+    while data:
+        data = data[os.write(fd, data):]
+
+def _connect(sockpath, what):
+    """ Connect to @sockpath, where @what listens. """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(sockpath)
+    except socket.error, err:
+        sock.close()
+        raise ClientError("%s: %s." % (what, err))
+
+    return sock
+
+def connect(rootdir):
+    """ Connect to the keeper of @rootdir.
+
+        Raise ClientError if no keeper listens.
+    """
+    return _connect(sock_path(rootdir), "session: no keeper of '%s'" % rootdir)
+
+def execute(rootdir, argv, stdin=0, stdout=1, stderr=2):
+    """ Run @argv in the session of @rootdir via its keeper.
+
+        @argv is a list or a string for /bin/sh, as in
+        Session.execute. @stdin is relayed until EOF unless
+        it's `None`, when the command reads nothing. Output
+        is written to @stdout and @stderr, and signals sent
+        to us are sent on to the command. Return its exit
+        status. Raise ClientError if no keeper listens or if
+        the keeper fails to run @argv.
+    """
+    sock = connect(rootdir)
+    return _relay(sock, request(argv, os.environ), stdin, stdout, stderr)
+
+def submit(rootdir, argv, stdin=0, stdout=1, stderr=2, sockpath=DAEMONSOCK):
+    """ Run @argv in @rootdir as a job of echrootd.
+
+        Like 'execute', but the job may wait in the queue of
+        echrootd, which listens on @sockpath, before it runs.
+    """
+    sock = _connect(sockpath, "echrootd")
+    return _relay(sock, request(argv, os.environ, rootdir),
+                  stdin, stdout, stderr)
+
+def stats(sockpath=DAEMONSOCK):
+    """ Return the stats of echrootd listening on @sockpath. """
+    import json
+
+    sock = _connect(sockpath, "echrootd")
+    try:
+        sock.sendall(frame(STATS))
+        buf = ""
+        while True:
+            data = sock.recv(CHUNK)
+            if not data:
+                raise ClientError("echrootd: hung up.")
+            done, buf = frames(buf + data)
+            if done:
+                return json.loads(done[0][1])
+    except socket.error, err:
+        raise ClientError("echrootd: %s." % err)
+    finally:
+        sock.close()
+
+def _relay(sock, outbuf, stdin, stdout, stderr):
+    """ Send request @outbuf over @sock, then relay until the
+        exit status comes.
+    """
+    pending = []
+    handlers = {}
+
+    def on_signal(signum, frame):
+        pending.append(signum)
+
+    for signum in FORWARDS:
+        handlers[signum] = signal.signal(signum, on_signal)
+
+    # we never block on the socket but drain it whenever it's
+    # readable, so that the keeper never blocks on us
+    inbuf = ""
+    outputs = { STDOUT : stdout,
+                STDERR : stderr, }
+
+    try:
+        sock.setblocking(False)
+        while True:
+            while pending:
+                outbuf = outbuf + frame(SIGNAL, str(pending.pop(0)))
+
+            rlist = [sock]
+            stdin is not None and not outbuf and rlist.append(stdin)
+            wlist = outbuf and [sock] or []
+
+            try:
+                ready, writable = select.select(rlist, wlist, [])[:2]
+            except select.error, err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            if writable:
+                outbuf = outbuf[sock.send(outbuf):]
+
+            if stdin in ready:
+                data = os.read(stdin, CHUNK)
+                outbuf = outbuf + frame(STDIN, data)
+                if not data:
+                    stdin = None
+
+            if sock in ready:
+                data = sock.recv(CHUNK)
+                if not data:
+                    raise ClientError("client: hung up before the exit status.")
+
+                done, inbuf = frames(inbuf + data)
+                for kind, data in done:
+                    if kind in outputs and outputs[kind] is not None:
+                        try:
+                            write_all(outputs[kind], data)
+                        except OSError, err:
+                            if err.errno != errno.EPIPE:
+                                raise
+                            outputs[kind] = None
+                    elif kind == EXITED:
+                        return int(data)
+                    elif kind == FAILED:
+                        raise ClientError(data)
+
+    except socket.error, err:
+        raise ClientError("client: %s." % err)
+
+    finally:
+        sock.close()
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+
+def forward(argv):
+    """ Serve 'echroot --session exec NEWROOT COMMAND...' and
+        'echroot --daemon NEWROOT COMMAND...'.
+
+        @argv are arguments of bin/echroot. Return the exit
+        status of COMMAND run via the keeper or echrootd, or
+        `None` if @argv asks for anything else, or if nobody
+        listens, which is left to bin/echroot. An interactive
+        shell of a session, without COMMAND, is left too, as
+        its stdin wouldn't be a tty, and so are closed std
+        fds.
+    """
+    action, shell = None, False
+
+    while argv and argv[0].startswith('-'):
+        if argv[0] == "--session" and len(argv) > 1:
+            action, argv = argv[1], argv[2:]
+        elif argv[0].startswith("--session="):
+            action, argv = argv[0].split('=', 1)[1], argv[1:]
+        elif argv[0] == "--daemon":
+            action, argv = "daemon", argv[1:]
+        elif argv[0] == "--shell":
+            shell, argv = True, argv[1:]
+        else:
+            return None
+
+    if action not in ("exec", "daemon") or len(argv) < 2 or \
+       os.path.isfile(argv[0]):
+        return None
+
+    # the socket mustn't take the place of a closed std fd
+    try:
+        for fd in (0, 1, 2):
+            os.fstat(fd)
+    except OSError:
+        return None
+
+    ndir, cmds = argv[0], argv[1:]
+    cmds = shell and ' '.join(cmds) or cmds
+    try:
+        if action == "exec":
+            sock = connect(ndir)
+            outbuf = request(cmds, os.environ)
+        else:
+            sock = _connect(DAEMONSOCK, "echrootd")
+            outbuf = request(cmds, os.environ, ndir)
+    except ClientError:
+        return None
+
+    sys.stdout.flush()
+    return _relay(sock, outbuf, 0, 1, 2)
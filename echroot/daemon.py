@@ -0,0 +1,519 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import json
+import errno
+import select
+import signal
+import socket
+import collections
+import subprocess
+import multiprocessing
+
+from echroot import client
+from echroot.chroot import Chroot, what_arch, host_arch
+from echroot.utils.flock import FileLock, FileLockError
+
+""" CPUs an emulated job is accounted for, as qemu translates
+    and runs guest code on the same CPU.
+"""
+QEMU_WEIGHT = 2.0
+
+""" Bytes of output buffered for a client before its command
+    is read no more.
+"""
+BACKLOG = 1 << 20
+
+class DaemonError(Exception):
+    """ Base exception class for Daemon class. """
+    pass
+
+class Environment(object):
+    """ A rootdir kept set up for the jobs of the daemon.
+
+        Like the keeper of a session, the environment holds
+        the rootdir's FileLock exclusively during setup and
+        teardown and shared in between, so that other echroots
+        wait for it rather than set rootdir up again.
+    """
+
+    def __init__(self, rootdir, weight, **options):
+        self.rootdir = rootdir
+        self.weight  = weight
+        self.running = 0
+        self.used    = time.time()
+
+        self._chroot = Chroot(rootdir, **options)
+        self._flock  = FileLock(rootdir)
+
+    def setup(self):
+        """ Set rootdir up. Raise DaemonError if it's busy. """
+        try:
+            self._flock.acquire(blocking=False)
+        except FileLockError:
+            raise DaemonError("daemon: '%s' is used by others." % self.rootdir)
+
+        try:
+            self._chroot.setup()
+        except:
+            self._chroot.unset()
+            self._flock.release()
+            raise
+
+        self._flock.acquire(shared=True)
+
+    def unset(self):
+        """ Kill the remaining processes and restore rootdir. """
+        self._chroot.kill()
+        self._flock.acquire(shared=False)
+        try:
+            self._chroot.unset()
+        finally:
+            self._flock.release()
+
+    def spawn(self, argv, env):
+        """ Start @argv in rootdir and return a Process. """
+        self.running += 1
+        self.used = time.time()
+        try:
+            return self._chroot.spawn(argv, env=env, stdin=subprocess.PIPE)
+        except:
+            self.running -= 1
+            raise
+
+    def done(self):
+        """ Account for the end of a job. """
+        self.running -= 1
+        self.used = time.time()
+
+class Job(object):
+    """ A command asked for by a client of the daemon.
+
+        The job buffers frames both ways, so that the daemon
+        never blocks on a client or on the command's stdin.
+    """
+
+    def __init__(self, conn):
+        self.conn    = conn
+        self.request = {}
+        self.rootdir = None
+        self.cost    = 0.0
+        self.proc    = None
+        self.pipe    = None   # the command's stdin
+        self.env     = None
+
+        self.queued  = None
+        self.started = None
+
+        self.inbuf   = ""     # frames from the client, split yet
+        self.outbuf  = ""     # frames to the client
+        self.stdin   = ""     # data to the command's stdin
+        self.eof     = False  # the client's stdin is done
+        self.outputs = {}     # fds of the command's output
+        self.closing = False  # drop once outbuf is flushed
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def fail(self, msg):
+        """ Tell the client that the job failed. """
+        self.outbuf = self.outbuf + client.frame(client.FAILED, msg)
+        self.closing = True
+
+class Daemon(object):
+    """ Run jobs of many clients in warm rootdirs.
+
+        Clients connect to a Unix socket and send jobs, which
+        are commands to run in rootdirs, as echroot.client
+        does. Jobs are queued and started in order as long as
+        the rootdir runs fewer than @perroot jobs and the CPUs
+        they are accounted for fit in @budget. Rootdirs are
+        kept set up between jobs, up to @maxenvs of them, and
+        the least recently used idle ones are torn down first.
+        An environment idle for @timeout seconds is torn down
+        too.
+
+        The daemon is a single process relaying all jobs from
+        one select loop; it only forks to exec commands, so
+        that every environment and lock has one owner.
+    """
+
+    POLL = 1.0
+
+    def __init__(self, sockpath=client.DAEMONSOCK, budget=None, perroot=2,
+                 qemu_weight=QEMU_WEIGHT, maxenvs=4, timeout=None, **options):
+        """ Prepare the daemon.
+
+            @budget is the number of CPUs by default. @options
+            are passed on to Chroot for every rootdir.
+        """
+        self._sockpath = sockpath
+        self._budget   = budget or multiprocessing.cpu_count()
+        self._perroot  = perroot
+        self._weight   = qemu_weight
+        self._maxenvs  = maxenvs
+        self._timeout  = timeout
+        self._options  = dict(options, banner=False)
+        self._stopped  = False
+
+        self._envs     = collections.OrderedDict()
+        self._queue    = collections.deque()
+        self._jobs     = []
+        self._listener = None
+
+        self._waits    = collections.deque(maxlen=1024)
+        self._runs     = collections.deque(maxlen=1024)
+        self._counts   = collections.Counter()
+
+    def _on_signal(self, signum, frame):
+        """ Ask the daemon loop to stop. """
+        self._stopped = True
+
+    def _listen(self):
+        """ Listen on the daemon's socket, for root only. """
+        sockdir = os.path.dirname(self._sockpath)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            os.path.isdir(sockdir) or os.makedirs(sockdir, 0755)
+            os.path.lexists(self._sockpath) and os.unlink(self._sockpath)
+            listener.bind(self._sockpath)
+            os.chmod(self._sockpath, 0600)
+            listener.listen(128)
+        except (OSError, socket.error), err:
+            listener.close()
+            raise DaemonError("daemon: cann't listen on '%s': %s." % (self._sockpath, err))
+
+        listener.setblocking(False)
+        return listener
+
+    def _cost(self, rootdir):
+        """ Return the CPUs a job in @rootdir is accounted for. """
+        env = self._envs.get(rootdir)
+        if env:
+            return env.weight
+
+        arch = what_arch(rootdir, Chroot.FILECHKS)
+        if arch and arch != host_arch(Chroot.FILECHKS):
+            return min(self._weight, self._budget)
+        else:
+            return 1.0
+
+    def _warm(self, rootdir, cost):
+        """ Return the environment of @rootdir, set up if needed.
+
+            Return `None` if it can't be set up for now, since
+            all environments are busy.
+        """
+        env = self._envs.pop(rootdir, None)
+        if env:
+            self._envs[rootdir] = env
+            self._counts["hits"] += 1
+            return env
+
+        if len(self._envs) >= self._maxenvs and not self._evict(1):
+            return None
+
+        env = Environment(rootdir, cost, **self._options)
+        env.setup()
+        self._envs[rootdir] = env
+        self._counts["setups"] += 1
+
+        return env
+
+    def _evict(self, count=0):
+        """ Tear idle environments down.
+
+            Those idle for longer than the timeout go, and the
+            least recently used ones until @count are gone.
+            Return `True` if @count are gone.
+        """
+        now = time.time()
+        idles = [env for env in self._envs.values() if not env.running]
+
+        for env in idles:
+            if count > 0 or \
+               self._timeout and now - env.used >= self._timeout:
+                del self._envs[env.rootdir]
+                count = count - 1
+                self._counts["evictions"] += 1
+                try:
+                    env.unset()
+                except Exception:
+                    self._counts["errors"] += 1
+
+        return count <= 0
+
+    def _used(self):
+        return sum(job.cost for job in self._jobs if job.proc)
+
+    def _schedule(self):
+        """ Start queued jobs in order, as far as limits allow.
+
+            A job whose rootdir runs enough jobs is passed by,
+            while one which doesn't fit the budget stops the
+            scan, so that heavy jobs aren't starved by light
+            ones. Nothing running, any job fits.
+        """
+        used = self._used()
+
+        for job in list(self._queue):
+            env = self._envs.get(job.rootdir)
+            if env and env.running >= self._perroot:
+                continue
+
+            if used and used + job.cost > self._budget:
+                break
+
+            try:
+                env = self._warm(job.rootdir, job.cost)
+                if not env:
+                    continue
+                job.started = time.time()
+                job.proc = env.spawn(client.command(job.request),
+                                     client.environ(job.request[client.ENVIRON]))
+            except Exception, err:
+                self._queue.remove(job)
+                self._counts["failed"] += 1
+                job.fail(str(err))
+                continue
+
+            self._queue.remove(job)
+            job.env, job.pipe = env, job.proc.stdin
+            job.outputs = { job.proc.fileno("stdout") : client.STDOUT,
+                            job.proc.fileno("stderr") : client.STDERR, }
+            self._waits.append(job.started - job.queued)
+            used = used + job.cost
+
+    def _accept(self):
+        """ Take a new client. """
+        try:
+            conn = self._listener.accept()[0]
+        except socket.error:
+            return
+
+        conn.setblocking(False)
+        self._jobs.append(Job(conn))
+
+    def _submit(self, job):
+        """ Queue @job, whose request is complete. """
+        if client.ROOTDIR not in job.request:
+            job.fail("daemon: no rootdir.")
+            return
+
+        job.rootdir = job.request[client.ROOTDIR]
+        if not os.path.isdir(job.rootdir):
+            job.fail("daemon: no rootdir '%s'." % job.rootdir)
+            return
+
+        try:
+            job.cost = self._cost(job.rootdir)
+        except Exception, err:
+            job.fail("daemon: %s." % err)
+            return
+
+        self._counts["submitted"] += 1
+        job.queued = time.time()
+        self._queue.append(job)
+
+    def _receive(self, job):
+        """ Read frames from the client of @job. """
+        try:
+            data = job.conn.recv(client.CHUNK)
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EINTR):
+                return
+            data = ""
+
+        if not data:
+            # the client is gone, and so is its command
+            self._drop(job)
+            return
+
+        done, job.inbuf = client.frames(job.inbuf + data)
+        for kind, data in done:
+            if kind == client.STATS:
+                job.outbuf = job.outbuf + client.frame(client.STATS,
+                                                       json.dumps(self.stats()))
+                job.closing = True
+            elif client.ENVIRON not in job.request:
+                job.request[kind] = data
+                kind == client.ENVIRON and self._submit(job)
+            elif kind == client.STDIN:
+                job.stdin, job.eof = job.stdin + data, not data
+            elif kind == client.SIGNAL and job.proc:
+                job.proc.kill(int(data))
+            elif kind == client.SIGNAL and job in self._queue:
+                # nothing ran, but the client is told as if
+                self._queue.remove(job)
+                self._counts["cancelled"] += 1
+                job.outbuf = job.outbuf + client.frame(client.EXITED,
+                                                       str(-int(data)))
+                job.closing = True
+
+    def _send(self, job):
+        """ Write buffered frames to the client of @job. """
+        try:
+            size = job.conn.send(job.outbuf)
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EINTR):
+                return
+            self._drop(job)
+            return
+
+        job.outbuf = job.outbuf[size:]
+        if not job.outbuf and job.closing:
+            self._drop(job)
+
+    def _feed(self, job):
+        """ Write buffered stdin to the command of @job. """
+        try:
+            size = os.write(job.pipe.fileno(), job.stdin[:select.PIPE_BUF])
+            job.stdin = job.stdin[size:]
+        except OSError, err:
+            if err.errno != errno.EPIPE:
+                raise
+            job.stdin, job.eof = "", True
+
+    def _output(self, job, fd):
+        """ Read output of the command of @job from @fd. """
+        data = os.read(fd, client.CHUNK)
+        if data:
+            job.outbuf = job.outbuf + client.frame(job.outputs[fd], data)
+        else:
+            del job.outputs[fd]
+
+    def _reap(self, job):
+        """ Finish @job once its command is done. """
+        status = job.proc.poll()
+        if status is None:
+            return False
+
+        self._runs.append(time.time() - job.started)
+        self._counts["done"] += 1
+        job.env.done()
+        job.outbuf = job.outbuf + client.frame(client.EXITED, str(status))
+        job.proc, job.pipe, job.closing = None, None, True
+
+        return True
+
+    def _drop(self, job):
+        """ Forget @job, killing its command if it's running. """
+        if job.proc:
+            job.proc.close()
+            job.env.done()
+            self._counts["dropped"] += 1
+            job.proc, job.pipe = None, None
+
+        job in self._queue and self._queue.remove(job)
+        job in self._jobs and self._jobs.remove(job)
+        job.conn.close()
+
+    def _step(self):
+        """ Wait for and handle events once. """
+        rlist, wlist, timeout = [self._listener], [], self.POLL
+
+        for job in self._jobs:
+            if job.proc:
+                if job.pipe and job.stdin:
+                    wlist.append(job.pipe)
+                elif job.pipe and job.eof:
+                    job.pipe.close()
+                    job.pipe = None
+                if len(job.outbuf) < BACKLOG:
+                    rlist.extend(job.outputs)
+                if not job.outputs:
+                    # output is done, poll for the exit
+                    timeout = 0.01
+            if not job.closing and len(job.stdin) < client.CHUNK:
+                rlist.append(job)
+            if job.outbuf:
+                wlist.append(job)
+
+        try:
+            ready, writable = select.select(rlist, wlist, [], timeout)[:2]
+        except select.error, err:
+            if err.args[0] == errno.EINTR:
+                return
+            raise
+
+        owners = {}
+        for job in self._jobs:
+            for fd in job.outputs:
+                owners[fd] = job
+            job.pipe and owners.setdefault(job.pipe, job)
+
+        for obj in writable:
+            if isinstance(obj, Job):
+                obj in self._jobs and self._send(obj)
+            elif obj in owners and owners[obj].proc:
+                self._feed(owners[obj])
+
+        for obj in ready:
+            if obj is self._listener:
+                self._accept()
+            elif isinstance(obj, Job):
+                obj in self._jobs and self._receive(obj)
+            elif obj in owners and owners[obj].proc:
+                self._output(owners[obj], obj)
+
+        for job in list(self._jobs):
+            job.proc and not job.outputs and self._reap(job)
+
+    def serve(self):
+        """ Serve clients until SIGTERM, SIGINT or SIGHUP.
+
+            Running jobs are killed and every environment is
+            torn down on the way out.
+        """
+        self._listener = self._listen()
+        handlers = {}
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            handlers[signum] = signal.signal(signum, self._on_signal)
+
+        try:
+            while not self._stopped:
+                self._step()
+                self._schedule()
+                self._evict()
+
+        finally:
+            self._listener.close()
+            os.path.lexists(self._sockpath) and os.unlink(self._sockpath)
+
+            for job in list(self._jobs):
+                self._drop(job)
+            self._evict(len(self._envs))
+
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def stats(self):
+        """ Return a dict of the daemon's state and counters.
+
+            'wait' and 'run' tell percentiles of the seconds the
+            latest jobs waited in the queue and ran.
+        """
+        def percentiles(samples):
+            samples = sorted(samples)
+            if not samples:
+                return {}
+            return { "p50" : samples[len(samples) / 2],
+                     "p95" : samples[min(len(samples) - 1, len(samples) * 95 / 100)],
+                     "max" : samples[-1], }
+
+        now = time.time()
+        return { "queued"  : len(self._queue),
+                 "running" : len([job for job in self._jobs if job.proc]),
+                 "budget"  : self._budget,
+                 "used"    : self._used(),
+                 "envs"    : [{ "rootdir" : env.rootdir,
+                                "running" : env.running,
+                                "weight"  : env.weight,
+                                "idle"    : not env.running and now - env.used or 0, }
+                              for env in self._envs.values()],
+                 "counts"  : dict(self._counts),
+                 "wait"    : percentiles(self._waits),
+                 "run"     : percentiles(self._runs), }
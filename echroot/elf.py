@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os
+import mmap
 import struct
 
 """ The ELF file header. 
@@ -47,6 +48,35 @@ import struct
 ElfHeader32 = "16sHHIIIIIHHHHHH"
 ElfHeader64 = "16sHHIQQQIHHHHHH"
 
+""" The ELF program header.
+
+    typedef struct {
+        uint32_t      p_type;
+        uint32_t      p_offset;
+        uint32_t      p_vaddr;
+        uint32_t      p_paddr;
+        uint32_t      p_filesz;
+        uint32_t      p_memsz;
+        uint32_t      p_flags;
+        uint32_t      p_align;
+    } ElfPhdr32;
+
+    typedef struct {
+        uint32_t      p_type;
+        uint32_t      p_flags;
+        uint64_t      p_offset;
+        uint64_t      p_vaddr;
+        uint64_t      p_paddr;
+        uint64_t      p_filesz;
+        uint64_t      p_memsz;
+        uint64_t      p_align;
+    } ElfPhdr64;
+
+"""
+
+ElfPhdr32 = "IIIIIIII"
+ElfPhdr64 = "IIQQQQQQ"
+
 """ Fields in the e_ident array.  
 
     The EI_* entries are indices into the array. 
@@ -69,6 +99,8 @@ ELFMAG3      = 'F'
 ELFMAG       = '\x7fELF'
 SELFMAG      = 4
 
+EI_NIDENT    = 16
+
 EI_CLASS     = 4
 ELFCLASSNONE = '\x00'
 ELFCLASS32   = '\x01'
@@ -80,13 +112,142 @@ ELFDATA2LSB  = 1
 ELFDATA2MSB  = 2
 ELFDATANUM   = 3
 
+EI_VERSION   = 6
+
+EI_OSABI     = 7
+ELFOSABI_SYSV       = 0
+ELFOSABI_HPUX       = 1
+ELFOSABI_NETBSD     = 2
+ELFOSABI_LINUX      = 3
+ELFOSABI_SOLARIS    = 6
+ELFOSABI_AIX        = 7
+ELFOSABI_IRIX       = 8
+ELFOSABI_FREEBSD    = 9
+ELFOSABI_TRU64      = 10
+ELFOSABI_MODESTO    = 11
+ELFOSABI_OPENBSD    = 12
+ELFOSABI_ARM_AEABI  = 64
+ELFOSABI_ARM        = 97
+ELFOSABI_STANDALONE = 255
+
+EI_ABIVERSION = 8
+
+""" Legal values for e_type (object file type).
+"""
+ET_NONE      = 0
+ET_REL       = 1
+ET_EXEC      = 2
+ET_DYN       = 3
+ET_CORE      = 4
+
+""" Legal values for p_type (segment type).
+"""
+PT_NULL      = 0
+PT_LOAD      = 1
+PT_DYNAMIC   = 2
+PT_INTERP    = 3
+
 """ Some legal values for e_machine (architecture). 
 """
-EM_NOME      = 0
-EM_386       = 3
-EM_X86_64    = 62
-EM_ARM       = 40
-EM_AARCH64   = 183
+EM_NOME        = 0
+EM_SPARC       = 2
+EM_386         = 3
+EM_68K         = 4
+EM_486         = 6
+EM_MIPS        = 8
+EM_PARISC      = 15
+EM_SPARC32PLUS = 18
+EM_PPC         = 20
+EM_PPC64       = 21
+EM_S390        = 22
+EM_ARM         = 40
+EM_SH          = 42
+EM_SPARCV9     = 43
+EM_IA_64       = 50
+EM_X86_64      = 62
+EM_CRIS        = 76
+EM_OPENRISC    = 92
+EM_XTENSA      = 94
+EM_HEXAGON     = 164
+EM_AARCH64     = 183
+EM_MICROBLAZE  = 189
+EM_RISCV       = 243
+EM_LOONGARCH   = 258
+EM_ALPHA       = 0x9026
+
+""" Arch names of e_machine, as used by qemu-ARCH-static.
+
+    Keys are (e_machine, ELF class, ELF data order). Entries
+    whose class or order is `None` match any of them. More
+    specific entries take precedence.
+"""
+MACHINES = { (EM_SPARC,       None,       None)        : 'sparc',
+             (EM_386,         None,       None)        : 'i386',
+             (EM_68K,         None,       None)        : 'm68k',
+             (EM_486,         None,       None)        : 'i486',
+             (EM_MIPS,        ELFCLASS32, ELFDATA2MSB) : 'mips',
+             (EM_MIPS,        ELFCLASS32, ELFDATA2LSB) : 'mipsel',
+             (EM_MIPS,        ELFCLASS64, ELFDATA2MSB) : 'mips64',
+             (EM_MIPS,        ELFCLASS64, ELFDATA2LSB) : 'mips64el',
+             (EM_PARISC,      None,       None)        : 'hppa',
+             (EM_SPARC32PLUS, None,       None)        : 'sparc32plus',
+             (EM_PPC,         None,       None)        : 'ppc',
+             (EM_PPC64,       None,       ELFDATA2MSB) : 'ppc64',
+             (EM_PPC64,       None,       ELFDATA2LSB) : 'ppc64le',
+             (EM_S390,        ELFCLASS32, None)        : 's390',
+             (EM_S390,        ELFCLASS64, None)        : 's390x',
+             (EM_ARM,         None,       ELFDATA2LSB) : 'arm',
+             (EM_ARM,         None,       ELFDATA2MSB) : 'armeb',
+             (EM_SH,          None,       ELFDATA2LSB) : 'sh4',
+             (EM_SH,          None,       ELFDATA2MSB) : 'sh4eb',
+             (EM_SPARCV9,     None,       None)        : 'sparc64',
+             (EM_IA_64,       None,       None)        : 'ia64',
+             (EM_X86_64,      ELFCLASS64, None)        : 'x86_64',
+             (EM_X86_64,      ELFCLASS32, None)        : 'x32',
+             (EM_CRIS,        None,       None)        : 'cris',
+             (EM_OPENRISC,    None,       None)        : 'or1k',
+             (EM_XTENSA,      None,       ELFDATA2LSB) : 'xtensa',
+             (EM_XTENSA,      None,       ELFDATA2MSB) : 'xtensaeb',
+             (EM_HEXAGON,     None,       None)        : 'hexagon',
+             (EM_AARCH64,     None,       ELFDATA2LSB) : 'aarch64',
+             (EM_AARCH64,     None,       ELFDATA2MSB) : 'aarch64_be',
+             (EM_MICROBLAZE,  None,       ELFDATA2MSB) : 'microblaze',
+             (EM_MICROBLAZE,  None,       ELFDATA2LSB) : 'microblazeel',
+             (EM_RISCV,       ELFCLASS32, None)        : 'riscv32',
+             (EM_RISCV,       ELFCLASS64, None)        : 'riscv64',
+             (EM_LOONGARCH,   None,       None)        : 'loongarch64',
+             (EM_ALPHA,       None,       None)        : 'alpha', }
+
+OSABIS = { ELFOSABI_SYSV       : 'SYSV',
+           ELFOSABI_HPUX       : 'HPUX',
+           ELFOSABI_NETBSD     : 'NETBSD',
+           ELFOSABI_LINUX      : 'LINUX',
+           ELFOSABI_SOLARIS    : 'SOLARIS',
+           ELFOSABI_AIX        : 'AIX',
+           ELFOSABI_IRIX       : 'IRIX',
+           ELFOSABI_FREEBSD    : 'FREEBSD',
+           ELFOSABI_TRU64      : 'TRU64',
+           ELFOSABI_MODESTO    : 'MODESTO',
+           ELFOSABI_OPENBSD    : 'OPENBSD',
+           ELFOSABI_ARM_AEABI  : 'ARM_AEABI',
+           ELFOSABI_ARM        : 'ARM',
+           ELFOSABI_STANDALONE : 'STANDALONE', }
+
+
+def machine_name(machine, elfclass=None, order=None):
+    """ Return the arch name of an e_machine value.
+
+        @elfclass and @order are e_ident bytes, used to tell
+        apart variants like 'mips' and 'mipsel'.
+    """
+    for key in ((machine, elfclass, order),
+                (machine, elfclass, None),
+                (machine, None, order),
+                (machine, None, None)):
+        if key in MACHINES:
+            return MACHINES[key]
+    else:
+        return None
 
 
 class ElfObjectError(Exception):
@@ -98,51 +259,145 @@ class ElfObject(object):
     """ ELF file parsing class.
 
         Automatically check if the file is an ELF and 
-        parse ELF header.
+        parse ELF header, program headers and interpreter.
+        The file is opened once and read through mmap, so
+        nothing but the interpreter path is copied.
     """
 
-    ORDREF = { ELFDATANONE : '=',
-               ELFDATA2LSB : '<',
-               ELFDATA2MSB : '>',
-               ELFDATANUM  : '=', }
+    ORDREF = { chr(ELFDATANONE) : '=',
+               chr(ELFDATA2LSB) : '<',
+               chr(ELFDATA2MSB) : '>',
+               chr(ELFDATANUM)  : '=', }
 
-    FMTREF = { ELFCLASSNONE : '',
-               ELFCLASS32   : ElfHeader32,
-               ELFCLASS64   : ElfHeader64, }
+    FMTREF = { ELFCLASSNONE : ('', ''),
+               ELFCLASS32   : (ElfHeader32, ElfPhdr32),
+               ELFCLASS64   : (ElfHeader64, ElfPhdr64), }
 
-    def __init__(self, filepath):
+    def __init__(self, filepath=None, buf=None):
         """ Prepare the elf object.
 
             Check if @filepath is an ELF. If not, raise
             an exception.If so, extract the ELF header
-            according to ELF file class.
+            according to ELF file class. Alternatively, parse
+            the leading bytes of an ELF given in @buf, e.g.
+            only the ELF header.
         """
-        if not is_elfobj(filepath):
+        if buf is not None:
+            self._parse(buf)
+            return
+
+        try:
+            fileobj = open(filepath, 'rb')
+        except IOError, err:
+            raise ElfObjectError("Cann't open '%s': %s" % (filepath, err))
+
+        try:
+            try:
+                buf = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+            except (mmap.error, ValueError, EnvironmentError):
+                raise ElfObjectError("Not a valid ELF file")
+
+            try:
+                self._parse(buf)
+            finally:
+                buf.close()
+        finally:
+            fileobj.close()
+
+    def _parse(self, buf):
+        """ Parse ELF header and program headers in @buf. """
+        size = len(buf)
+
+        if size < EI_NIDENT or buf[:SELFMAG] != ELFMAG:
             raise ElfObjectError("Not a valid ELF file")
-            
-        # extract ident array
-        ident_wrd = unpack_from(filepath, "=16s", 0)
 
         # identify ELF data order and file class
         # determine the ELF header format
-        ehdr_ord = self.ORDREF.get(ident_wrd[EI_DATA], '=')
-        ehdr_fmt = self.FMTREF.get(ident_wrd[EI_CLASS], '')
-        ehdr_fmt = ehdr_ord + ehdr_fmt
+        ehdr_ord = self.ORDREF.get(buf[EI_DATA], '=')
+        ehdr_fmt, phdr_fmt = self.FMTREF.get(buf[EI_CLASS], ('', ''))
+
+        if not ehdr_fmt or size < struct.calcsize(ehdr_ord + ehdr_fmt):
+            raise ElfObjectError("Not a valid ELF file")
 
         # extract the ELF header
-        self._ehdr = unpack_from(filepath, ehdr_fmt, 0)
+        self._ehdr = struct.unpack_from(ehdr_ord + ehdr_fmt, buf, 0)
+
+        # extract program headers within @buf
+        self._phdrs = []
+        self._interp = None
+
+        phoff, phentsize, phnum = self._ehdr[5], self._ehdr[9], self._ehdr[10]
+        phdr_fmt = ehdr_ord + phdr_fmt
+
+        if phentsize < struct.calcsize(phdr_fmt):
+            return
+
+        for ind in range(phnum):
+            offset = phoff + ind * phentsize
+            if offset + phentsize > size:
+                break
+            self._phdrs.append(struct.unpack_from(phdr_fmt, buf, offset))
+
+        for phdr in self._phdrs:
+            if phdr[0] != PT_INTERP:
+                continue
+
+            # p_offset and p_filesz of both classes
+            if buf[EI_CLASS] == ELFCLASS32:
+                offset, filesz = phdr[1], phdr[4]
+            else:
+                offset, filesz = phdr[2], phdr[5]
+
+            if offset + filesz <= size:
+                self._interp = buf[offset : offset + filesz].rstrip('\x00')
+            break
 
     @property
     def machine(self):
-        return {EM_386      : 'i386',
-                EM_X86_64   : 'x86_64',
-                EM_ARM      : 'arm',
-                EM_AARCH64  : 'aarch64',}.get(self._ehdr[2], None)
+        """ Arch name, e.g. 'arm', 'mipsel' or 'ppc64le'. """
+        return machine_name(self._ehdr[2],
+                            self._ehdr[0][EI_CLASS],
+                            ord(self._ehdr[0][EI_DATA]))
+
+    @property
+    def emachine(self):
+        """ Raw e_machine value, e.g. for unknown arches. """
+        return self._ehdr[2]
 
     @property
     def order(self):
         return {ELFDATA2LSB : 'LSB',
-                ELFDATA2MSB : 'MSB',}.get(self._ehdr[0][EI_DATA], None)
+                ELFDATA2MSB : 'MSB',}.get(ord(self._ehdr[0][EI_DATA]), None)
+
+    @property
+    def elfclass(self):
+        return {ELFCLASS32 : 'ELF32',
+                ELFCLASS64 : 'ELF64',}.get(self._ehdr[0][EI_CLASS], None)
+
+    @property
+    def osabi(self):
+        return OSABIS.get(ord(self._ehdr[0][EI_OSABI]), None)
+
+    @property
+    def abiversion(self):
+        return ord(self._ehdr[0][EI_ABIVERSION])
+
+    @property
+    def type(self):
+        return self._ehdr[1]
+
+    @property
+    def flags(self):
+        return self._ehdr[7]
+
+    @property
+    def phdrs(self):
+        return self._phdrs
+
+    @property
+    def interp(self):
+        """ Path of the program interpreter (PT_INTERP). """
+        return self._interp
 
 
 def unpack_from(filepath, filefmt, offset=0):
@@ -163,5 +418,8 @@ def is_elfobj(filepath):
         
         Return `True` is @filepath is an ELF file.
     """
-    return os.path.lexists(filepath) and \
-           unpack_from(filepath, "=16s", 0)[:SELFMAG] == ELFMAG
+    try:
+        with open(filepath, 'rb') as fileobj:
+            return fileobj.read(SELFMAG) == ELFMAG
+    except IOError:
+        return False
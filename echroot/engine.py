@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import Queue
+import threading
+import collections
+
+class EngineError(Exception):
+    """ Raised when a step of Engine fails.
+
+        'step' names the failed step and 'error' holds the
+        original exception.
+    """
+
+    def __init__(self, step, error):
+        Exception.__init__(self, "step '%s' failed: %s" % (step, error))
+        self.step = step
+        self.error = error
+
+class Future(object):
+    """ Result of a background run of Engine.
+
+        A subset of concurrent.futures.Future, which isn't
+        available on Python 2. An asyncio loop may wrap it
+        through 'add_done_callback' and call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._error = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """ Wait for and return the result, or raise its error. """
+        self._event.wait(timeout)
+        if not self.done():
+            raise EngineError("<future>", "timed out")
+        if self._error:
+            raise self._error[0], self._error[1], self._error[2]
+
+        return self._result
+
+    def exception(self, timeout=None):
+        self._event.wait(timeout)
+        return self._error and self._error[1]
+
+    def add_done_callback(self, callback):
+        """ Call @callback(future) once done, maybe right now. """
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+
+        callback(self)
+
+    def _set(self, result=None, error=None):
+        with self._lock:
+            self._result, self._error = result, error
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            callback(self)
+
+class Engine(object):
+    """ Run steps as a dependency graph.
+
+        A step is a pair of 'do' and 'undo' callables, which
+        may run once the steps it comes after are done. Steps
+        independent of each other run concurrently on up to
+        @jobs threads, e.g. to overlap steps blocking on
+        subprocesses. With one job, steps run in the calling
+        thread without any overhead.
+
+        If a step fails, no more steps are started, and those
+        done are undone, each after the steps depending on it.
+    """
+
+    def __init__(self, jobs=1):
+        self._jobs = max(1, jobs)
+        self._steps = collections.OrderedDict()
+        self._done = []
+
+    def add(self, name, do, undo=None, after=(), done=False):
+        """ Add step @name coming after steps named @after.
+
+            Unknown names in @after are ignored, so that optional
+            steps may be referred to. If @done is `True`, the step
+            was done elsewhere and is only to be undone.
+        """
+        self._steps[name] = (do, undo, [dep for dep in after if dep in self._steps])
+        done and self._done.append(name)
+
+    @property
+    def names(self):
+        return self._steps.keys()
+
+    @property
+    def done(self):
+        """ Names of done steps, in the order they finished. """
+        return list(self._done)
+
+    def _execute(self, names, action, deps):
+        """ Call action(name) for @names honoring @deps.
+
+            Return (finished names, (name, exc_info) of the first
+            failure or `None`).
+        """
+        pending = dict((name, set(deps(name))) for name in names)
+        ready = [name for name in names if not pending[name]]
+        finished, failure = [], None
+
+        if self._jobs == 1:
+            while ready and not failure:
+                name = ready.pop(0)
+                try:
+                    action(name)
+                except Exception:
+                    failure = (name, sys.exc_info())
+                    break
+                finished.append(name)
+                for other in names:
+                    if name in pending[other]:
+                        pending[other].discard(name)
+                        pending[other] or ready.append(other)
+
+            return finished, failure
+
+        tasks, results = Queue.Queue(), Queue.Queue()
+
+        def work():
+            while True:
+                name = tasks.get()
+                if name is None:
+                    return
+                try:
+                    action(name)
+                    results.put((name, None))
+                except Exception:
+                    results.put((name, sys.exc_info()))
+
+        workers = [threading.Thread(target=work)
+                   for _ in range(min(self._jobs, len(names)))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        running = 0
+        try:
+            while ready or running:
+                while ready and not failure:
+                    tasks.put(ready.pop(0))
+                    running = running + 1
+                if not running:
+                    break
+
+                name, error = results.get()
+                running = running - 1
+                if error:
+                    failure = failure or (name, error)
+                    continue
+
+                finished.append(name)
+                for other in names:
+                    if name in pending[other]:
+                        pending[other].discard(name)
+                        pending[other] or ready.append(other)
+        finally:
+            for worker in workers:
+                tasks.put(None)
+
+        return finished, failure
+
+    def _dependents(self, name, among):
+        """ Return steps of @among which come after @name. """
+        return [other for other in among if name in self._steps[other][2]]
+
+    def run(self):
+        """ Do all steps.
+
+            Return the names of the steps in the order they
+            finished. Raise EngineError after undoing the done
+            steps if any step fails.
+        """
+        names = [name for name in self._steps if name not in self._done]
+
+        def action(name):
+            do = self._steps[name][0]
+            do and do()
+
+        def deps(name):
+            return [dep for dep in self._steps[name][2] if dep not in self._done]
+
+        finished, failure = self._execute(names, action, deps)
+        self._done.extend(finished)
+
+        if failure:
+            name, error = failure
+            try:
+                self.undo()
+            except EngineError:
+                pass
+            raise EngineError(name, error[1]), None, error[2]
+
+        return self.done
+
+    def undo(self):
+        """ Undo all done steps, dependents first.
+
+            Every step is undone even if some fail. Raise
+            EngineError for the first failure afterwards.
+        """
+        names = list(reversed(self._done))
+        failures = []
+
+        def action(name):
+            undo = self._steps[name][1]
+            try:
+                undo and undo()
+            except Exception:
+                failures.append((name, sys.exc_info()))
+            self._done.remove(name)
+
+        self._execute(names, action, lambda name: self._dependents(name, names))
+
+        if failures:
+            name, error = failures[0]
+            raise EngineError(name, error[1]), None, error[2]
+
+    def start(self):
+        """ Do all steps in a background thread.
+
+            Return a Future of what 'run' returns.
+        """
+        future = Future()
+
+        def background():
+            try:
+                future._set(self.run())
+            except Exception:
+                future._set(error=sys.exc_info())
+
+        thread = threading.Thread(target=background)
+        thread.daemon = True
+        thread.start()
+
+        return future
@@ -1,8 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import aux
-import dup
-import bind
+from echroot import lazy
 
-__all__ = ['aux', 'dup', 'binc']
+__all__ = ['aux', 'dup', 'bind', 'mount', 'mtab', 'overlay']
+
+# submodules are imported on first use
+lazy(__name__)
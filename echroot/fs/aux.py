@@ -2,8 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import os
+import errno
+import ctypes
 import shutil
 
+from echroot.utils import timing
+
 def norm_path(filepath, rootpath='/'):
     """ Normalize file path to absolute path.
 
@@ -30,6 +34,38 @@ def cano_path(filepath, rootpath='/'):
 
     return canopath
 
+def root_path(filepath, rootpath='/', maxlinks=40):
+    """ Resolve file path as seen from within @rootpath.
+
+        Symbolic links are followed relative to @rootpath
+        rather than the host's root, e.g. '/bin/sh -> /bin/bash'
+        stays inside @rootpath. Return the resolved host path.
+    """
+    rootpath = os.path.realpath(os.path.expanduser(rootpath))
+    parts = [part for part in filepath.split('/') if part]
+    found = []
+
+    while parts and maxlinks >= 0:
+        part = parts.pop(0)
+        if part == '.':
+            continue
+        if part == '..':
+            found and found.pop()
+            continue
+
+        hostpath = os.path.join(rootpath, *(found + [part]))
+        if not os.path.islink(hostpath):
+            found.append(part)
+            continue
+
+        linkto = os.readlink(hostpath)
+        if linkto.startswith('/'):
+            found = []
+        parts = [part for part in linkto.split('/') if part] + parts
+        maxlinks = maxlinks - 1
+
+    return os.path.join(rootpath, *found)
+
 def make_dirs(dirpath):
     """ Create a leaf directory and all intermediate ones.
 
@@ -56,6 +92,55 @@ def remove_dirs(dirpath):
     finally:
         return not os.path.lexists(dirpath)
 
+def missing_top(filepath):
+    """ Return the topmost missing one of @filepath and its
+        parents, or `None` if @filepath exists.
+    """
+    if os.path.lexists(filepath):
+        return None
+
+    toppath = filepath
+    while not os.path.lexists(os.path.dirname(toppath)):
+        toppath = os.path.dirname(toppath)
+
+    return toppath
+
+def make_point(pointpath, isdir=True):
+    """ Create a mountpoint, a directory or an empty file,
+        and its parents. Return `True` if @pointpath does
+        exist finally.
+    """
+    if isdir:
+        return make_dirs(pointpath)
+    else:
+        return make_node(pointpath, 0644)
+
+def remove_point(pointpath, toppath):
+    """ Remove mountpoint @pointpath made by 'make_point'.
+
+        Only an empty directory or file is removed, then its
+        empty parents up to @toppath, as told by 'missing_top'
+        beforehand. Return `True` if @pointpath doesn't exist
+        finally.
+    """
+    if os.path.islink(pointpath):
+        return False
+
+    try:
+        if os.path.isdir(pointpath):
+            os.rmdir(pointpath)
+        elif os.path.isfile(pointpath) and os.path.getsize(pointpath) == 0:
+            os.unlink(pointpath)
+
+        dirpath = pointpath
+        while len(dirpath) > len(toppath):
+            dirpath = os.path.dirname(dirpath)
+            os.rmdir(dirpath)
+    except OSError:
+        pass
+
+    return not os.path.lexists(pointpath)
+
 def make_node(nodepath, mode=0600):
     """ Create a filesystem node.
 
@@ -76,3 +161,50 @@ def copy_file(srcfile, dstfile, shadow=True):
         os.symlink(linkto, dstfile)
     else:
         shutil.copyfile(srcfile, dstfile)
+        timing.count("copied", os.path.getsize(dstfile))
+
+def get_xattr(filepath, name, size=256):
+    """ Get extended attribute @name of @filepath.
+
+        Symbolic links aren't followed. Return `None` if the
+        attribute doesn't exist or can't be read.
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        value = ctypes.create_string_buffer(size)
+        length = libc.lgetxattr(filepath, name, value, size)
+    except (OSError, AttributeError):
+        return None
+
+    return length >= 0 and value.raw[:length] or None
+
+def list_xattrs(filepath, size=4096):
+    """ List names of extended attributes of @filepath.
+
+        Symbolic links aren't followed. Return an empty list
+        if they can't be read.
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        names = ctypes.create_string_buffer(size)
+        length = libc.llistxattr(filepath, names, size)
+    except (OSError, AttributeError):
+        return []
+
+    return [name for name in names.raw[:max(length, 0)].split('\0') if name]
+
+def set_xattr(filepath, name, value):
+    """ Set extended attribute @name of @filepath to @value.
+
+        Symbolic links aren't followed. Raise OSError if
+        failed.
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        func = libc.lsetxattr
+    except (OSError, AttributeError):
+        raise OSError(errno.ENOSYS, "lsetxattr(2) is unavailable")
+
+    if func(filepath, name, value, len(value), 0) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
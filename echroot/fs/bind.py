@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os
-from echroot.fs import aux
+from echroot.fs import aux, mount, mtab
 from echroot.utils import runner
 
 class BindingError(Exception):
@@ -13,8 +13,20 @@ class Binding(object):
     """ Represent a bind mount of directory.
 
         For more detail, man 8 mount.
+
+        Binding calls mount(2) directly by default. If the
+        syscall backend is unavailable or fails, it falls
+        back to mount(8) through a subprocess.
     """
 
+    BACKEND = mount.available() and "syscall" or "runner"
+
+    # options which are applied by remounting the binding
+    REMOUNTS = { "ro"      : mount.MS_RDONLY,
+                 "nosuid"  : mount.MS_NOSUID,
+                 "nodev"   : mount.MS_NODEV,
+                 "noexec"  : mount.MS_NOEXEC, }
+
     def __init__(self, olddir, newdir, *options):
         """ Prepare for mountpoints.
             
@@ -33,38 +45,106 @@ class Binding(object):
            not os.path.isdir(self._newdir):
             raise BindingError("newdir '%s' is not directory." % self._newdir)
 
+    @classmethod
+    def resolved(cls, olddir, newdir, *options):
+        """ Prepare for mountpoints canonicalized and checked
+            already, e.g. by a profile's plan.
+        """
+        binding = cls.__new__(cls)
+        binding._olddir = olddir
+        binding._newdir = newdir
+        binding._option = ','.join(options or [''])
+        binding._mkstat = False
+
+        return binding
+
     def __str__(self):
         """ Format Binding to String. """
         label = self.binded() and "--->" or "-x->"
         return ' '.join([self._olddir, label, self._newdir])
 
-    def _bind(self):
-        """ Call mount(8) to bind. 
+    def _sys_bind(self):
+        """ Call mount(2) to bind.
 
-            Mountpoints are expected to be available and unbinded.
+            Options in REMOUNTS are applied by a second remount,
+            because the kernel ignores them on the first one.
+            Raise OSError if failed or any option is unknown.
         """
+        flags = mount.MS_BIND
+        remnt = 0
+
+        for opt in self._option.split(','):
+            if opt in ("", "bind"):
+                continue
+            elif opt in ("rbind", "rec"):
+                flags = flags | mount.MS_REC
+            elif opt in self.REMOUNTS:
+                remnt = remnt | self.REMOUNTS[opt]
+            else:
+                raise OSError("unknown option '%s'." % opt)
+
+        mount.mount(self._olddir, self._newdir, None, flags)
+
+        if remnt:
+            try:
+                mount.mount(self._olddir, self._newdir, None,
+                            mount.MS_REMOUNT | mount.MS_BIND | remnt)
+            except OSError:
+                mount.umount(self._newdir)
+                raise
+
+        return True
+
+    def _sys_unbind(self):
+        """ Call umount2(2) to unbind. """
+        mount.umount(self._newdir)
+        return True
+
+    def _run_bind(self):
+        """ Call mount(8) to bind. """
         return runner.call("mount -o bind,%s %s %s" % (self._option, 
                                                        self._olddir, 
                                                        self._newdir))[0] == 0
 
+    def _run_unbind(self):
+        """ Call umount(8) to unbind. """
+        return runner.call("umount %s" % self._newdir)[0] == 0
+
+    def _bind(self):
+        """ Bind through the configured backend.
+
+            Mountpoints are expected to be available and unbinded.
+        """
+        if self.BACKEND == "syscall":
+            try:
+                return self._sys_bind()
+            except OSError:
+                pass
+
+        return self._run_bind()
+
     def _unbind(self):
-        """ Call umount(8) to unbind.
+        """ Unbind through the configured backend.
 
             Mountpoints are expected to be binded already.
         """ 
-        return runner.call("umount %s" % self._newdir)[0] == 0
+        if self.BACKEND == "syscall":
+            try:
+                return self._sys_unbind()
+            except OSError:
+                pass
+
+        return self._run_unbind()
+
+    @property
+    def newdir(self):
+        return self._newdir
 
     def binded(self):
         """ Test if this binding is binded. """
         # Sometimes os.path.ismount performs incorrectly.
         # Check mount table is a better way.
-        with open("/proc/mounts", 'r') as mnts:
-            for mnt in mnts.readlines():
-                newdir = aux.cano_path(mnt.split()[1])
-                if self._newdir == newdir: 
-                    return True
-            else:
-                return False
+        return self._newdir in mtab.table()
 
     def bind(self):
         """ Bind olddir to newdir.
@@ -79,7 +159,10 @@ class Binding(object):
         if not os.path.exists(self._newdir):
             self._mkstat = aux.make_dirs(self._newdir)
 
-        self._bind() or self._mkstat and aux.remove_dirs(self._newdir)
+        binded = self._bind()
+        mtab.table().invalidate()
+
+        binded or self._mkstat and aux.remove_dirs(self._newdir)
 
     def unbind(self):
         """ Unbind newdir from olddir.
@@ -90,4 +173,7 @@ class Binding(object):
         if not self.binded():
             return
 
-        self._unbind() and self._mkstat and aux.remove_dirs(self._newdir)
+        unbinded = self._unbind()
+        mtab.table().invalidate()
+
+        unbinded and self._mkstat and aux.remove_dirs(self._newdir)
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os
-from echroot.fs import aux
+from echroot.fs import aux, mount, mtab
 
 class DuppingError(Exception):
     """ Base exception class for dupping class. """
@@ -11,21 +11,32 @@ class DuppingError(Exception):
 class Dupping(object):
     """ Represent a dup of file.
 
-        This class is responsible for copying source file 
-        and restoring overwrited dest file. Shadow copy is
-        default method.
+        By default source file is bind mounted read-only onto
+        dest file, which leaves the rootfs untouched unless
+        dest file has to be created as mountpoint. If that
+        isn't possible, e.g. without mount(2) or when dest file
+        is a symbolic link, this class falls back to copying
+        source file and restoring overwrited dest file from a
+        backup. Shadow copy is default method of copying.
+        Source files which are symbolic links or live in /proc
+        are always copied, e.g. /etc/mtab, which would be
+        bound as the mounts of our own PID otherwise.
     """
 
-    def __init__(self, srcfile, dstfile, shadow=True):
+    METHOD = mount.available() and "bind" or "copy"
+
+    def __init__(self, srcfile, dstfile, shadow=True, method=None):
         """ Prepare for a dup instance.
-            
+
             @srcfile must exist as a common file. @dstfile
-            shouldn't exist. If @dstfile exists already, it 
-            must be a common file, too.
+            shouldn't exist. If @dstfile exists already, it
+            must be a common file, too. @method is "bind" or
+            "copy", and defaults to METHOD.
         """
         self._srcfile = aux.norm_path(srcfile)
         self._dstfile = aux.norm_path(dstfile)
         self._shadow = shadow
+        self._method = method or self.METHOD
         self._mkstat = False
 
         if not os.path.isfile(self._srcfile):
@@ -38,7 +49,12 @@ class Dupping(object):
         bakname = ".%s.bak" % os.path.basename(self._dstfile)
         self._bakfile = os.path.join(bakdir, bakname)
 
-        if os.path.lexists(self._bakfile):
+        # mount(2) follows symbolic links, even out of rootfs
+        if os.path.islink(self._dstfile) or os.path.islink(self._srcfile) or \
+           os.path.realpath(self._srcfile).startswith("/proc/"):
+            self._method = "copy"
+
+        if self._method == "copy" and os.path.lexists(self._bakfile):
             raise DuppingError("Cann't create backup file.")
 
     def __str__(self):
@@ -46,26 +62,63 @@ class Dupping(object):
         label = self.dupped() and "====" or "!=!="
         return ' '.join([self._srcfile, label, self._dstfile])
 
+    @property
+    def dstfile(self):
+        return self._dstfile
+
+    @property
+    def bakfile(self):
+        return self._bakfile
+
+    @property
+    def method(self):
+        return self._method
+
+    def _mountpoint(self):
+        """ Return dest file as listed in the mount table. """
+        dstdir, dstname = os.path.split(self._dstfile)
+        return os.path.join(os.path.realpath(dstdir), dstname)
+
     def dupped(self):
         """ Test if this dupping is dupped.
 
-            Return `True` if there is a backup file belonging
-            to this dupping.
+            Return `True` if dest file is mounted on, or if
+            there is a backup file belonging to this dupping.
         """
-        return os.path.lexists(self._bakfile)
-
-    def dup(self):
-        """ Copy srcfile as dstfile.
+        if self._method == "bind":
+            return self._mountpoint() in mtab.table()
+        else:
+            return os.path.lexists(self._bakfile)
 
-            If dstfile doesn't exist, create it. Backup file
-            will be create here and be deleted in 'undup'
-            method later.
+    def _bind_dup(self):
+        """ Bind mount srcfile onto dstfile read-only.
 
-            NOTICE: Directories created here CANN'T be removed
-            by 'undup' method.
+            Raise OSError if failed.
         """
-        if self.dupped(): 
-            return
+        mkstat = False
+        if not os.path.lexists(self._dstfile):
+            mkstat = aux.make_node(self._dstfile, 0644)
+
+        try:
+            mount.mount(self._srcfile, self._dstfile, None, mount.MS_BIND)
+            try:
+                mount.mount(self._srcfile, self._dstfile, None, mount.MS_REMOUNT |
+                            mount.MS_BIND | mount.MS_RDONLY)
+            except OSError:
+                mount.umount(self._dstfile)
+                raise
+        except OSError:
+            mkstat and os.unlink(self._dstfile)
+            raise
+        finally:
+            mtab.table().invalidate()
+
+        self._mkstat = mkstat
+
+    def _copy_dup(self):
+        """ Copy srcfile as dstfile, keeping a backup. """
+        if os.path.lexists(self._bakfile):
+            raise DuppingError("Cann't create backup file.")
 
         if not os.path.lexists(self._dstfile):
             self._mkstat = aux.make_node(self._dstfile, 0666)
@@ -73,8 +126,32 @@ class Dupping(object):
         os.rename(self._dstfile, self._bakfile)
         aux.copy_file(self._srcfile, self._dstfile, self._shadow)
 
+    def dup(self, fallback=True):
+        """ Dup srcfile as dstfile.
+
+            If dstfile doesn't exist, create it. When copying,
+            backup file will be create here and be deleted in
+            'undup' method later. Without @fallback, raise
+            OSError rather than copying if binding fails.
+
+            NOTICE: Directories created here CANN'T be removed
+            by 'undup' method.
+        """
+        if self.dupped():
+            return
+
+        if self._method == "bind":
+            try:
+                return self._bind_dup()
+            except OSError:
+                if not fallback:
+                    raise
+                self._method = "copy"
+
+        self._copy_dup()
+
     def undup(self):
-        """ Delete dstfile and restore origin dstfile.
+        """ Restore origin dstfile.
 
             Dstfile created in 'dup' method will be deleted
             here and backup file will be restored if necessary.
@@ -82,6 +159,11 @@ class Dupping(object):
         if not self.dupped():
             return
 
-        os.unlink(self._dstfile)
-        os.rename(self._bakfile, self._dstfile)
+        if self._method == "bind":
+            mount.umount(self._dstfile)
+            mtab.table().invalidate()
+        else:
+            os.unlink(self._dstfile)
+            os.rename(self._bakfile, self._dstfile)
+
         self._mkstat and os.unlink(self._dstfile)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import errno
+import ctypes
+import ctypes.util
+
+""" Flags for mount(2) and umount2(2).
+
+    For more detail, man 2 mount and man 2 umount.
+"""
+
+MS_RDONLY    = 1
+MS_NOSUID    = 2
+MS_NODEV     = 4
+MS_NOEXEC    = 8
+MS_REMOUNT   = 32
+MS_BIND      = 4096
+MS_REC       = 16384
+MS_PRIVATE   = 1 << 18
+MS_SLAVE     = 1 << 19
+
+MNT_FORCE    = 1
+MNT_DETACH   = 2
+
+def _load_libc():
+    """ Load libc with errno support.
+
+        Return `None` if mount(2) or umount2(2) can't be
+        resolved, e.g. on a non-glibc platform.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        libc.mount, libc.umount2
+    except (OSError, AttributeError):
+        return None
+    else:
+        return libc
+
+_libc = _load_libc()
+
+def available():
+    """ Test if mount(2) and umount2(2) can be called. """
+    return _libc is not None
+
+def mount(source, target, fstype=None, flags=0, data=None):
+    """ Call mount(2).
+
+        Raise OSError if the syscall fails or is unavailable.
+    """
+    if _libc is None:
+        raise OSError(errno.ENOSYS, "mount(2) is unavailable")
+
+    if _libc.mount(source, target, fstype, flags, data) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), target)
+
+def umount(target, flags=0):
+    """ Call umount2(2).
+
+        Raise OSError if the syscall fails or is unavailable.
+    """
+    if _libc is None:
+        raise OSError(errno.ENOSYS, "umount2(2) is unavailable")
+
+    if _libc.umount2(target, flags) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), target)
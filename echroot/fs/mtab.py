@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import select
+import threading
+
+class MountTable(object):
+    """ Snapshot of the mount table of the current process.
+
+        /proc/self/mountinfo is parsed once into a dict keyed
+        by mount point, so that lookups cost O(1). The snapshot
+        is reloaded only after 'invalidate' is called or the
+        kernel reports a change by polling the mountinfo fd.
+        Reloads are serialized, so that threads may share it.
+    """
+
+    MOUNTINFO = "/proc/self/mountinfo"
+
+    def __init__(self, path=MOUNTINFO):
+        """ Prepare the mount table of @path. """
+        self._path = path
+        self._fobj = None
+        self._poll = None
+        self._opid = None
+        self._mnts = None
+        self._lock = threading.RLock()
+
+    def _open(self):
+        """ (Re)open mountinfo and register it for polling.
+
+            An fd inherited through fork shares its poll state
+            with the parent, so it is reopened in the child.
+        """
+        if self._fobj is not None and self._opid == os.getpid():
+            return
+
+        self._fobj is not None and self._fobj.close()
+        self._fobj = open(self._path, 'r')
+        self._opid = os.getpid()
+        self._mnts = None
+
+        try:
+            self._poll = select.poll()
+            self._poll.register(self._fobj, select.POLLPRI | select.POLLERR)
+        except (AttributeError, select.error):
+            self._poll = None
+
+    def _changed(self):
+        """ Test and clear the change event of mountinfo.
+
+            Without a poller, every query is treated as a change.
+        """
+        if self._poll is None:
+            return True
+
+        return bool(self._poll.poll(0))
+
+    def _load(self):
+        """ Parse mountinfo into the snapshot.
+
+            The change event is cleared before reading, so any
+            change happening later will be reported.
+        """
+        self._changed()
+        self._fobj.seek(0)
+
+        mnts = {}
+        for line in self._fobj.read().splitlines():
+            fields = line.split()
+            try:
+                sep = fields.index('-', 6)
+            except ValueError:
+                continue
+
+            entry = { "id"         : int(fields[0]),
+                      "parent"     : int(fields[1]),
+                      "root"       : unescape(fields[3]),
+                      "mountpoint" : unescape(fields[4]),
+                      "options"    : fields[5],
+                      "fstype"     : fields[sep + 1],
+                      "source"     : unescape(fields[sep + 2]), }
+
+            # later entries are stacked on top of earlier ones
+            mnts.setdefault(entry["mountpoint"], []).append(entry)
+
+        self._mnts = mnts
+
+    def invalidate(self):
+        """ Drop the snapshot, e.g. after mounting something. """
+        self._mnts = None
+
+    def refresh(self):
+        """ Reload the snapshot if it is out of date. """
+        with self._lock:
+            self._open()
+
+            if self._mnts is None or self._changed():
+                self._load()
+
+            return self._mnts
+
+    def lookup(self, mountpoint):
+        """ Return the topmost entry mounted on @mountpoint.
+
+            @mountpoint is expected to be canonicalized already.
+            Return `None` if nothing is mounted there.
+        """
+        entries = self.refresh().get(mountpoint.rstrip('/') or '/')
+        return entries and entries[-1] or None
+
+    def __contains__(self, mountpoint):
+        return self.lookup(mountpoint) is not None
+
+    def mountpoints(self):
+        """ Return all mount points in the snapshot. """
+        return self.refresh().keys()
+
+
+def unescape(field):
+    """ Decode octal escapes (e.g. '\\040') of mountinfo. """
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+
+_table = None
+
+def table():
+    """ Return the mount table shared by this process. """
+    global _table
+    if _table is None:
+        _table = MountTable()
+
+    return _table
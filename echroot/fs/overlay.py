@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import stat
+import errno
+import shutil
+import tempfile
+
+from echroot.fs import aux, mount, mtab
+
+class OverlayError(Exception):
+    """ Base exception class for Overlay class. """
+    pass
+
+class Overlay(object):
+    """ Represent a copy-on-write overlay of a directory.
+
+        The directory is mounted read-only as lowerdir of an
+        overlayfs, with writes going to an upperdir on a
+        private tmpfs or in a given directory. After unmounting,
+        the changes may be discarded or committed back into
+        the lowerdir.
+
+        For more detail, see Documentation/filesystems/overlayfs.
+    """
+
+    def __init__(self, lowerdir, upperdir=None):
+        """ Prepare for an overlay of @lowerdir.
+
+            If @upperdir is `None`, changes are kept in a tmpfs.
+            Otherwise @upperdir is created if necessary, and its
+            workdir is a sibling of it on the same filesystem.
+        """
+        self._lowerdir = aux.cano_path(lowerdir)
+        self._upperdir = upperdir and aux.cano_path(upperdir)
+        self._basedir = None
+
+        if not os.path.isdir(self._lowerdir):
+            raise OverlayError("lowerdir '%s' is not directory." % self._lowerdir)
+        if self._upperdir and os.path.exists(self._upperdir) and \
+           not os.path.isdir(self._upperdir):
+            raise OverlayError("upperdir '%s' is not directory." % self._upperdir)
+
+    def __str__(self):
+        """ Format Overlay to String. """
+        label = self.mounted() and "-+->" or "-x->"
+        return ' '.join([self._lowerdir, label, self.merged or "?"])
+
+    @property
+    def merged(self):
+        """ Directory of the merged view, once mounted. """
+        return self._basedir and os.path.join(self._basedir, "merged")
+
+    @property
+    def upper(self):
+        """ Directory holding the changes, once mounted. """
+        return self._upperdir or \
+               self._basedir and os.path.join(self._basedir, "upper")
+
+    def _workdir(self):
+        """ Return the workdir matching the upperdir. """
+        if self._upperdir:
+            updir, upname = os.path.split(self._upperdir)
+            return os.path.join(updir, ".%s.work" % upname)
+        else:
+            return os.path.join(self._basedir, "work")
+
+    def mounted(self):
+        """ Test if the overlay is mounted. """
+        return bool(self.merged) and self.merged in mtab.table()
+
+    def mount(self):
+        """ Mount the overlay.
+
+            Raise OverlayError if failed.
+        """
+        if self.mounted():
+            return
+
+        self._basedir = tempfile.mkdtemp(prefix="echroot-overlay-")
+
+        try:
+            self._upperdir or mount.mount("tmpfs", self._basedir, "tmpfs")
+            for dirpath in (self.upper, self._workdir(), self.merged):
+                aux.make_dirs(dirpath)
+
+            # redirects and metacopies live in xattrs which
+            # 'commit_changes' can't apply to a plain lowerdir
+            data = "lowerdir=%s,upperdir=%s,workdir=%s" % \
+                   (self._lowerdir, self.upper, self._workdir())
+            try:
+                mount.mount("overlay", self.merged, "overlay", 0,
+                            data + ",redirect_dir=off,metacopy=off")
+            except OSError, err:
+                # kernels before 4.10 know neither of them
+                if err.errno != errno.EINVAL:
+                    raise
+                mount.mount("overlay", self.merged, "overlay", 0, data)
+
+        except OSError, err:
+            self._release()
+            raise OverlayError("Cann't mount overlay of '%s': %s" %
+                               (self._lowerdir, err))
+
+        finally:
+            mtab.table().invalidate()
+
+    def _release(self):
+        """ Drop the tmpfs and the temporary directories. """
+        if self._basedir in mtab.table():
+            mount.umount(self._basedir, mount.MNT_DETACH)
+        shutil.rmtree(self._basedir, ignore_errors=True)
+
+        self._basedir = None
+        mtab.table().invalidate()
+
+    def umount(self, commit=False, discard=True):
+        """ Unmount the overlay.
+
+            If @commit is `True`, apply the changes to lowerdir
+            first. If @discard is `True`, drop the changes. A
+            tmpfs upperdir is always dropped.
+        """
+        if not self._basedir:
+            return
+
+        if self.mounted():
+            mount.umount(self.merged)
+            mtab.table().invalidate()
+
+        if commit:
+            commit_changes(self.upper, self._lowerdir)
+
+        if self._upperdir:
+            shutil.rmtree(self._workdir(), ignore_errors=True)
+            if discard:
+                shutil.rmtree(self._upperdir, ignore_errors=True)
+
+        self._release()
+
+
+def is_whiteout(path, st):
+    """ Test if @path is an overlayfs whiteout. """
+    return stat.S_ISCHR(st.st_mode) and st.st_rdev == 0
+
+def is_opaque(path):
+    """ Test if directory @path is an overlayfs opaque one. """
+    return aux.get_xattr(path, "trusted.overlay.opaque") == 'y'
+
+def _remove(path):
+    """ Remove @path whatever it is. """
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
+
+def _copy_attrs(upper, lower, st):
+    """ Copy ownership, mode, times and xattrs of @upper. """
+    os.lchown(lower, st.st_uid, st.st_gid)
+
+    # chown(2) drops setuid bits and file capabilities, so
+    # restore them afterwards. Overlayfs' own xattrs stay
+    stat.S_ISLNK(st.st_mode) or shutil.copystat(upper, lower)
+    for name in aux.list_xattrs(upper):
+        if name.startswith("trusted.overlay."):
+            continue
+        value = aux.get_xattr(upper, name, 65536)
+        try:
+            value is not None and aux.set_xattr(lower, name, value)
+        except OSError:
+            pass
+
+def commit_changes(upperdir, lowerdir, links=None):
+    """ Apply changes recorded in @upperdir to @lowerdir.
+
+        Whiteouts remove the entries they hide, opaque
+        directories replace their lower counterparts, and
+        everything else is copied over with its xattrs.
+        Hardlinked files stay hardlinked, @links maps their
+        (st_dev, st_ino) to the first copy.
+    """
+    links = {} if links is None else links
+
+    for name in os.listdir(upperdir):
+        upper = os.path.join(upperdir, name)
+        lower = os.path.join(lowerdir, name)
+        st = os.lstat(upper)
+
+        if is_whiteout(upper, st):
+            _remove(lower)
+
+        elif stat.S_ISDIR(st.st_mode):
+            if is_opaque(upper) or not os.path.isdir(lower) or \
+               os.path.islink(lower):
+                _remove(lower)
+            os.path.isdir(lower) or os.mkdir(lower)
+            commit_changes(upper, lower, links)
+            _copy_attrs(upper, lower, st)
+
+        else:
+            _remove(lower)
+            inode = (st.st_dev, st.st_ino)
+            if st.st_nlink > 1 and inode in links:
+                os.link(links[inode], lower)
+                continue
+
+            if stat.S_ISLNK(st.st_mode):
+                os.symlink(os.readlink(upper), lower)
+            elif stat.S_ISREG(st.st_mode):
+                shutil.copyfile(upper, lower)
+            else:
+                os.mknod(lower, st.st_mode, st.st_rdev)
+            _copy_attrs(upper, lower, st)
+
+            st.st_nlink > 1 and links.setdefault(inode, lower)
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import qemu
-import binfmts
+from echroot import lazy
 
-__all__ = ['qemu', 'binfmts']
+__all__ = ['qemu', 'arches', 'binfmts']
+
+# submodules are imported on first use
+lazy(__name__)
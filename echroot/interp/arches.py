@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+import collections
+
+from echroot import elf
+
+""" Arches whose ELF data order isn't told by elf.MACHINES,
+    but which are big-endian. Others are little-endian.
+"""
+BIGENDIAN = ( "m68k",
+              "hppa",
+              "sparc",
+              "sparc32plus",
+              "sparc64",
+              "ppc",
+              "s390",
+              "s390x",
+              "or1k", )
+
+""" Qemu targets of arches not named after them.
+"""
+TARGETS = { "i486" : "i386", }
+
+class Arch(collections.namedtuple("Arch", "name emachine elfclass order")):
+    """ An arch of the registry, as told by ELF headers.
+
+        @elfclass is `None` if the arch spans both classes.
+        @order is the ELF data order of the arch.
+    """
+
+    @property
+    def target(self):
+        """ Name of the arch as a qemu target. """
+        return TARGETS.get(self.name, self.name)
+
+    @property
+    def qemubase(self):
+        """ Name of the statically-linked emulator. """
+        return "qemu-%s-static" % self.target
+
+    @property
+    def emulators(self):
+        """ Names of candidate emulators, best first. """
+        return (self.qemubase, "qemu-%s" % self.target)
+
+    def _header(self):
+        # e_ident, e_type and e_machine: the 20 bytes matched
+        # by binfmt_misc
+        fmt = (self.order == elf.ELFDATA2MSB and '>' or '<') + "HH"
+        ident = elf.ELFMAG + (self.elfclass or elf.ELFCLASS32) + \
+                chr(self.order) + chr(1) + '\x00' * 9
+        return ident + struct.pack(fmt, elf.ET_EXEC, self.emachine)
+
+    def _mask(self):
+        # any OS ABI, ET_EXEC or ET_DYN, and either class if
+        # the arch spans both
+        fmt = (self.order == elf.ELFDATA2MSB and '>' or '<') + "HH"
+        ident = '\xff' * 4 + (self.elfclass and '\xff' or '\x00') + \
+                '\xff' * 2 + '\x00' + '\xff' * 8
+        return ident + struct.pack(fmt, 0xfffe, 0xffff)
+
+    @property
+    def magic(self):
+        """ binfmt_misc magic, escaped for its register file. """
+        return escape(self._header())
+
+    @property
+    def mask(self):
+        """ binfmt_misc mask, escaped for its register file. """
+        return escape(self._mask())
+
+    def matches(self, header):
+        """ Test if ELF @header is of this arch, as binfmt_misc does. """
+        return len(header) >= 20 and \
+               all(ord(byte) & ord(mask) == ord(magic) & ord(mask)
+                   for byte, magic, mask in zip(header[:20], self._header(),
+                                                self._mask()))
+
+def escape(data):
+    """ Escape every byte of @data as '\\xNN'. """
+    return ''.join("\\x%02x" % ord(byte) for byte in data)
+
+def _registry(machines=elf.MACHINES):
+    """ Derive arches from elf.MACHINES. """
+    arches = {}
+
+    for (emachine, elfclass, order), name in machines.items():
+        if order is None:
+            order = name in BIGENDIAN and elf.ELFDATA2MSB or elf.ELFDATA2LSB
+        arches[name] = Arch(name, emachine, elfclass, order)
+
+    return arches
+
+ARCHES = _registry()
+
+def lookup(name):
+    """ Return the Arch named @name, or `None`. """
+    return ARCHES.get(name)
@@ -3,12 +3,20 @@
 
 import os
 import re
+import errno
+import fcntl
 import shutil
 
-from echroot import fs
-from echroot.utils import runner
+from echroot import fs, elf
+from echroot.utils import runner, timing
+from echroot.utils.flock import FileLock
+from echroot.interp import arches
 from echroot.interp.binfmts import REGFMT, MAGICS, MASKS
 
+class QemuError(Exception):
+    """ Base exception class for qemu emulators. """
+    pass
+
 def disable_selinux():
     """ Disable selinux.
     
@@ -16,19 +24,136 @@ def disable_selinux():
     """
     return runner.call("setenforce 0")[0] == 0
 
-def install_qemu_emulator(rootdir, qemubase):
-    """ Install statically-linked qemu emulator. 
-        
-        If failed to find qemu-@arch-static emulator at the local, 
-        turn to recommanded repos for help.
+FICLONE = 0x40049409
+
+def _bind_file(srcpath, dstpath):
+    """ Bind mount @srcpath onto @dstpath read-only.
+
+        mount(2) follows a symbolic @dstpath, even out of
+        rootdir, so it's left to the other strategies.
     """
+    if os.path.islink(dstpath):
+        raise OSError(errno.ELOOP, "'%s' is a symbolic link" % dstpath)
+
+    mkstat = False
+    if not os.path.lexists(dstpath):
+        mkstat = fs.aux.make_node(dstpath, 0755)
+
+    try:
+        fs.mount.mount(srcpath, dstpath, None, fs.mount.MS_BIND)
+        try:
+            fs.mount.mount(srcpath, dstpath, None, fs.mount.MS_REMOUNT |
+                           fs.mount.MS_BIND | fs.mount.MS_RDONLY)
+        except OSError:
+            fs.mount.umount(dstpath)
+            raise
+    except OSError:
+        mkstat and os.unlink(dstpath)
+        raise
+    finally:
+        fs.mtab.table().invalidate()
+
+def _link_file(srcpath, dstpath):
+    """ Hardlink @srcpath as @dstpath. """
+    os.path.lexists(dstpath) and os.unlink(dstpath)
+    os.link(srcpath, dstpath)
+
+def _clone_file(srcpath, dstpath):
+    """ Reflink @srcpath as @dstpath through FICLONE. """
+    os.path.lexists(dstpath) and os.unlink(dstpath)
+    with open(srcpath, 'rb') as srcfile:
+        with open(dstpath, 'wb') as dstfile:
+            try:
+                fcntl.ioctl(dstfile.fileno(), FICLONE, srcfile.fileno())
+            except IOError:
+                os.unlink(dstpath)
+                raise
+    shutil.copymode(srcpath, dstpath)
+
+def _copy_file(srcpath, dstpath):
+    """ Copy @srcpath as @dstpath. """
+    shutil.copy(srcpath, dstpath)
+    timing.count("copied", os.path.getsize(dstpath))
+
+""" Ways to install qemu emulator, from cheapest to costliest.
+"""
+STRATEGIES = ( ("bind",  _bind_file),
+               ("link",  _link_file),
+               ("clone", _clone_file),
+               ("copy",  _copy_file), )
+
+def find_qemu_emulator(qemubase):
+    """ Return the path of @qemubase on the host, or `None`. """
     for srcdir in os.getenv("PATH", "/usr/bin/").split(':'):
         srcpath = os.path.join(srcdir, qemubase)
         if os.path.exists(srcpath):
-            dstdir = fs.aux.norm_path("/usr/bin/", rootdir)
-            dstpath = os.path.join(dstdir, qemubase)
-            fs.aux.make_dirs(dstdir) and shutil.copy(srcpath, dstpath)
-            return True
+            return srcpath
+    else:
+        return None
+
+def _is_static(filepath):
+    try:
+        return elf.ElfObject(filepath).interp is None
+    except elf.ElfObjectError:
+        return False
+
+def pick_qemu_emulator(arch, emulator=None, fixbin=False):
+    """ Return the host path of an emulator for @arch, or `None`.
+
+        @emulator is a path or a name looked up in PATH, which
+        is picked regardless. Otherwise emulators of the arch
+        registry are tried in turn. Unless @fixbin is `True`,
+        others than qemu-@arch-static are only picked if they
+        are statically linked, as rootdir has no host libraries.
+    """
+    if emulator:
+        if os.sep in emulator:
+            return os.path.isfile(emulator) and os.path.abspath(emulator) or None
+        return find_qemu_emulator(emulator)
+
+    entry = arches.lookup(arch)
+    for qemubase in entry and entry.emulators or ():
+        qemupath = find_qemu_emulator(qemubase)
+        if qemupath and (fixbin or qemubase == entry.qemubase or
+                         _is_static(qemupath)):
+            return qemupath
+    else:
+        return None
+
+def qemu_dir(rootdir):
+    """ Return the host path of /usr/bin in @rootdir.
+
+        It's resolved from within @rootdir, e.g. when /usr/bin
+        is a symlink as in usrmerge layouts, so that installing,
+        removing and journaling the emulator agree on its path.
+    """
+    return fs.aux.root_path("/usr/bin/", rootdir)
+
+def install_qemu_emulator(rootdir, qemubase, strategies=STRATEGIES, srcpath=None):
+    """ Install statically-linked qemu emulator. 
+        
+        If failed to find qemu-@arch-static emulator at the local, 
+        turn to recommanded repos for help. The local emulator
+        is bind mounted if possible, otherwise hardlinked,
+        reflinked and copied at last, so that nothing has to
+        be written in most cases. @srcpath is installed as
+        @qemubase instead of the local emulator if given.
+    """
+    srcpath = srcpath or find_qemu_emulator(qemubase)
+    if srcpath:
+        dstdir = qemu_dir(rootdir)
+        dstpath = os.path.join(dstdir, qemubase)
+        if not fs.aux.make_dirs(dstdir):
+            return False
+
+        for name, install in strategies:
+            try:
+                install(srcpath, dstpath)
+                return True
+            except (IOError, OSError):
+                continue
+        else:
+            return False
     else:
         cmdln = "sh echroot/scripts/fetch-qemu.sh %s %s" % (qemubase, rootdir)
         return runner.call(cmdln)[0] == 0
@@ -36,22 +161,31 @@ def install_qemu_emulator(rootdir, qemubase):
 def uninstall_qemu_emulator(rootdir, qemubase):
     """ Uninstall statically-linked qemu emulator. 
 
-        Remove '@rootdir/usr/bin/@qemubase' simply.
+        Unmount '@rootdir/usr/bin/@qemubase' if it is bind
+        mounted, then remove it simply.
     """
-    qemupath = os.path.join("/usr/bin/", qemubase)
-    qemupath = fs.aux.norm_path(qemupath, rootdir)
-    
+    qemupath = os.path.join(qemu_dir(rootdir), qemubase)
+
+    if qemupath in fs.mtab.table():
+        try:
+            fs.mount.umount(qemupath)
+        except OSError:
+            runner.call("umount %s" % qemupath)
+        fs.mtab.table().invalidate()
+
     if os.path.exists(qemupath):
         os.unlink(qemupath)
 
     return os.path.exists(qemupath)
 
-def register_qemu_emulator(qemu, arch):
+def register_qemu_emulator(qemu, arch, flags=""):
     """ Register qemu emulator for @arch executable file.
 
         Mount binfmt_misc if it doesn't exist. Unregister 
         qemu-@arch, if it has been registered and isn't a 
-        statically-linked executable
+        statically-linked executable. With the 'F' @flags,
+        the kernel opens @qemu at once, so @qemu is a host
+        path and needn't exist in any rootdir.
     """
     binfmt_node = "/proc/sys/fs/binfmt_misc"
     if not os.path.exists(binfmt_node):
@@ -72,7 +206,8 @@ def register_qemu_emulator(qemu, arch):
             return False
         else:
             fd = open(register_node, 'w')
-            fd.write(REGFMT.format(NAME=arch, MAGIC=magic, MASK=mask, INTERP=qemu))
+            fd.write(REGFMT.format(NAME=arch, MAGIC=magic, MASK=mask,
+                                   INTERP=qemu, FLAGS=flags))
             fd.close()
             return True
 
@@ -90,35 +225,156 @@ def unregister_qemu_emulator(qemu, arch):
 
     return not os.path.exists(qemu_node)
 
-def setup_qemu_emulator(rootdir, arch):
+def registration(arch):
+    """ Return the interpreter and flags registered for @arch.
+
+        Return `None` if @arch isn't registered.
+    """
+    qemu_node = "/proc/sys/fs/binfmt_misc/%s" % arch
+    fields = {}
+
+    try:
+        with open(qemu_node) as nodefs:
+            for line in nodefs:
+                key, _, value = line.strip().partition(' ')
+                fields[key.rstrip(':')] = value.strip()
+    except IOError:
+        return None
+
+    return fields.get("interpreter"), fields.get("flags", "")
+
+REFSDIR = "/var/run/echroot"
+
+def _update_refs(arch, update):
+    """ Update holders of the @arch registration.
+
+        Holders are PIDs recorded in REFSDIR/binfmt.@arch,
+        which is guarded by a FileLock. Holders which died
+        without releasing are dropped. @update is called with
+        the living holders and returns the new ones.
+    """
+    fs.aux.make_dirs(REFSDIR)
+    refsfile = os.path.join(REFSDIR, "binfmt.%s" % arch)
+
+    with FileLock(refsfile):
+        try:
+            with open(refsfile) as refsfs:
+                holders = [int(pid) for pid in refsfs.read().split()]
+        except (IOError, ValueError):
+            holders = []
+
+        holders = [pid for pid in holders if os.path.exists("/proc/%d" % pid)]
+        holders = update(holders)
+
+        with open(refsfile, 'w') as refsfs:
+            refsfs.write(''.join("%d\n" % pid for pid in holders))
+
+def acquire_qemu_emulator(qemu, arch, flags=""):
+    """ Register qemu emulator for @arch, shared by reference.
+
+        The registration is set up by the first holder only,
+        or again if it vanished meanwhile. Return `True` if
+        the current process holds a reference. Raise QemuError
+        if the registration of other holders differs in @qemu
+        or in the 'F' flag, as an arch is registered once.
+    """
+    result = []
+
+    def update(holders):
+        current = registration(arch)
+        if holders and current:
+            interpreter, current_flags = current
+            if interpreter != qemu or \
+               ('F' in current_flags) != ('F' in flags):
+                raise QemuError("%s is registered as '%s' with flags '%s' by "
+                                "others, not as '%s' with flags '%s'."
+                                % (arch, interpreter, current_flags, qemu, flags))
+
+        if holders and current or \
+           register_qemu_emulator(qemu, arch, flags):
+            result.append(True)
+            return holders + [os.getpid()]
+        else:
+            return holders
+
+    _update_refs(arch, update)
+    return bool(result)
+
+def release_qemu_emulator(qemu, arch, pid=None):
+    """ Drop a reference to the @arch registration.
+
+        The reference is held by @pid, the current process by
+        default. The last holder unregisters the qemu emulator.
+    """
+    pid = pid or os.getpid()
+
+    def update(holders):
+        pid in holders and holders.remove(pid)
+        holders or unregister_qemu_emulator(qemu, arch)
+        return holders
+
+    _update_refs(arch, update)
+    return True
+
+def setup_qemu_emulator(rootdir, arch, register=True, fixbin=False, emulator=None):
     """ Install and register qemu emulator in @rootdir. 
 
         Statically-linked qemu emulator is expected to be
-        configured rather than dynamically-linked one.
+        configured rather than dynamically-linked one. If
+        @register is `False`, binfmt_misc is expected to be
+        configured by the caller. If @fixbin is `True`, the
+        host's emulator is registered with the 'F' flag and
+        nothing is installed in @rootdir.
+
+        @emulator picks the emulator, see pick_qemu_emulator.
+        It's installed under the arch's usual name, so that
+        rootdirs of an arch share the registration while each
+        runs its own emulator. With @fixbin, all rootdirs of
+        the arch have to pick the same emulator. Raise
+        QemuError if the arch is registered otherwise by
+        others, see acquire_qemu_emulator.
     """
     disable_selinux()
 
-    qemubase = "qemu-%s-static" % arch
+    entry = arches.lookup(arch)
+    if not entry:
+        return None
+
+    qemubase = entry.qemubase
     qemupath = os.path.join("/usr/bin/", qemubase)
+    srcpath = pick_qemu_emulator(arch, emulator, fixbin)
 
-    stat = install_qemu_emulator(rootdir, qemubase) and \
-           register_qemu_emulator(qemupath, arch)
+    if emulator and not srcpath:
+        stat = False
+    elif fixbin:
+        stat = srcpath and \
+               (not register or acquire_qemu_emulator(srcpath, arch, "F"))
+    else:
+        stat = install_qemu_emulator(rootdir, qemubase, srcpath=srcpath)
+        try:
+            stat = stat and (not register or acquire_qemu_emulator(qemupath, arch))
+        except QemuError:
+            uninstall_qemu_emulator(rootdir, qemubase)
+            raise
 
     if stat:
         return qemubase
     else:
         return None
 
-def unset_qemu_emulator(rootdir, qemubase):
+def unset_qemu_emulator(rootdir, qemubase, register=True, fixbin=False, arch=None):
     """ Unregister and remove qemu emulator in @rootdir. 
 
-        Qemu emulator is expected in @rootdir/usr/bin.
+        Qemu emulator is expected in @rootdir/usr/bin, unless
+        @fixbin is `True`. If @register is `False`, binfmt_misc
+        is left untouched. @arch is told by @qemubase unless
+        given.
     """
-    arch = re.match("qemu-(\w*)-static", qemubase).group(1)
+    arch = arch or re.match("qemu-(\w*)-static", qemubase).group(1)
     qemupath = os.path.join("/usr/bin/", qemubase)
 
-    return unregister_qemu_emulator(qemupath, arch) and \
-           uninstall_qemu_emulator(rootdir, qemubase)
+    return (not register or release_qemu_emulator(qemupath, arch)) and \
+           (fixbin or uninstall_qemu_emulator(rootdir, qemubase))
 
 setup = setup_qemu_emulator
 unset = unset_qemu_emulator
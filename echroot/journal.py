@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import errno
+import fcntl
+import shutil
+
+from echroot import fs
+from echroot.interp import qemu
+
+""" Where to keep journals of read-only rootdirs.
+"""
+JOURNALDIR = "/var/lib/echroot/journal"
+
+class JournalError(Exception):
+    """ Base exception class for Journal class. """
+    pass
+
+def _escape(field):
+    return str(field).encode("string_escape")
+
+def _unescape(field):
+    return field.decode("string_escape")
+
+def _umount_all(path, rounds=16):
+    """ Lazily unmount everything stacked on @path.
+
+        umount2(2) fails at once if nothing is mounted there,
+        so no mount table is needed.
+    """
+    for _ in range(rounds):
+        try:
+            fs.mount.umount(path, fs.mount.MNT_DETACH)
+        except OSError:
+            break
+
+def _undo_bind(newdir):
+    _umount_all(newdir)
+
+def _undo_dup(dstfile, bakfile, existed):
+    _umount_all(dstfile)
+
+    if os.path.lexists(bakfile):
+        os.path.lexists(dstfile) and os.unlink(dstfile)
+        os.rename(bakfile, dstfile)
+
+    # dstfile was created as mountpoint or for the backup
+    if existed == "0" and os.path.isfile(dstfile) and \
+       not os.path.islink(dstfile) and os.path.getsize(dstfile) == 0:
+        os.unlink(dstfile)
+
+def _undo_point(pointpath, toppath):
+    fs.aux.remove_point(pointpath, toppath)
+
+def _undo_qemu(qemupath):
+    _umount_all(qemupath)
+    os.path.lexists(qemupath) and os.unlink(qemupath)
+
+def _undo_binfmt(arch, pid):
+    qemu.release_qemu_emulator(None, arch, int(pid))
+
+def _undo_overlay(merged):
+    _umount_all(merged)
+
+    # never descend into a merged view still showing rootdir
+    basedir = os.path.dirname(merged)
+    if os.path.basename(basedir).startswith("echroot-overlay-") and \
+       not os.path.ismount(merged):
+        _umount_all(basedir)
+        shutil.rmtree(basedir, ignore_errors=True)
+
+""" How to undo each kind of record.
+"""
+UNDOS = { "bind"    : _undo_bind,
+          "dup"     : _undo_dup,
+          "point"   : _undo_point,
+          "qemu"    : _undo_qemu,
+          "binfmt"  : _undo_binfmt,
+          "overlay" : _undo_overlay, }
+
+class Journal(object):
+    """ Append-only record of what was set up in a rootdir.
+
+        Each setup action is recorded before it's done, as a
+        line of tab-separated fields, so that a killed echroot
+        can be cleaned up by undoing its records in reverse.
+        Undoing a record which wasn't done is harmless.
+
+        Records of actions which survive a reboot, i.e. files
+        written into rootdir, are fsync'ed. Mounts and binfmt
+        registrations vanish with the kernel, so writing their
+        records is enough to outlive a crashed process.
+
+        Every process has its own journal beside rootdir's
+        lock, named after its PID, and removes it after a
+        clean teardown.
+    """
+
+    SYNCED = ( "dup",
+               "point",
+               "qemu", )
+
+    def __init__(self, rootdir, pid=None):
+        """ Prepare the journal of @rootdir for @pid. """
+        self._rootdir = os.path.realpath(rootdir)
+        self._pid = pid or os.getpid()
+        self._path = os.path.join(self._rootdir, "%s%d" % (_prefix(self._rootdir),
+                                                          self._pid))
+        self._fd = None
+
+    @property
+    def path(self):
+        return self._path
+
+    def _open(self):
+        """ Open the journal for appending.
+
+            On a read-only filesystem, the journal is moved to
+            JOURNALDIR under a name derived from rootdir.
+        """
+        if self._fd is not None:
+            return self._fd
+
+        oflags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+        try:
+            self._fd = os.open(self._path, oflags, 0644)
+        except OSError, err:
+            if err.errno != errno.EROFS:
+                raise
+            os.path.isdir(JOURNALDIR) or os.makedirs(JOURNALDIR)
+            self._path = os.path.join(JOURNALDIR, "%s%d" %
+                                      (_spare_prefix(self._rootdir), self._pid))
+            self._fd = os.open(self._path, oflags, 0644)
+
+        flags = fcntl.fcntl(self._fd, fcntl.F_GETFD)
+        fcntl.fcntl(self._fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+        return self._fd
+
+    def record(self, action, *args):
+        """ Append a record of @action with @args.
+
+            Raise JournalError if it can't be written.
+        """
+        line = '\t'.join([action] + [_escape(arg) for arg in args]) + '\n'
+
+        try:
+            fd = self._open()
+            os.write(fd, line)
+            action in self.SYNCED and os.fsync(fd)
+        except OSError, err:
+            raise JournalError("journal: cann't record %s: %s." % (action, err))
+
+    def close(self, clean=True):
+        """ Close the journal, removing it if @clean. """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+        if clean and os.path.lexists(self._path):
+            os.unlink(self._path)
+
+
+def _prefix(rootdir):
+    return ".%s.journal." % os.path.basename(rootdir)
+
+def _spare_prefix(rootdir):
+    return "%s.journal." % rootdir.replace('/', '%')
+
+def journals(rootdir):
+    """ Return (path, pid) of journals of @rootdir. """
+    rootdir = os.path.realpath(rootdir)
+    found = []
+
+    for dirpath, prefix in ((rootdir, _prefix(rootdir)),
+                            (JOURNALDIR, _spare_prefix(rootdir))):
+        try:
+            names = os.listdir(dirpath)
+        except OSError:
+            continue
+
+        for name in names:
+            pid = name[len(prefix):]
+            if name.startswith(prefix) and pid.isdigit():
+                found.append((os.path.join(dirpath, name), int(pid)))
+
+    return found
+
+def replay(path):
+    """ Undo the records of journal @path in reverse.
+
+        Every record is undone even if some fail. Return the
+        number of records undone.
+    """
+    with open(path) as journalfs:
+        lines = journalfs.read().splitlines()
+
+    count = 0
+    for line in reversed(lines):
+        fields = line.split('\t')
+        undo = UNDOS.get(fields[0])
+        if not undo:
+            continue
+        try:
+            undo(*[_unescape(field) for field in fields[1:]])
+            count = count + 1
+        except (OSError, IOError, TypeError, ValueError):
+            pass
+
+    return count
+
+def recover(rootdir, force=False):
+    """ Undo what dead echroots left set up in @rootdir.
+
+        Journals of living processes are skipped unless @force
+        is `True`. A journal is claimed by renaming it first,
+        so that concurrent recoveries don't replay it twice.
+        Return the number of records undone.
+    """
+    count = 0
+
+    for path, pid in journals(rootdir):
+        if pid == os.getpid() or \
+           not force and os.path.exists("/proc/%d" % pid):
+            continue
+
+        claimed = "%s.%d" % (path, os.getpid())
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            continue
+
+        try:
+            count = count + replay(claimed)
+        finally:
+            os.unlink(claimed)
+
+    return count
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import errno
+import select
+import signal
+
+CHUNK = 64 << 10
+MAXLINE = 1 << 20
+
+class ProcessError(Exception):
+    """ Base exception class for Process class. """
+    pass
+
+class ProcessTimeout(ProcessError):
+    """ Raised when a process outlives its timeout. """
+    pass
+
+class Process(object):
+    """ Represent a command running in a rootdir.
+
+        The command's stdout and stderr are pipes, which are
+        read incrementally through 'chunks' or 'lines', so that
+        output of any size streams through with bounded memory.
+        Their file descriptors are exposed by 'fileno' for
+        event loops of the caller. Once the command is done,
+        a finishing callback is called, e.g. to tear the
+        rootdir down.
+    """
+
+    def __init__(self, proc, timeout=None, finish=None):
+        """ Wrap subprocess.Popen @proc.
+
+            If @timeout isn't `None`, the command is killed
+            when it runs for longer than @timeout seconds, and
+            ProcessTimeout is raised.
+        """
+        self._proc = proc
+        self._finish = finish
+        self._deadline = timeout is not None and time.time() + timeout or None
+
+        self._streams = {}
+        for name in ("stdout", "stderr"):
+            pipe = getattr(proc, name)
+            pipe and self._streams.setdefault(pipe.fileno(), (name, pipe))
+
+    @property
+    def pid(self):
+        return self._proc.pid
+
+    @property
+    def stdin(self):
+        """ Pipe to the command's stdin, if requested. """
+        return self._proc.stdin
+
+    @property
+    def returncode(self):
+        """ Exit status, or `None` while running.
+
+            A negative value -N means killed by signal N.
+        """
+        return self._proc.returncode
+
+    def fileno(self, name="stdout"):
+        """ Return the fd of stream @name, or `None` at EOF. """
+        for fd, (stream, pipe) in self._streams.items():
+            if stream == name:
+                return fd
+        else:
+            return None
+
+    def _remaining(self):
+        """ Return seconds left before the deadline. """
+        if self._deadline is None:
+            return None
+
+        remaining = self._deadline - time.time()
+        if remaining <= 0:
+            self.kill()
+            self._proc.wait()
+            self._done()
+            raise ProcessTimeout("process %d timed out." % self.pid)
+
+        return remaining
+
+    def chunks(self, size=CHUNK):
+        """ Yield (stream, data) as output arrives.
+
+            stream is "stdout" or "stderr", and data holds at
+            most @size bytes. Stop at EOF of both streams.
+        """
+        while self._streams:
+            try:
+                ready = select.select(list(self._streams), [], [],
+                                      self._remaining())[0]
+            except select.error, err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fd in ready:
+                name, pipe = self._streams[fd]
+                data = os.read(fd, size)
+                if data:
+                    yield name, data
+                else:
+                    del self._streams[fd]
+                    pipe.close()
+
+    def lines(self, maxline=MAXLINE):
+        """ Yield (stream, line) as output arrives.
+
+            Lines keep their newline. Lines longer than
+            @maxline are yielded in pieces, to bound memory.
+        """
+        pending = { "stdout" : "",
+                    "stderr" : "", }
+
+        for name, data in self.chunks():
+            buf, start = pending[name] + data, 0
+            while True:
+                end = buf.find('\n', start)
+                if end < 0:
+                    break
+                yield name, buf[start:end + 1]
+                start = end + 1
+
+            buf = buf[start:]
+            while len(buf) >= maxline:
+                yield name, buf[:maxline]
+                buf = buf[maxline:]
+            pending[name] = buf
+
+        for name in ("stdout", "stderr"):
+            if pending[name]:
+                yield name, pending[name]
+
+    __iter__ = lines
+
+    def poll(self):
+        """ Return the exit status, or `None` while running. """
+        if self._proc.poll() is not None:
+            self._done()
+
+        return self._proc.returncode
+
+    def wait(self):
+        """ Wait for the command and return its exit status.
+
+            Output not read yet is discarded.
+        """
+        for _ in self.chunks():
+            pass
+
+        while self._deadline is not None and self._proc.poll() is None:
+            time.sleep(min(0.05, self._remaining()))
+
+        self._proc.wait()
+        self._done()
+
+        return self._proc.returncode
+
+    def kill(self, signum=signal.SIGKILL):
+        """ Send @signum to the command. """
+        try:
+            self._proc.poll() is None and os.kill(self.pid, signum)
+        except OSError:
+            pass
+
+    def close(self):
+        """ Kill the command if still running, and finish. """
+        self.kill()
+        self._proc.wait()
+        self._done()
+
+    def _done(self):
+        """ Release the pipes and call the finishing callback once. """
+        for name, pipe in self._streams.values():
+            pipe.close()
+        self._streams = {}
+
+        self._proc.stdin and self._proc.stdin.close()
+
+        finish, self._finish = self._finish, None
+        finish and finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, v, tb):
+        self.close()
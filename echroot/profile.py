@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import stat
+import json
+import hashlib
+
+from echroot.fs import aux
+from echroot.fs.bind import Binding
+from echroot.fs.dup import Dupping, DuppingError
+from echroot.utils.cache import FileCache, file_id
+
+try:
+    import toml
+except ImportError:
+    toml = None
+
+_plancache = FileCache("plans.json")
+
+""" Built-in profiles, besides the default one of Chroot.
+"""
+PROFILES = {
+    "minimal" : { "binds" : [ "/proc/:/proc/",
+                              "/sys/:/sys/",
+                              "/dev/:/dev/",
+                              "/dev/pts/:/dev/pts/",
+                              "/dev/shm/:/dev/shm/", ],
+                  "dups"  : [ "/etc/resolv.conf:/etc/resolv.conf", ], },
+    "bare"    : { "binds" : [ "/proc/:/proc/",
+                              "/dev/:/dev/", ],
+                  "dups"  : [], },
+}
+
+KEYS = ( "binds",
+         "dups",
+         "env",
+         "interp", )
+
+class ProfileError(Exception):
+    """ Base exception class for profiles. """
+    pass
+
+def _split(entry, what):
+    """ Split a bind or dup @entry into a list of fields.
+
+        An entry is a "SRC[:DST[:OPTION]...]" string as in
+        Chroot.DIRBINDS, or an object with 'source', 'target'
+        and 'options' keys.
+    """
+    if isinstance(entry, basestring):
+        fields = [field.strip() for field in entry.split(':')]
+    elif isinstance(entry, dict) and "source" in entry:
+        fields = [entry["source"], entry.get("target", entry["source"])]
+        fields.extend(entry.get("options", []))
+    else:
+        raise ProfileError("profile: bad %s entry %r." % (what, entry))
+
+    if not fields[0]:
+        raise ProfileError("profile: bad %s entry %r." % (what, entry))
+    if len(fields) < 2 or not fields[1]:
+        fields[1:2] = [fields[0]]
+
+    return [str(field) for field in fields]
+
+def normalize(profile):
+    """ Check @profile and return it with all keys filled in.
+
+        Binds and dups are split into lists of fields, env
+        maps names to values or `None` to unset them, and
+        interp may tell 'binfmt' and 'fixbin', the 'qemu'
+        emulator, its 'cpu' model and its 'env'.
+    """
+    if not isinstance(profile, dict):
+        raise ProfileError("profile: not a table.")
+
+    unknown = [key for key in profile if key not in KEYS]
+    if unknown:
+        raise ProfileError("profile: unknown key '%s'." % unknown[0])
+
+    env = profile.get("env") or {}
+    interp = profile.get("interp") or {}
+    if not isinstance(env, dict) or not isinstance(interp, dict):
+        raise ProfileError("profile: 'env' and 'interp' must be tables.")
+
+    interps = {}
+    for key, value in interp.items():
+        if key in ("binfmt", "fixbin"):
+            interps[str(key)] = bool(value)
+        elif key in ("qemu", "cpu"):
+            interps[str(key)] = str(value)
+        elif key == "env" and isinstance(value, dict):
+            interps[str(key)] = dict((str(name), str(val))
+                                     for name, val in value.items())
+        elif key == "env":
+            raise ProfileError("profile: interp 'env' must be a table.")
+        else:
+            raise ProfileError("profile: unknown interp key '%s'." % key)
+
+    envs = {}
+    for name, value in env.items():
+        envs[str(name)] = value is not None and str(value) or value
+
+    return { "binds"  : [_split(entry, "bind") for entry in profile.get("binds", [])],
+             "dups"   : [_split(entry, "dup") for entry in profile.get("dups", [])],
+             "env"    : envs,
+             "interp" : interps, }
+
+def load(profile):
+    """ Load @profile, a built-in name or a JSON/TOML file.
+
+        Return the normalized profile. Raise ProfileError if
+        it can't be loaded.
+    """
+    if profile in PROFILES:
+        return normalize(PROFILES[profile])
+
+    if not os.path.isfile(profile):
+        raise ProfileError("profile: '%s' isn't a built-in or file." % profile)
+
+    try:
+        with open(profile) as profilefs:
+            if profile.endswith(".toml"):
+                if not toml:
+                    raise ProfileError("profile: TOML needs the toml module.")
+                data = toml.load(profilefs)
+            else:
+                data = json.load(profilefs)
+    except ProfileError:
+        raise
+    except Exception, err:
+        raise ProfileError("profile: cann't load '%s': %s." % (profile, err))
+
+    return normalize(data)
+
+def _kind(path):
+    """ Return what @path is, or `None` if it doesn't exist.
+
+        Symbolic links are told along with their target.
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+
+    if stat.S_ISLNK(st.st_mode):
+        return "l" + os.readlink(path)
+    elif stat.S_ISDIR(st.st_mode):
+        return "d"
+    elif stat.S_ISREG(st.st_mode):
+        return "f"
+    else:
+        return "o"
+
+def _prefixes(path):
+    """ Yield '/a', '/a/b', ... of absolute @path. """
+    parts = [part for part in path.split('/') if part]
+    for ind in range(1, len(parts) + 1):
+        yield '/' + '/'.join(parts[:ind])
+
+class Plan(object):
+    """ Bindings and duppings of a profile, resolved in advance.
+
+        Paths are canonicalized once, inside rootdir as seen
+        from within, and entries which can't apply are pruned,
+        e.g. binds of missing host directories. Rootdir paths
+        are kept relative, so that a plan also applies to an
+        overlay's merged view of rootdir.
+
+        A plan records what every prefix of the paths it
+        resolved was, so that it's validated by lstat(2) alone
+        until the host or rootdir changes.
+    """
+
+    def __init__(self, binds, dups, probes):
+        self._binds = binds
+        self._dups = dups
+        self._probes = probes
+
+    @classmethod
+    def compile(cls, profile, rootdir):
+        """ Resolve normalized @profile for @rootdir. """
+        rootdir = os.path.realpath(rootdir)
+        binds, dups, probes = [], [], {}
+
+        def probe(path, inroot=False):
+            for prefix in _prefixes(path):
+                key = (inroot and '@' or '') + prefix
+                probes[key] = _kind(inroot and rootdir + prefix or prefix)
+
+        for fields in profile["binds"]:
+            olddir = os.path.expanduser(fields[0])
+            newdir = aux.cano_path(fields[1])
+            probe(olddir)
+            probe(os.path.expanduser(fields[1]))
+            probe(newdir, True)
+
+            olddir = aux.cano_path(olddir)
+            newdir = aux.root_path(newdir, rootdir)
+            probe(newdir[len(rootdir):], True)
+            if not os.path.isdir(olddir) or \
+               os.path.exists(newdir) and not os.path.isdir(newdir):
+                continue
+            binds.append([olddir, newdir[len(rootdir):] or '/'] + fields[2:])
+
+        for fields in profile["dups"]:
+            srcfile = aux.norm_path(fields[0])
+            dstfile = aux.norm_path(fields[1])
+            probe(srcfile)
+            probe(dstfile, True)
+
+            hostdst = aux.norm_path(dstfile, rootdir)
+            if not os.path.isfile(srcfile) or \
+               os.path.lexists(hostdst) and not os.path.isfile(hostdst):
+                continue
+            dups.append([srcfile, dstfile])
+
+        return cls(binds, dups, probes)
+
+    @classmethod
+    def from_dict(cls, entry):
+        # JSON gives unicode, which ctypes passes to mount(2)
+        # as wide strings
+        strs = lambda fields: [str(field) for field in fields]
+        return cls([strs(fields) for fields in entry["binds"]],
+                   [strs(fields) for fields in entry["dups"]],
+                   entry["probes"])
+
+    def to_dict(self):
+        return { "binds"  : self._binds,
+                 "dups"   : self._dups,
+                 "probes" : self._probes, }
+
+    def valid(self, rootdir):
+        """ Test if nothing the plan relies on changed. """
+        rootdir = os.path.realpath(rootdir)
+
+        for key, kind in self._probes.iteritems():
+            path = key.startswith('@') and rootdir + key[1:] or key
+            if _kind(path) != kind:
+                return False
+
+        return True
+
+    def bindings(self, rootdir, skips=()):
+        """ Yield Bindings in @rootdir, skipping olddirs @skips. """
+        rootdir = os.path.realpath(rootdir)
+
+        for fields in self._binds:
+            if fields[0] in skips:
+                continue
+            newdir = os.path.join(rootdir, fields[1].lstrip('/'))
+            yield Binding.resolved(fields[0], newdir, *fields[2:])
+
+    def duppings(self, rootdir):
+        """ Yield Duppings in @rootdir. """
+        for srcfile, dstfile in self._dups:
+            try:
+                yield Dupping(srcfile, aux.norm_path(dstfile, rootdir))
+            except DuppingError:
+                continue
+
+def plan(profile, rootdir, cache=True):
+    """ Return the Plan of normalized @profile for @rootdir.
+
+        If @cache is `True`, plans are kept on disk, keyed by
+        the content of @profile and by rootdir, and reused
+        while valid.
+    """
+    if not cache:
+        return Plan.compile(profile, rootdir)
+
+    spec = json.dumps([profile["binds"], profile["dups"]], sort_keys=True)
+    key = "%s:%s" % (os.path.realpath(rootdir), hashlib.sha1(spec).hexdigest())
+    root = (file_id(rootdir) or [None, None])[:2]
+    entry = _plancache.get(key)
+
+    if entry and entry["root"] == root:
+        compiled = Plan.from_dict(entry)
+        if compiled.valid(rootdir):
+            return compiled
+
+    compiled = Plan.compile(profile, rootdir)
+    entry = compiled.to_dict()
+    entry["root"] = root
+    _plancache.set(key, entry)
+    _plancache.save()
+
+    return compiled
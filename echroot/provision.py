@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import shutil
+import hashlib
+import tarfile
+import operator
+import threading
+import subprocess
+
+from echroot import fs
+from echroot.utils.cache import CACHEDIR, FileCache, file_id
+from echroot.utils.flock import FileLock
+
+ROOTFSDIR = os.path.join(CACHEDIR, "rootfs")
+
+""" Archives which tarfile can't decompress by itself.
+
+    Keys are leading magic bytes, values are commands
+    decompressing stdin to stdout.
+"""
+DECOMPRESSORS = { "\xfd7zXZ\x00"       : ["xz", "-dc"],
+                  "\x28\xb5\x2f\xfd"   : ["zstd", "-dc"], }
+
+class ProvisionError(Exception):
+    """ Base exception class for provisioning. """
+    pass
+
+class HashingReader(object):
+    """ File wrapper hashing everything read through it. """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._hasher = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self._hasher.update(data)
+        return data
+
+    def drain(self, bufsize=1 << 20):
+        """ Hash the rest of the file. """
+        while self.read(bufsize):
+            pass
+
+    def hexdigest(self):
+        return self._hasher.hexdigest()
+
+def _safe(name):
+    """ Test if member @name stays inside the extraction directory. """
+    parts = name.split('/')
+    return not name.startswith('/') and ".." not in parts
+
+def _inside(name, rootdir):
+    """ Return member @name with its parent resolved in @rootdir.
+
+        Symlinks extracted before are followed as seen from
+        within @rootdir, rather than by the host. Raise
+        ProvisionError if the result still leaves @rootdir.
+    """
+    realroot = os.path.realpath(rootdir)
+    parent = fs.aux.root_path(os.path.dirname(name), realroot)
+    if not (os.path.realpath(parent) + '/').startswith(realroot + '/'):
+        raise ProvisionError("provision: unsafe member '%s'." % name)
+
+    return os.path.relpath(os.path.join(parent, os.path.basename(name)), realroot)
+
+def _resolve(tarinfo, rootdir):
+    """ Return a copy of @tarinfo safe to extract into @rootdir.
+
+        Members are extracted one at a time, so a member under
+        a symlink extracted before would otherwise be written
+        through it, and so would a hardlink. Raise
+        ProvisionError for an unsafe member.
+    """
+    for name in (tarinfo.name, tarinfo.islnk() and tarinfo.linkname or ""):
+        if not _safe(name):
+            raise ProvisionError("provision: unsafe member '%s'." % name)
+
+    tarinfo = copy.copy(tarinfo)
+    tarinfo.name = _inside(tarinfo.name, rootdir)
+    if tarinfo.islnk():
+        tarinfo.linkname = _inside(tarinfo.linkname, rootdir)
+
+    # a file replacing a symlink mustn't be written through it
+    path = os.path.join(rootdir, tarinfo.name)
+    tarinfo.isdir() or not os.path.islink(path) or os.unlink(path)
+
+    return tarinfo
+
+def _set_xattrs(tarinfo, path):
+    """ Restore extended attributes kept in PAX headers.
+
+        Attributes which can't be set, e.g. on a filesystem
+        without xattrs, are skipped.
+    """
+    for key, value in tarinfo.pax_headers.items():
+        if key.startswith("SCHILY.xattr."):
+            name = key[len("SCHILY.xattr."):].encode("utf-8")
+            try:
+                fs.aux.set_xattr(path, name, value.encode("utf-8"))
+            except OSError:
+                pass
+
+def extract(tar, rootdir):
+    """ Extract stream @tar into @rootdir in a single pass.
+
+        Device nodes, ownership, hardlinks and xattrs are kept.
+        As TarFile.extractall does, directories are created
+        writable and get their attributes at the end. Members
+        never leave @rootdir, see '_resolve'.
+    """
+    directories = []
+
+    for tarinfo in tar:
+        tarinfo = _resolve(tarinfo, rootdir)
+
+        if tarinfo.isdir():
+            directories.append(tarinfo)
+            tarinfo = copy.copy(tarinfo)
+            tarinfo.mode = 0700
+
+        tar.extract(tarinfo, rootdir)
+        tarinfo.isdir() or _set_xattrs(tarinfo, os.path.join(rootdir, tarinfo.name))
+
+    directories.sort(key=operator.attrgetter("name"), reverse=True)
+    for tarinfo in directories:
+        dirpath = os.path.join(rootdir, tarinfo.name)
+        tar.chown(tarinfo, dirpath)
+        tar.utime(tarinfo, dirpath)
+        tar.chmod(tarinfo, dirpath)
+        _set_xattrs(tarinfo, dirpath)
+
+def _feed(reader, stdin, bufsize=1 << 20):
+    """ Copy @reader into the decompressor's @stdin. """
+    try:
+        while True:
+            data = reader.read(bufsize)
+            if not data: break
+            stdin.write(data)
+    except IOError:
+        pass
+    finally:
+        stdin.close()
+
+def unpack(archive, rootdir):
+    """ Stream-extract @archive into @rootdir.
+
+        gzip and bzip2 are decompressed by tarfile, xz and
+        zstd through external decompressors. The archive is
+        hashed while being read. Return its sha256 digest.
+    """
+    with open(archive, 'rb') as fileobj:
+        magic = fileobj.read(8)
+        fileobj.seek(0)
+        reader = HashingReader(fileobj)
+
+        for prefix, command in DECOMPRESSORS.items():
+            if magic.startswith(prefix):
+                break
+        else:
+            command = None
+
+        if not command:
+            with tarfile.open(fileobj=reader, mode="r|*") as tar:
+                extract(tar, rootdir)
+            reader.drain()
+            return reader.hexdigest()
+
+        try:
+            proc = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE)
+        except OSError, err:
+            raise ProvisionError("provision: cann't run %s: %s." % (command[0], err))
+
+        feeder = threading.Thread(target=_feed, args=(reader, proc.stdin))
+        feeder.start()
+
+        try:
+            with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+                extract(tar, rootdir)
+            proc.stdout.read()
+        finally:
+            feeder.join()
+            proc.wait()
+
+        if proc.returncode != 0:
+            raise ProvisionError("provision: %s failed." % command[0])
+
+        return reader.hexdigest()
+
+class Provisioner(object):
+    """ Provide extracted rootfs trees from tarballs.
+
+        Trees are cached under @cachedir by the sha256 digest
+        of their archive, and digests are remembered by archive
+        identity, so that providing the same archive again is
+        a couple of stats. Concurrent requests for the same
+        archive wait for a single extraction.
+    """
+
+    def __init__(self, cachedir=ROOTFSDIR):
+        self._cachedir = cachedir
+        self._digests = FileCache("digests.json", cachedir)
+
+    def _cached(self, archive):
+        """ Return the cached rootdir of @archive, or `None`. """
+        entry = self._digests.get(os.path.realpath(archive))
+        if not entry or entry["id"] != file_id(archive):
+            return None
+
+        rootdir = os.path.join(self._cachedir, entry["digest"])
+        return os.path.isdir(rootdir) and rootdir or None
+
+    def provide(self, archive):
+        """ Return a rootdir holding the contents of @archive.
+
+            Extract @archive unless it was already. Raise
+            ProvisionError if failed.
+        """
+        if not os.path.isfile(archive):
+            raise ProvisionError("provision: '%s' is not file." % archive)
+
+        rootdir = self._cached(archive)
+        if rootdir:
+            return rootdir
+
+        fs.aux.make_dirs(self._cachedir)
+        pending = hashlib.sha1(os.path.realpath(archive)).hexdigest()
+
+        with FileLock(os.path.join(self._cachedir, pending)):
+            # someone else may have extracted it meanwhile
+            self._digests = FileCache("digests.json", self._cachedir)
+            rootdir = self._cached(archive)
+            if rootdir:
+                return rootdir
+
+            archid = file_id(archive)
+            tmpdir = os.path.join(self._cachedir, ".%s.%d" % (pending, os.getpid()))
+            fs.aux.make_dirs(tmpdir)
+
+            try:
+                digest = unpack(archive, tmpdir)
+            # tarfile decodes PAX values as UTF-8, which binary
+            # xattrs such as security.capability aren't
+            except (tarfile.TarError, IOError, OSError, UnicodeError), err:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+                raise ProvisionError("provision: cann't extract '%s': %s." %
+                                     (archive, err))
+            except:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+                raise
+
+            rootdir = os.path.join(self._cachedir, digest)
+            try:
+                os.rename(tmpdir, rootdir)
+            except OSError:
+                # the same contents came from another archive
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+            self._digests.set(os.path.realpath(archive), { "id"     : archid,
+                                                           "digest" : digest, })
+            self._digests.save()
+
+        return rootdir
+
+
+def provide(archive, cachedir=ROOTFSDIR):
+    """ Return a rootdir holding the contents of @archive. """
+    return Provisioner(cachedir).provide(archive)
@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import errno
+import select
+import signal
+import socket
+import subprocess
+
+from echroot import client
+from echroot.chroot import Chroot, ChrootError
+from echroot.utils.flock import FileLock, FileLockError
+
+class SessionError(Exception):
+    """ Base exception class for Session class. """
+    pass
+
+class Session(object):
+    """ Represent a persistent chroot session.
+
+        A session prepares the environment of rootdir once
+        and keeps it warm in a background keeper process, so
+        that any number of commands can be executed against
+        it cheaply. The keeper owns the rootdir's FileLock:
+        it holds the lock exclusively during setup and
+        teardown and shares it with executed commands in
+        between. The session is torn down on 'stop' or after
+        being idle for @timeout seconds.
+
+        The keeper also listens on a Unix socket, and runs
+        commands sent by echroot.client in children of its
+        own, so that they needn't import or probe anything.
+    """
+
+    POLL = 1.0
+
+    def __init__(self, rootdir, timeout=None, **options):
+        """ Prepare for a session of @rootdir.
+
+            If @timeout is `None` or 0, the session lives until
+            'stop' is called. @options are passed on to Chroot
+            on 'start', and recorded for later 'execute' calls.
+        """
+        self._rootdir = rootdir
+        self._timeout = timeout
+        self._options = options
+        self._stopped = False
+
+        stamp = ".%s.session" % os.path.basename(rootdir)
+        self._stamp = os.path.join(rootdir, stamp)
+
+    def _touch(self):
+        """ Refresh the idle timer of this session. """
+        try:
+            os.utime(self._stamp, None)
+        except OSError:
+            pass
+
+    def _idle(self):
+        """ Return seconds since the session was used last. """
+        try:
+            return time.time() - os.stat(self._stamp).st_mtime
+        except OSError:
+            return 0
+
+    def _on_signal(self, signum, frame):
+        """ Ask the keeper loop to tear down. """
+        self._stopped = True
+
+    def _listen(self):
+        """ Listen on the socket of the session.
+
+            Return the listening socket, or `None` if it can't
+            be set up, in which case commands are only run by
+            'execute'.
+        """
+        sockpath = client.sock_path(self._rootdir)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            os.path.isdir(client.SOCKDIR) or os.makedirs(client.SOCKDIR, 0700)
+            os.path.lexists(sockpath) and os.unlink(sockpath)
+            listener.bind(sockpath)
+            listener.listen(64)
+        except (OSError, socket.error):
+            listener.close()
+            return None
+
+        return listener
+
+    def _unlisten(self, listener):
+        """ Stop listening on the socket of the session. """
+        if listener is None:
+            return
+
+        listener.close()
+        try:
+            os.unlink(client.sock_path(self._rootdir))
+        except OSError:
+            pass
+
+    def _accept(self, listener, echroot):
+        """ Wait POLL seconds for a client of @listener.
+
+            A client is served by a child process, which runs
+            its command in @echroot and is reaped later.
+        """
+        try:
+            while os.waitpid(-1, os.WNOHANG)[0]:
+                pass
+        except OSError:
+            pass
+
+        if listener is None:
+            time.sleep(self.POLL)
+            return
+
+        try:
+            if not select.select([listener], [], [], self.POLL)[0]:
+                return
+            conn = listener.accept()[0]
+        except (select.error, socket.error):
+            return
+
+        if os.fork() == 0:
+            status = 1
+            try:
+                listener.close()
+                for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                    signal.signal(signum, signal.SIG_DFL)
+                self._handle(conn, echroot)
+                status = 0
+            finally:
+                os._exit(status)
+
+        conn.close()
+
+    def _handle(self, conn, echroot):
+        """ Run the command requested over @conn in @echroot.
+
+            The request is followed by stdin and signals, and
+            output is sent back as it comes, then the exit
+            status. Like 'execute', the command holds the lock
+            of rootdir shared while it runs.
+        """
+        inbuf, queue, request = "", [], {}
+        while client.ENVIRON not in request:
+            if not queue:
+                data = conn.recv(client.CHUNK)
+                if not data:
+                    return
+                queue, inbuf = client.frames(inbuf + data)
+            else:
+                kind, data = queue.pop(0)
+                request[kind] = data
+
+        argv = client.command(request)
+
+        # the command runs with the client's environment
+        env = client.environ(request[client.ENVIRON])
+
+        with FileLock(self._rootdir, shared=True):
+            self._touch()
+            try:
+                proc = echroot.spawn(argv, env=env, stdin=subprocess.PIPE)
+            except ChrootError, err:
+                conn.sendall(client.frame(client.FAILED, str(err)))
+                return
+
+            # the command goes with its client
+            try:
+                status = self._relay(conn, proc, queue, inbuf)
+            except socket.error:
+                proc.close()
+                return
+            finally:
+                self._touch()
+
+        conn.sendall(client.frame(client.EXITED, str(status)))
+
+    def _relay(self, conn, proc, queue, inbuf):
+        """ Relay frames between @conn and Process @proc.
+
+            @queue holds frames received already, and @inbuf
+            the rest. Return the exit status of @proc.
+        """
+        outputs = { proc.fileno("stdout") : client.STDOUT,
+                    proc.fileno("stderr") : client.STDERR, }
+        stdin = proc.stdin
+        pending, eof = "", False
+
+        while outputs:
+            for kind, data in queue:
+                if kind == client.STDIN:
+                    pending, eof = pending + data, not data
+                elif kind == client.SIGNAL:
+                    proc.kill(int(data))
+            queue = []
+
+            if stdin and eof and not pending:
+                stdin.close()
+                stdin = None
+
+            # stop reading the client while stdin is backed up
+            rlist = list(outputs)
+            len(pending) < client.CHUNK and rlist.append(conn)
+            wlist = stdin and pending and [stdin] or []
+
+            try:
+                ready, writable = select.select(rlist, wlist, [])[:2]
+            except select.error, err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            if writable:
+                try:
+                    size = os.write(stdin.fileno(), pending[:select.PIPE_BUF])
+                    pending = pending[size:]
+                except OSError, err:
+                    if err.errno != errno.EPIPE:
+                        raise
+                    pending, eof = "", True
+
+            for fd in ready:
+                if fd is conn:
+                    data = conn.recv(client.CHUNK)
+                    if not data:
+                        raise socket.error(errno.EPIPE, "client hung up")
+                    queue, inbuf = client.frames(inbuf + data)
+                else:
+                    data = os.read(fd, client.CHUNK)
+                    if data:
+                        conn.sendall(client.frame(outputs[fd], data))
+                    else:
+                        del outputs[fd]
+
+        return proc.wait()
+
+    def _keep(self, flock, echroot, listener=None):
+        """ Wait util the session is stopped or idle. """
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, self._on_signal)
+
+        while not self._stopped:
+            if self._timeout and self._idle() >= self._timeout:
+                # commands still running hold the lock shared
+                try:
+                    flock.acquire(shared=False, blocking=False)
+                    break
+                except FileLockError:
+                    flock.acquire(shared=True)
+                    self._touch()
+
+            self._accept(listener, echroot)
+
+    def _serve(self, wfd):
+        """ Keeper body, running in a detached process.
+
+            Report 'OK' or an error message through @wfd once
+            the environment is ready.
+        """
+        echroot = Chroot(self._rootdir, **self._options)
+        flock = FileLock(self._rootdir)
+        listener = None
+
+        try:
+            flock.acquire()
+            try:
+                echroot.setup()
+                with open(self._stamp, 'w') as stampfs:
+                    json.dump({ "root"    : echroot.root,
+                                "options" : self._options, }, stampfs)
+                listener = self._listen()
+                flock.acquire(shared=True)
+                os.write(wfd, "OK")
+                os.close(wfd)
+                wfd = None
+
+                self._keep(flock, echroot, listener)
+
+            finally:
+                # kill running commands, so that they release
+                # the lock and the teardown can proceed
+                self._unlisten(listener)
+                echroot.kill()
+                flock.acquire(shared=False)
+                echroot.unset()
+                os.path.lexists(self._stamp) and os.unlink(self._stamp)
+                flock.release()
+
+        except (ChrootError, FileLockError), err:
+            wfd is not None and os.write(wfd, str(err))
+
+    def owner(self):
+        """ Return PID of the keeper process, or `None`. """
+        if not os.path.lexists(self._stamp):
+            return None
+
+        return FileLock(self._rootdir).owner()
+
+    def _state(self):
+        """ Return the state recorded by the keeper. """
+        try:
+            with open(self._stamp) as stampfs:
+                return json.load(stampfs)
+        except (IOError, ValueError):
+            return {}
+
+    def root(self):
+        """ Return the directory commands are chrooted into. """
+        return self._state().get("root", self._rootdir)
+
+    def options(self):
+        """ Return Chroot options the session was started with. """
+        options = self._state().get("options", {})
+        return dict((str(key), value) for key, value in options.items())
+
+    def alive(self):
+        """ Test if the session is started and running. """
+        return self.owner() is not None
+
+    def start(self):
+        """ Start the session.
+
+            Fork a detached keeper process which sets up the
+            environment. Return once it is ready.
+        """
+        if self.alive():
+            raise SessionError("session: '%s' already started." % self._rootdir)
+
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+
+        if pid == 0:
+            os.close(rfd)
+            os.setsid()
+            if os.fork() == 0:
+                devnull = os.open(os.devnull, os.O_RDWR)
+                for fd in (0, 1, 2):
+                    os.dup2(devnull, fd)
+                try:
+                    self._serve(wfd)
+                finally:
+                    os._exit(0)
+            os._exit(0)
+
+        os.close(wfd)
+        os.waitpid(pid, 0)
+
+        msg = ""
+        while True:
+            buf = os.read(rfd, 512)
+            if not buf: break
+            msg = msg + buf
+        os.close(rfd)
+
+        if msg != "OK":
+            raise SessionError("session: %s" % (msg or "keeper exited."))
+
+    def execute(self, execute=("/bin/sh",)):
+        """ Run @execute in the started session.
+
+            Return the exit status of @execute.
+        """
+        with FileLock(self._rootdir, shared=True):
+            if not self.alive():
+                raise SessionError("session: '%s' not started." % self._rootdir)
+
+            self._touch()
+            try:
+                echroot = Chroot(self.root(), execute, **self.options())
+                return echroot.execute()
+            finally:
+                self._touch()
+
+    def stop(self, timeout=None):
+        """ Stop the session and wait for the teardown. """
+        pid = self.owner()
+        if pid is None:
+            raise SessionError("session: '%s' not started." % self._rootdir)
+
+        os.kill(pid, signal.SIGTERM)
+
+        start_time = time.time()
+        while self.owner() == pid:
+            if timeout is not None and time.time() - start_time >= timeout:
+                raise SessionError("session: failed to stop '%s'." % self._rootdir)
+            time.sleep(0.05)
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import flock
-import runner
+from echroot import lazy
 
-__all__ = ['flock', 'runner']
+__all__ = ['cache', 'flock', 'runner', 'timing', 'proctrack']
+
+# submodules are imported on first use
+lazy(__name__)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import tempfile
+
+CACHEDIR = "/var/cache/echroot"
+
+def file_id(filepath, follow=True):
+    """ Return the identity of a file.
+
+        The identity is a list of device, inode, size and
+        mtime, which changes whenever the file is replaced or
+        modified. Return `None` if @filepath doesn't exist.
+    """
+    try:
+        st = follow and os.stat(filepath) or os.lstat(filepath)
+    except OSError:
+        return None
+
+    return [st.st_dev, st.st_ino, st.st_size, st.st_mtime]
+
+def boot_id():
+    """ Return the random ID of the current boot. """
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as bootfs:
+            return bootfs.read().strip()
+    except IOError:
+        return None
+
+class FileCache(object):
+    """ Persistent cache of JSON values.
+
+        The cache is a JSON file under CACHEDIR, loaded at
+        the first access and replaced atomically on 'save'.
+        Failures to read or write it are ignored, so it works
+        as a pure optimization, e.g. when run without
+        permission on CACHEDIR.
+    """
+
+    def __init__(self, name, cachedir=CACHEDIR):
+        """ Prepare the cache stored as @cachedir/@name. """
+        self._path = os.path.join(cachedir, name)
+        self._data = None
+        self._dirty = False
+
+    def _load(self):
+        """ Load the cache file once. """
+        if self._data is None:
+            try:
+                with open(self._path) as cachefs:
+                    self._data = json.load(cachefs)
+            except (IOError, ValueError):
+                self._data = {}
+
+            if not isinstance(self._data, dict):
+                self._data = {}
+
+        return self._data
+
+    def get(self, key, default=None):
+        return self._load().get(key, default)
+
+    def set(self, key, value):
+        self._load()[key] = value
+        self._dirty = True
+
+    def pop(self, key, default=None):
+        self._dirty = key in self._load() or self._dirty
+        return self._load().pop(key, default)
+
+    def save(self):
+        """ Write the cache back if it was changed. """
+        if not self._dirty:
+            return
+
+        cachedir = os.path.dirname(self._path)
+        try:
+            os.path.isdir(cachedir) or os.makedirs(cachedir)
+            tmpfd, tmpfp = tempfile.mkstemp(dir=cachedir, prefix=".tmp")
+        except OSError:
+            return
+
+        try:
+            # json.dump encodes in pure Python, unlike json.dumps
+            with os.fdopen(tmpfd, 'w') as cachefs:
+                cachefs.write(json.dumps(self._data))
+            os.rename(tmpfp, self._path)
+        except (IOError, OSError):
+            os.path.lexists(tmpfp) and os.unlink(tmpfp)
+            return
+
+        self._dirty = False
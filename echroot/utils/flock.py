@@ -4,6 +4,11 @@
 import os
 import time
 import errno
+import fcntl
+
+""" Where to lock files on read-only filesystems.
+"""
+LOCKDIR = "/var/run/echroot/locks"
 
 class FileLockError(Exception): 
     """ Base exception class for FileLock class"""
@@ -35,20 +40,27 @@ class PidFileLock(object):
         self._lockid = os.getpid()
         self._timeout = timeout
 
-    def locked(self):
-        """ Test if @self is the lock's owner.
+    def owner(self):
+        """ Return the PID recorded in the lock's file.
 
-            Return `True` if the current process ID matches
-            the PID recorded in the target lock's file.
+            Return `None` if the lock isn't held by anyone.
         """
         try:
             lockfs = open(self._lockfp, 'r')
             lockid = int(lockfs.readline().strip())
             lockfs.close()
         except:
-            lockid = -1
+            lockid = None
 
-        return self._lockid == lockid
+        return lockid
+
+    def locked(self):
+        """ Test if @self is the lock's owner.
+
+            Return `True` if the current process ID matches
+            the PID recorded in the target lock's file.
+        """
+        return self._lockid == self.owner()
 
     def acquire(self):
         """ Acquire the lock.
@@ -108,4 +120,187 @@ class PidFileLock(object):
         except:
             pass
 
-FileLock = PidFileLock
+class FlockFileLock(object):
+    """ FileLock implemented via flock(2).
+
+        The lock's file is locked through flock(2), so that
+        waiters wake up as soon as the lock is released and the
+        kernel drops the lock of a crashed owner by itself. The
+        exclusive owner records its PID in the file, which is
+        only informational and checked for liveness by 'owner'.
+
+        Many shared (reader) holders may hold the lock at once,
+        while an exclusive holder (e.g. setup or teardown)
+        excludes everyone else.
+    """
+
+    def __init__(self, fpath, timeout=None, shared=False):
+        """ Prepare the file lock.
+
+            Specify @fpath as the file or directory to lock, the
+            same way as PidFileLock. If @timeout is `None`, block
+            when acquire. If @shared is `True`, acquire a shared
+            lock by default.
+        """
+        fbase = ".%s.lock" % os.path.basename(fpath)
+        fdir = not os.path.isdir(fpath) and os.path.dirname(fpath) or fpath
+
+        self._lockfp = os.path.join(fdir, fbase)
+        self._lockid = os.getpid()
+        self._timeout = timeout
+        self._shared = shared
+        self._lockfd = None
+        self._mode = None
+
+    def _open(self):
+        """ Open the lock's file, keeping it out of children.
+
+            On a read-only filesystem, the lock's file is moved
+            to LOCKDIR under a name derived from its path.
+        """
+        if self._lockfd is None:
+            try:
+                self._lockfd = os.open(self._lockfp, os.O_RDWR | os.O_CREAT, 0644)
+            except OSError, err:
+                if err.errno != errno.EROFS:
+                    raise
+                os.path.isdir(LOCKDIR) or os.makedirs(LOCKDIR)
+                self._lockfp = os.path.join(LOCKDIR, os.path.realpath(
+                                            self._lockfp).replace('/', '%'))
+                self._lockfd = os.open(self._lockfp, os.O_RDWR | os.O_CREAT, 0644)
+            flags = fcntl.fcntl(self._lockfd, fcntl.F_GETFD)
+            fcntl.fcntl(self._lockfd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+        return self._lockfd
+
+    def _close(self):
+        """ Close the lock's file, dropping any lock held. """
+        if self._lockfd is not None:
+            os.close(self._lockfd)
+
+        self._lockfd = None
+        self._mode = None
+
+    def _flock(self, mode, blocking):
+        """ Call flock(2) with @mode.
+
+            Block until it succeeds, unless the timeout has been
+            set, in which case poll with a short backoff. Raise
+            FileLockError on timeout.
+        """
+        lockfd = self._open()
+
+        if blocking and self._timeout is None:
+            fcntl.flock(lockfd, mode)
+            return
+
+        start_time = time.time()
+        delay = 0.001
+
+        while True:
+            try:
+                fcntl.flock(lockfd, mode | fcntl.LOCK_NB)
+                return
+            except IOError, err:
+                if err.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+                if not blocking or time.time() - start_time >= self._timeout:
+                    raise FileLockError("Failed to acquire '%s'." % self._lockfp)
+
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def owner(self):
+        """ Return the PID of the exclusive owner.
+
+            Return `None` if no PID is recorded, or if the
+            recorded process is dead.
+        """
+        try:
+            lockfs = open(self._lockfp, 'r')
+            lockid = int(lockfs.readline().strip())
+            lockfs.close()
+        except:
+            return None
+
+        try:
+            os.kill(lockid, 0)
+        except OSError, err:
+            if err.errno == errno.ESRCH:
+                return None
+
+        return lockid
+
+    def locked(self):
+        """ Test if @self holds the lock in any mode. """
+        return self._mode is not None
+
+    def shared(self):
+        """ Test if @self holds the lock in shared mode. """
+        return self._mode == fcntl.LOCK_SH
+
+    def acquire(self, shared=None, blocking=True):
+        """ Acquire the lock.
+
+            Acquire in shared mode if @shared is `True`, or in
+            the default mode if it is `None`. A lock held in the
+            other mode is converted, which isn't atomic: if the
+            conversion fails the lock is lost. If @blocking is
+            `False`, raise FileLockError at once instead of
+            waiting.
+        """
+        shared = self._shared if shared is None else shared
+        mode = shared and fcntl.LOCK_SH or fcntl.LOCK_EX
+
+        if self._mode == mode:
+            return
+
+        try:
+            self._flock(mode, blocking)
+        except:
+            self._mode is not None and self._close()
+            raise
+
+        self._mode = mode
+
+        # the PID is overwritten before the file is cut, so that
+        # 'owner' never sees it empty while converting the lock
+        if mode == fcntl.LOCK_EX:
+            lockid = "%d\n" % self._lockid
+            os.lseek(self._lockfd, 0, os.SEEK_SET)
+            os.write(self._lockfd, lockid)
+            os.ftruncate(self._lockfd, len(lockid))
+
+    def release(self):
+        """ Release the lock.
+
+            Clear the recorded PID if held exclusively. The
+            lock's file is kept, since removing it would race
+            with other waiters.
+        """
+        if self._mode == fcntl.LOCK_EX and self._lockid == os.getpid():
+            os.ftruncate(self._lockfd, 0)
+
+        self._close()
+
+    def __enter__(self):
+        """ Activated when enter into the `with` block.
+            The lock is acquired automatically.
+        """
+        self.acquire()
+        return self
+
+    def __exit__(self, t, v, tb):
+        """ Activated when exit from the `with` block.
+            The lock is released automatically.
+        """
+        self.release()
+
+    def __del__(self):
+        """ Release the lock if it's still held. """
+        try:
+            self.release()
+        except:
+            pass
+
+FileLock = FlockFileLock
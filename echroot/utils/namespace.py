@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import errno
+import ctypes
+import signal
+import subprocess
+
+from echroot.fs import mount, mtab
+from echroot.utils.proctrack import forwarder
+
+""" Flags for unshare(2).
+
+    For more detail, man 2 unshare.
+"""
+
+CLONE_NEWNS  = 0x00020000
+CLONE_NEWPID = 0x20000000
+
+PR_SET_PDEATHSIG = 1
+
+""" Signals the waiting parent of a PID namespace passes on.
+"""
+FORWARDS = ( signal.SIGHUP,
+             signal.SIGINT,
+             signal.SIGQUIT,
+             signal.SIGTERM,
+             signal.SIGUSR1,
+             signal.SIGUSR2, )
+
+def unshare(flags):
+    """ Call unshare(2).
+
+        Raise OSError if the syscall fails or is unavailable.
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        func = libc.unshare
+    except (OSError, AttributeError):
+        raise OSError(errno.ENOSYS, "unshare(2) is unavailable")
+
+    if func(flags) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+def private_mounts():
+    """ Move into a new mount namespace.
+
+        Mounts are made private recursively, so that nothing
+        mounted from now on propagates back to the host, and
+        everything is dropped with the last process of the
+        namespace.
+    """
+    unshare(CLONE_NEWNS)
+    mount.mount("none", "/", None, mount.MS_REC | mount.MS_PRIVATE)
+    mtab.table().invalidate()
+
+def private_pids():
+    """ Move children into a new PID namespace.
+
+        unshare(2) only affects children of the caller, so
+        fork here: the child returns as PID 1 of the new
+        namespace, while the parent forwards signals to it,
+        waits for it and exits with its status. Never returns
+        in the parent. The child is killed, and the namespace
+        with it, if the parent dies.
+
+        Called from a preexec_fn, the parent lets go of every
+        fd first: Popen returns once its error pipe is closed,
+        and the pipes of the command only reach EOF once
+        nobody else holds them.
+    """
+    unshare(CLONE_NEWPID)
+
+    pid = os.fork()
+    if pid == 0:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.prctl(PR_SET_PDEATHSIG, signal.SIGKILL, 0, 0, 0)
+        return
+
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.closerange(3, subprocess.MAXFD)
+
+    for signum in FORWARDS:
+        signal.signal(signum, forwarder(pid))
+
+    while True:
+        try:
+            status = os.waitpid(pid, 0)[1]
+            break
+        except OSError, err:
+            if err.errno != errno.EINTR:
+                os._exit(255)
+
+    if os.WIFSIGNALED(status):
+        os._exit(128 + os.WTERMSIG(status))
+    else:
+        os._exit(os.WEXITSTATUS(status))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import errno
+import ctypes
+import signal
+import hashlib
+
+from echroot.fs import mtab
+
+PR_SET_CHILD_SUBREAPER = 36
+
+def set_subreaper():
+    """ Make the current process a child subreaper.
+
+        Orphaned descendants are reparented to us instead of
+        init. Return `True` on success.
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) == 0
+    except (OSError, AttributeError):
+        return False
+
+def cgroup_root():
+    """ Return the mount point of the cgroup2 hierarchy.
+
+        Return `None` if cgroup2 isn't mounted.
+    """
+    for mountpoint in mtab.table().mountpoints():
+        entry = mtab.table().lookup(mountpoint)
+        if entry["fstype"] == "cgroup2":
+            return mountpoint
+    else:
+        return None
+
+def _alive(pid):
+    """ Test if @pid exists and isn't a zombie. """
+    try:
+        with open("/proc/%d/stat" % pid) as statfs:
+            return statfs.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except (IOError, IndexError):
+        return False
+
+def _children(pid):
+    """ Return direct children of @pid.
+
+        Raise IOError if /proc/PID/task/TID/children isn't
+        supported by the kernel.
+    """
+    kids = []
+    for task in os.listdir("/proc/%d/task" % pid):
+        with open("/proc/%d/task/%s/children" % (pid, task)) as kidfs:
+            kids.extend(int(kid) for kid in kidfs.read().split())
+
+    return kids
+
+class ProcessTracker(object):
+    """ Track processes spawned into a rootdir.
+
+        Spawned processes join a private cgroup if cgroup2
+        is available, otherwise we become a child subreaper
+        and walk their descendants through /proc. Either way
+        the tracked processes can be listed and killed without
+        scanning every PID on the host. If neither is
+        supported, 'pids' returns `None` and callers should
+        fall back to scanning /proc. The cgroup is named after
+        rootdir, so that trackers of a rootdir share it, even
+        across processes, e.g. those of a session.
+    """
+
+    def __init__(self, rootdir):
+        """ Prepare a tracker for @rootdir. """
+        self._rootdir = os.path.realpath(rootdir)
+        self._tracked = set()
+        self._cgroup = None
+        self._reaper = False
+
+        root = cgroup_root()
+        if root:
+            digest = hashlib.sha1(self._rootdir).hexdigest()[:16]
+            cgroup = os.path.join(root, "echroot.%s" % digest)
+            try:
+                os.mkdir(cgroup)
+            except OSError:
+                pass
+            if os.path.isdir(cgroup):
+                self._cgroup = cgroup
+
+        if not self._cgroup:
+            self._reaper = set_subreaper()
+
+    def attach(self):
+        """ Join the tracker's cgroup.
+
+            Expected to be called in the spawned child, e.g.
+            as part of a preexec_fn, before it chroots. If it
+            can't join, e.g. for lack of delegation, the child
+            is left untracked here and 'track' falls back.
+        """
+        if self._cgroup:
+            try:
+                with open(os.path.join(self._cgroup, "cgroup.procs"), 'w') as procfs:
+                    procfs.write("0\n")
+            except IOError:
+                pass
+
+    def track(self, pid):
+        """ Record @pid as spawned into rootdir.
+
+            If @pid didn't join the cgroup, we become a child
+            subreaper too, so that its descendants are found
+            besides the cgroup's.
+        """
+        self._tracked.add(pid)
+
+        if self._cgroup and not self._reaper and _alive(pid):
+            try:
+                joined = pid in self._cgroup_pids()
+            except IOError:
+                joined = False
+            if not joined:
+                self._reaper = set_subreaper()
+
+    def tracking(self):
+        """ Test if anything has been spawned via this tracker. """
+        return bool(self._tracked)
+
+    def _cgroup_pids(self):
+        """ List processes in the tracker's cgroup. """
+        with open(os.path.join(self._cgroup, "cgroup.procs")) as procfs:
+            return [int(pid) for pid in procfs.read().split()]
+
+    def _reaper_pids(self):
+        """ List tracked processes and their descendants.
+
+            Orphans reparented to us count if they live in
+            rootdir.
+        """
+        roots = set(self._tracked)
+        for kid in _children(os.getpid()):
+            try:
+                os.readlink("/proc/%d/root" % kid) == self._rootdir and roots.add(kid)
+            except OSError:
+                pass
+
+        pids, queue = set(), list(roots)
+        while queue:
+            pid = queue.pop()
+            if pid in pids:
+                continue
+            pids.add(pid)
+            try:
+                queue.extend(_children(pid))
+            except OSError:
+                pass
+
+        return list(pids)
+
+    def pids(self):
+        """ Return the living tracked processes.
+
+            Return `None` if the set of processes can't be
+            determined without scanning /proc.
+        """
+        try:
+            if not self._cgroup and not self._reaper:
+                return None
+            pids = set()
+            self._cgroup and pids.update(self._cgroup_pids())
+            self._reaper and pids.update(self._reaper_pids())
+        except (IOError, OSError):
+            return None
+
+        return [pid for pid in pids if _alive(pid)]
+
+    def _reap(self, pids):
+        """ Reap those of @pids which are our children. """
+        for pid in pids:
+            try:
+                os.waitpid(pid, os.WNOHANG)
+            except OSError:
+                pass
+
+    def kill(self, timeout=2.0):
+        """ Kill all tracked processes and verify they're gone.
+
+            Processes forked while killing are caught by later
+            rounds. Return `True` if all are gone, `False` on
+            timeout, or `None` if the tracker can't tell.
+        """
+        start_time = time.time()
+
+        while True:
+            pids = self.pids()
+            if pids is None:
+                return None
+            if not pids:
+                return True
+
+            kill_all(pids)
+            self._reap(pids)
+
+            if time.time() - start_time >= timeout:
+                return False
+
+            time.sleep(0.01)
+
+    def _empty(self, timeout=2.0):
+        """ Kill what's left in the tracker's cgroup.
+
+            cgroup.kill is used where the kernel has it, so that
+            forks racing with us are caught too. Return `True`
+            once the cgroup is empty.
+        """
+        killfp = os.path.join(self._cgroup, "cgroup.kill")
+        start_time = time.time()
+
+        while True:
+            try:
+                pids = [pid for pid in self._cgroup_pids() if _alive(pid)]
+            except IOError:
+                return False
+            if not pids:
+                return True
+
+            try:
+                with open(killfp, 'w') as killfs:
+                    killfs.write("1\n")
+            except IOError:
+                kill_all(pids)
+            self._reap(pids)
+
+            if time.time() - start_time >= timeout:
+                return False
+
+            time.sleep(0.01)
+
+    def close(self, empty=False):
+        """ Remove the cgroup, killing what's left in it if @empty.
+
+            Otherwise the cgroup stays while anything lives in
+            it, e.g. what a command left in the background, for
+            whoever unsets rootdir to empty it.
+        """
+        if self._cgroup:
+            empty and self._empty()
+            try:
+                os.rmdir(self._cgroup)
+            except OSError:
+                pass
+
+        self._tracked = set()
+
+
+def forwarder(pid):
+    """ Return a signal handler forwarding signals to @pid. """
+    def handler(signum, frame):
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            pass
+
+    return handler
+
+def kill_all(pids, signum=signal.SIGKILL):
+    """ Send @signum to all @pids, ignoring missing ones. """
+    for pid in pids:
+        try:
+            os.kill(pid, signum)
+        except OSError, err:
+            if err.errno != errno.ESRCH:
+                raise
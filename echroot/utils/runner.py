@@ -3,11 +3,15 @@
 
 import subprocess
 
+from echroot.utils import timing
+
 def call(cmdline):
     """ wrapper for subprocess calls.
 
         Return a tuple (returncode, stdout, stderr).
     """
+    timing.count("spawns")
+
     pipe = subprocess.PIPE
     proc = subprocess.Popen(cmdline, stdout=pipe, stderr=pipe, shell=True)
     sout, serr = proc.communicate()
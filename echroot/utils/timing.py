@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import ctypes
+import contextlib
+
+CLOCK_MONOTONIC = 1
+
+class _timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+def _clock():
+    """ Return clock_gettime(2) of libc, or `None`. """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.clock_gettime
+    except (OSError, AttributeError):
+        return None
+
+_clock_gettime = _clock()
+
+def monotonic():
+    """ Return seconds of a clock which never goes backwards.
+
+        Fall back to the wall clock if CLOCK_MONOTONIC is
+        unavailable.
+    """
+    ts = _timespec()
+    if _clock_gettime and _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) == 0:
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    else:
+        return time.time()
+
+""" Process-wide counters of costly operations.
+
+    'spawns' counts subprocesses run via utils.runner.call,
+    'copied' counts bytes copied via fs.aux.copy_file.
+"""
+_counters = { "spawns" : 0,
+              "copied" : 0, }
+
+def count(name, amount=1):
+    """ Add @amount to counter @name. """
+    _counters[name] = _counters.get(name, 0) + amount
+
+def counters():
+    """ Return a snapshot of all counters. """
+    return dict(_counters)
+
+class Timings(object):
+    """ Time named phases and report them to hooks.
+
+        Each phase yields a record dict with its name, the
+        elapsed seconds, whether it succeeded and how much the
+        counters grew meanwhile, plus any extra fields. Records
+        are passed to every hook as soon as the phase ends.
+        Without hooks, phases cost next to nothing.
+    """
+
+    def __init__(self):
+        self._hooks = []
+
+    def add_hook(self, hook):
+        """ Call @hook(record) at the end of every phase. """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    @contextlib.contextmanager
+    def phase(self, name, **fields):
+        """ Time the body of a with-statement as phase @name. """
+        if not self._hooks:
+            yield
+            return
+
+        before = counters()
+        start = monotonic()
+        ok = False
+
+        try:
+            yield
+            ok = True
+        finally:
+            after = counters()
+            record = dict(fields)
+            record.update({ "phase"   : name,
+                            "elapsed" : monotonic() - start,
+                            "ok"      : ok, })
+            for key in after:
+                record[key] = after[key] - before.get(key, 0)
+
+            for hook in list(self._hooks):
+                hook(record)
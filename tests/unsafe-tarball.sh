@@ -0,0 +1,70 @@
+#!/bin/sh
+
+# run from the top of the tree, as root
+TOPDIR=`dirname $0`/..
+WORKDIR=`mktemp -d`
+export PYTHONPATH=${TOPDIR}
+
+# build a tarball of members given as NAME:TYPE:TARGET
+mktar() {
+    python - "$@" <<EOF
+import sys, tarfile, StringIO
+tar = tarfile.open(sys.argv[1], "w")
+for member in sys.argv[2:]:
+    name, kind, target = member.split(':')
+    info = tarfile.TarInfo(name)
+    info.type = { "sym" : tarfile.SYMTYPE, "lnk" : tarfile.LNKTYPE,
+                  "reg" : tarfile.REGTYPE, }[kind]
+    info.linkname = kind != "reg" and target or ""
+    info.size = kind == "reg" and len(target) or 0
+    tar.addfile(info, StringIO.StringIO(target))
+tar.close()
+EOF
+}
+
+# extract a tarball, telling whether it was accepted
+unpack() {
+    mkdir -p ${WORKDIR}/root
+    python -c "
+import sys
+from echroot.provision import unpack, ProvisionError
+try:
+    unpack(sys.argv[1], sys.argv[2])
+    print 'accepted'
+except ProvisionError:
+    print 'rejected'" $1 ${WORKDIR}/root
+}
+
+fail() {
+    echo "FAIL: $*"
+    rm -rf ${WORKDIR}
+    exit 1
+}
+
+mkdir -p ${WORKDIR}/escape
+echo "intact" > ${WORKDIR}/victim
+
+# a member under an extracted symlink stays in rootdir
+mktar ${WORKDIR}/symdir.tar "x:sym:${WORKDIR}/escape" "x/owned:reg:owned"
+unpack ${WORKDIR}/symdir.tar > /dev/null
+[ -e ${WORKDIR}/escape/owned ] && fail "written through a symlink"
+[ -e ${WORKDIR}/root${WORKDIR}/escape/owned ] || fail "member lost"
+
+# a file replacing a symlink is not written through it
+rm -rf ${WORKDIR}/root
+mktar ${WORKDIR}/symfile.tar "y:sym:${WORKDIR}/victim" "y:reg:owned"
+unpack ${WORKDIR}/symfile.tar > /dev/null
+grep -q intact ${WORKDIR}/victim || fail "written through a symlink"
+
+# hardlinks out of rootdir are refused
+rm -rf ${WORKDIR}/root
+mktar ${WORKDIR}/hardlink.tar "z:lnk:../../../../../../etc/hostname"
+[ "`unpack ${WORKDIR}/hardlink.tar`" = "rejected" ] || fail "hardlink accepted"
+
+# and so are absolute and parent names
+rm -rf ${WORKDIR}/root
+mktar ${WORKDIR}/parent.tar "../owned:reg:owned"
+[ "`unpack ${WORKDIR}/parent.tar`" = "rejected" ] || fail "parent accepted"
+
+rm -rf ${WORKDIR}
+echo "OK"